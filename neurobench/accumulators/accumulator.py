@@ -1,5 +1,3 @@
-import torch
-
 class NeuroBenchAccumulator():
     """ Abstract class for NeuroBench accumulators. Accumulators take the spiking
     output from the models and provide several methods of combining them.
@@ -30,7 +28,8 @@ def choose_max_count(spikes):
     """ Returns the class with the highest spike count over the sample
 
     Args:
-        spikes: A torch tensor of spikes of shape (batch, timestep, classes)
+        spikes: A torch tensor of spikes of shape (batch, timestep, classes),
+            or PackedSpikes, which are counted without unpacking
     """
     # Sum across time and return index with highest count
     return spikes.sum(1).argmax(1) 
@@ -39,9 +38,56 @@ def aggregate(spikes):
     """ Returns the aggregated spikes
 
     Args:
-        spikes: A torch tensor of spikes of shape (batch, timestep, classes)
+        spikes: A torch tensor of spikes of shape (batch, timestep, classes),
+            or PackedSpikes, which are counted without unpacking
     
     Returns:
         spikes: A torch tensor of spikes of shape (batch, classes)
     """
-    return spikes.sum(1)
\ No newline at end of file
+    return spikes.sum(1)
+
+class EarlyExit(NeuroBenchAccumulator):
+    """ Confidence-based early exit for spiking classifiers.
+
+    Passed to a model supporting adaptive inference, e.g. SNNTorchModel, it
+    watches the running output spike counts and stops a sample once the count
+    of the leading class exceeds that of the runner-up by margin spikes. As a
+    postprocessor, it returns the class with the highest spike count, as
+    choose_max_count.
+    """
+
+    def __init__(self, margin, min_steps=1, per_sample=True):
+        """ Initialize the exit criterion.
+
+        Args:
+            margin: Spike count margin between the two leading classes at which a sample stops.
+            min_steps: Number of timesteps that are always run.
+            per_sample: If True, every sample stops on its own and is removed from the
+                batch. If False, the whole batch stops once all samples are confident.
+        """
+        self.margin = margin
+        self.min_steps = min_steps
+        self.per_sample = per_sample
+
+    def done(self, counts, step):
+        """ Returns which samples are confident after a timestep.
+
+        Args:
+            counts: A torch tensor of running spike counts of shape (batch, classes)
+            step: Index of the timestep that was just run.
+
+        Returns:
+            done: A boolean torch tensor of shape (batch,)
+        """
+        if step + 1 < self.min_steps or counts.shape[-1] < 2:
+            return counts.new_zeros(counts.shape[0], dtype=bool)
+        top2 = counts.topk(2, dim=-1).values
+        return top2[:, 0] - top2[:, 1] >= self.margin
+
+    def __call__(self, spikes):
+        """ Returns the class with the highest spike count over the sample
+
+        Args:
+            spikes: A torch tensor of spikes of shape (batch, timestep, classes)
+        """
+        return choose_max_count(spikes)
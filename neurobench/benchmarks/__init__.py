@@ -1 +1,42 @@
-from .benchmark import *
\ No newline at end of file
+from ..utils import _lazy_import, _lazy_getattr
+
+__getattr__ = _lazy_getattr("neurobench.benchmarks", {"CPUPlan": ".cpu_plan"})
+
+def Benchmark(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".benchmark", "Benchmark")(*args, **kwargs)
+
+def Sweep(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".sweep", "Sweep")(*args, **kwargs)
+
+def expand_grid(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".sweep", "expand_grid")(*args, **kwargs)
+
+def SampleLog(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".sample_log", "SampleLog")(*args, **kwargs)
+
+def load_sample_log(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".sample_log", "load_sample_log")(*args, **kwargs)
+
+def rescore(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".sample_log", "rescore")(*args, **kwargs)
+
+def PredictionCache(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".prediction_cache", "PredictionCache")(*args, **kwargs)
+
+def register_metric(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".registry", "register_metric")(*args, **kwargs)
+
+def register_intermediate(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".registry", "register_intermediate")(*args, **kwargs)
+
+def get_metric(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".registry", "get_metric")(*args, **kwargs)
+
+def ForecastBenchmark(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".forecast", "ForecastBenchmark")(*args, **kwargs)
+
+def FSCILRunner(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".fscil", "FSCILRunner")(*args, **kwargs)
+
+def split_sessions(*args, **kwargs):
+    return _lazy_import("neurobench.benchmarks", ".fscil", "split_sessions")(*args, **kwargs)
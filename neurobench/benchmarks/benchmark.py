@@ -1,10 +1,24 @@
+import itertools
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, IterableDataset
 from tqdm import tqdm
 from . import metrics
+from .cpu_plan import CPUPlan
+from .prediction_cache import PredictionCache, PredictionRecorder, fingerprint
+from .registry import call_metric, compute_intermediates, get_metric, required_intermediates
+from .sample_log import SampleLog
+from ..preprocessing.packed_spikes import PackedSpikes
+from ..utils import _torch_threads
 
 class Benchmark():
     """ Top-level benchmark class for running benchmarks.
     """
-    def __init__(self, model, dataloader, preprocessors, postprocessors, metric_list):
+    def __init__(self, model, dataloader, preprocessors, postprocessors, metric_list, device=None, num_threads=None,
+                 cpu_plan=None):
         """
         Args:
             model: A NeuroBenchModel.
@@ -13,33 +27,207 @@ class Benchmark():
             postprocessors: A list of NeuroBenchAccumulators.
             metric_list: A list of lists of strings of metrics to run. 
                 First item is static metrics, second item is data metrics.
+                Names are resolved with registry.get_metric.
+            device: Device to run the benchmark on. The model network is moved there,
+                and every batch is moved there once, before preprocessing. Copies to
+                a GPU are non-blocking, overlap with the previous batch and are
+                asynchronous when the dataloader uses pin_memory=True. "auto" picks
+                cuda if it is available, else cpu. Defaults to None, which leaves
+                model and data where they are.
+            num_threads: Number of torch intra-op CPU threads during the run.
+                Defaults to None, which keeps the current setting.
+            cpu_plan: A CPUPlan setting threads, DataLoader workers and core pinning
+                during the run, see autotune. Takes precedence over num_threads.
         """
         self.model = model
         self.dataloader = dataloader # dataloader not dataset
         self.preprocessors = preprocessors
         self.postprocessors = postprocessors
+        self.num_threads = num_threads
+        self.cpu_plan = cpu_plan
+
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device) if device is not None else None
 
-        self.static_metrics = {m: getattr(metrics, m) for m in metric_list[0]}
-        self.data_metrics = {m: getattr(metrics, m) for m in metric_list[1]}
+        self.static_metrics = {m: get_metric(m) for m in metric_list[0]}
+        self.data_metrics = {m: get_metric(m) for m in metric_list[1]}
 
-    def run(self):
+    def run(self, checkpoint_path=None, checkpoint_every=100, resume=False, sample_log=None, prediction_cache=None,
+            dataset_key=None):
         """ Runs batched evaluation of the benchmark.
 
-        Currently, data metrics are accumulated via mean over the entire
-        test set, and thus must return a float or int.
+        Function data metrics are accumulated via mean over the entire
+        test set, and thus must return a float, an int or a 0-dim tensor.
+        Tensors are accumulated on their device and only converted to floats
+        at the end of the run. AccumulatedMetric data metrics are instantiated
+        for the run, fed every batch, and report their compute() value.
+
+        With a checkpoint_path, the partial results, the metric states and the
+        position in the dataloader are saved every checkpoint_every batches.
+        The batch order of a map-style DataLoader is fixed when the run starts
+        and saved as well, so that a resumed run loads exactly the remaining
+        batches, also with shuffling. Other loaders are assumed to be
+        deterministic, and the evaluated batches are iterated over and skipped.
 
+        With a sample_log directory, the per-sample outputs are written to a
+        SampleLog: "index", the dataset index for map-style DataLoaders and the
+        position in the evaluation order otherwise, "label", "prediction",
+        "latency", the model and postprocessing time of the batch divided by its
+        size, "output_counts", the output summed over timesteps for models with
+        outputs of shape (batch, timesteps, ...), and "timesteps" for models
+        with early exit. Columns are only logged for tensors with one row per
+        sample. Use sample_log.rescore to evaluate further metrics from the log.
+
+        With a prediction_cache directory, the postprocessed predictions and
+        labels of a complete run are stored in a PredictionCache, keyed by the
+        model weights, the dataset and dataloader configuration and the pre-
+        and postprocessors. A later run of the same configuration, e.g. with
+        other metrics, evaluates its data metrics on the cached batches without
+        preprocessing and inference. The model and the inputs are not run then,
+        so data[0] is None, and the data metrics must only depend on the
+        predictions and labels. Runs whose predictions or labels are not tensors
+        with one row per sample are not cached. The dataset is identified by its
+        contents, see prediction_cache.fingerprint, and runs on datasets whose
+        contents cannot be identified are only cached with a dataset_key.
+
+        Args:
+            checkpoint_path: File to save checkpoints to. Defaults to no checkpointing.
+            checkpoint_every: Number of batches between checkpoints.
+            resume: Continue from the checkpoint at checkpoint_path, if it exists.
+            sample_log: Directory of the per-sample log. Defaults to no logging.
+            prediction_cache: Directory of the prediction cache. Defaults to no caching.
+            dataset_key: String identifying the dataset contents in the prediction cache,
+                e.g. a dataset version, instead of hashing them.
         Returns:
             results: A dictionary of results.
         """
         print("Running benchmark")
 
-        # Static metrics
-        results = {}
-        for m in self.static_metrics.keys():
-            results[m] = self.static_metrics[m](self.model)
+        if self.device is not None:
+            try:
+                self.model.__net__().to(self.device)
+            except (AttributeError, NotImplementedError):
+                pass
+
+        with self._cpu_context():
+            return self._run(checkpoint_path, checkpoint_every, resume, sample_log, prediction_cache, dataset_key)
+
+    def autotune(self, plans=None, num_batches=5):
+        """ Measures the throughput of CPU plans and keeps the fastest for run.
+
+        Every plan runs preprocessing and the model on num_batches batches,
+        after a warm-up batch.
+
+        Args:
+            plans: List of CPUPlans to try. Defaults to CPUPlan.candidates().
+            num_batches: Number of timed batches per plan.
+        Returns:
+            list: (plan, samples per second) of every plan.
+        """
+        if plans is None:
+            plans = CPUPlan.candidates()
+
+        results = []
+        for plan in plans:
+            with plan.apply(self.dataloader):
+                results.append((plan, self._throughput(num_batches)))
+
+        self.cpu_plan = max(results, key=lambda result: result[1])[0]
+        return results
+
+    def _throughput(self, num_batches):
+        """ Samples per second of preprocessing and inference.
+        """
+        samples = 0
+        start = None
+        batches = self._device_batches()
+        for idx, data in enumerate(batches):
+            if idx == 1:
+                start = time.perf_counter()
+            if idx > num_batches:
+                break
+            if type(data) is not tuple:
+                data = tuple(data)
+            for alg in self.preprocessors:
+                data = alg(data)
+            preds = self.model(data[0])
+            for alg in self.postprocessors:
+                preds = alg(preds)
+            if idx > 0:
+                samples += data[0].size(0)
+        batches.close()
+
+        if start is None or samples == 0:
+            return 0.0
+        return samples / (time.perf_counter() - start)
+
+    def _cpu_context(self):
+        if self.cpu_plan is not None:
+            return self.cpu_plan.apply(self.dataloader)
+        return _torch_threads(self.num_threads)
+
+    def _run(self, checkpoint_path, checkpoint_every, resume, sample_log, prediction_cache, dataset_key):
+        """ Evaluation loop of run.
+        """
+        cache = key = recorder = None
+        if prediction_cache is not None:
+            cache = PredictionCache(prediction_cache)
+            key = fingerprint(self.model, self.dataloader, self.preprocessors, self.postprocessors, dataset_key)
+
+        state = None
+        if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+            state = self._load_checkpoint(checkpoint_path)
+
+        if state is None:
+            # Static metrics
+            results = {}
+            for m in self.static_metrics.keys():
+                results[m] = self.static_metrics[m](self.model)
+
+            # stateful metrics get a fresh instance per run
+            data_metrics = {}
+            for m, metric in self.data_metrics.items():
+                if isinstance(metric, type) and issubclass(metric, metrics.AccumulatedMetric):
+                    metric = metric()
+                data_metrics[m] = metric
+
+            state = {
+                "metric_names": [list(self.static_metrics), list(self.data_metrics)],
+                "results": results,
+                "data_metrics": {m: v for m, v in data_metrics.items() if isinstance(v, metrics.AccumulatedMetric)},
+                "batch_order": self._batch_order() if checkpoint_path is not None or sample_log is not None else None,
+                "num_batches": 0,
+                "num_samples": 0,
+                "sample_log_chunks": 0,
+            }
+        data_metrics = {**self.data_metrics, **state["data_metrics"]}
+
+        if key is not None and state["num_batches"] == 0:
+            cached = cache.load(key)
+            if cached is not None:
+                return self._evaluate_cached(state, data_metrics, cached)
+            recorder = PredictionRecorder()
+
+        log = SampleLog(sample_log, keep_chunks=state["sample_log_chunks"]) if sample_log is not None else None
+        try:
+            results = self._evaluate(state, data_metrics, checkpoint_path, checkpoint_every, log, recorder)
+        finally:
+            if log is not None:
+                log.close()
+
+        if recorder is not None and recorder.valid:
+            cache.save(key, recorder)
+        return results
+
+    def _evaluate(self, state, data_metrics, checkpoint_path, checkpoint_every, log, recorder=None):
+        """ Evaluates the remaining batches of a run.
+        """
+        results = state["results"]
 
         dataset_len = len(self.dataloader.dataset)
-        for data in tqdm(self.dataloader, total=len(self.dataloader)):
+        batches = self._device_batches(self._remaining_batches(state))
+        for data in tqdm(batches, total=len(self.dataloader), initial=state["num_batches"]):
             batch_size = data[0].size(0)
 
             # convert data to tuple
@@ -51,23 +239,242 @@ class Benchmark():
                 data = alg(data)
 
             # Run model on test data
-            preds = self.model(data[0])
+            start = time.perf_counter()
+            outputs = self.model(data[0])
 
             # TODO: postprocessors are applied to model output only?
+            preds = outputs
             for alg in self.postprocessors: 
                 preds = alg(preds)
 
-            # Data metrics
-            batch_results = {}
-            for m in self.data_metrics.keys():
-                batch_results[m] = self.data_metrics[m](self.model, preds, data)
+            # padding rows of streaming datasets are run through the model but not scored
+            preds, data, outputs, batch_size = _drop_padding(preds, data, outputs, batch_size)
+
+            if log is not None:
+                if self.device is not None and self.device.type == "cuda":
+                    torch.cuda.synchronize(self.device)
+                latency = (time.perf_counter() - start) / batch_size
+                log.append(self._sample_columns(state, batch_size, data, outputs, preds, latency))
+            if recorder is not None:
+                recorder.append(preds, data[1] if len(data) > 1 else None, batch_size)
+
+            self._accumulate(results, data_metrics, self.model, preds, data, batch_size, dataset_len)
+
+            state["num_batches"] += 1
+            state["num_samples"] += batch_size
+            if checkpoint_path is not None and state["num_batches"] % checkpoint_every == 0:
+                self._save_checkpoint(checkpoint_path, state, log)
+
+        if checkpoint_path is not None:
+            self._save_checkpoint(checkpoint_path, state, log)
 
-            # Accumulate data metrics via mean
-            for m, v in batch_results.items():
-                assert isinstance(v, float) or isinstance(v, int), "Data metric must return float or int to be accumulated"
-                if m not in results:
-                    results[m] = v * batch_size / dataset_len
-                else:
-                    results[m] += v * batch_size / dataset_len
+        return self._finalize(results, data_metrics)
+
+    def _evaluate_cached(self, state, data_metrics, cached):
+        """ Evaluates the data metrics on the batches of a prediction cache entry.
+        """
+        results = state["results"]
+        dataset_len = len(self.dataloader.dataset)
+
+        start = 0
+        for batch_size in cached["batch_sizes"].tolist():
+            preds, labels = (torch.from_numpy(np.array(cached[name][start:start + batch_size])) for name in ("preds", "labels"))
+            if self.device is not None:
+                preds, labels = preds.to(self.device), labels.to(self.device)
+            self._accumulate(results, data_metrics, None, preds, (None, labels), batch_size, dataset_len)
+            start += batch_size
+
+        return self._finalize(results, data_metrics)
+
+    def _accumulate(self, results, data_metrics, model, preds, data, batch_size, dataset_len):
+        """ Evaluates the data metrics on a batch and accumulates them.
+
+        The intermediates required by the metrics are computed once and shared.
+        """
+        intermediates = compute_intermediates(required_intermediates(data_metrics.values()), model, preds, data)
+        batch_results = {}
+        for m, metric in data_metrics.items():
+            if isinstance(metric, metrics.AccumulatedMetric):
+                call_metric(metric, model, preds, data, intermediates)
+            else:
+                batch_results[m] = call_metric(metric, model, preds, data, intermediates)
+
+        # Accumulate data metrics via mean
+        for m, v in batch_results.items():
+            assert isinstance(v, (float, int)) or (isinstance(v, torch.Tensor) and v.dim() == 0), \
+                "Data metric must return float, int or 0-dim tensor to be accumulated"
+            if isinstance(v, torch.Tensor):
+                v = v.detach()
+            if m not in results:
+                results[m] = v * batch_size / dataset_len
+            else:
+                results[m] += v * batch_size / dataset_len
+
+    def _finalize(self, results, data_metrics):
+        """ Final results of a run, computing the accumulated metrics.
+        """
+        # single synchronization with the device
+        results = dict(results)
+        for m, metric in data_metrics.items():
+            if isinstance(metric, metrics.AccumulatedMetric):
+                results[m] = metric.compute()
+            elif isinstance(results.get(m), torch.Tensor):
+                results[m] = results[m].item()
 
         return results
+
+    def _batch_order(self):
+        """ Indices of every batch of a map-style DataLoader, in the order of this run.
+
+        Returns:
+            list: Index lists of the batches, or None for other loaders.
+        """
+        loader = self.dataloader
+        if not isinstance(loader, DataLoader) or isinstance(loader.dataset, IterableDataset):
+            return None
+        sampler = loader.batch_sampler if loader.batch_sampler is not None else loader.sampler
+        return [batch if isinstance(batch, int) else list(batch) for batch in sampler]
+
+    def _remaining_batches(self, state):
+        """ Loader over the batches that were not evaluated yet.
+        """
+        loader = self.dataloader
+        if state["batch_order"] is None:
+            return itertools.islice(loader, state["num_batches"], None)
+
+        remaining = state["batch_order"][state["num_batches"]:]
+        kwargs = dict(num_workers=loader.num_workers, collate_fn=loader.collate_fn, pin_memory=loader.pin_memory,
+                      worker_init_fn=loader.worker_init_fn, timeout=loader.timeout,
+                      multiprocessing_context=loader.multiprocessing_context,
+                      persistent_workers=loader.persistent_workers)
+        if loader.num_workers > 0:
+            kwargs["prefetch_factor"] = loader.prefetch_factor
+        if loader.batch_sampler is not None:
+            return DataLoader(loader.dataset, batch_sampler=remaining, **kwargs)
+        return DataLoader(loader.dataset, sampler=remaining, batch_size=None, **kwargs)
+
+    def _sample_columns(self, state, batch_size, data, outputs, preds, latency):
+        """ Per-sample log columns of a batch.
+        """
+        if state["batch_order"] is not None:
+            index = torch.tensor(state["batch_order"][state["num_batches"]]).reshape(-1)
+        else:
+            index = torch.arange(state["num_samples"], state["num_samples"] + batch_size)
+        columns = {"index": index, "latency": torch.full((batch_size,), latency)}
+
+        def per_sample(value):
+            return isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == batch_size
+
+        if len(data) > 1 and per_sample(data[1]):
+            columns["label"] = data[1]
+        if per_sample(preds):
+            columns["prediction"] = preds
+        if per_sample(outputs) and outputs.dim() >= 3:
+            columns["output_counts"] = outputs.detach().sum(1).flatten(1)
+        if per_sample(getattr(self.model, "timesteps", None)):
+            columns["timesteps"] = self.model.timesteps
+        return columns
+
+    def _save_checkpoint(self, path, state, log=None):
+        """ Writes the run state, replacing the previous checkpoint atomically.
+
+        The sample log is flushed first, so that the checkpoint covers its chunks.
+        """
+        if log is not None:
+            state["sample_log_chunks"] = log.flush()
+        tmp_path = path + ".tmp"
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _load_checkpoint(self, path):
+        """ Loads the run state of a checkpoint of the same benchmark configuration.
+        """
+        state = torch.load(path, map_location=self.device, weights_only=False)
+        if state["metric_names"] != [list(self.static_metrics), list(self.data_metrics)]:
+            raise ValueError(f"Checkpoint {path} was written for metrics {state['metric_names']}")
+        if state["batch_order"] is not None and len(state["batch_order"]) != len(self.dataloader):
+            raise ValueError(f"Checkpoint {path} was written for a dataloader of {len(state['batch_order'])} batches")
+        return state
+
+    def _device_batches(self, loader=None):
+        """ Iterates over a loader, by default the dataloader, moving every batch to the device.
+
+        On a GPU, the copy of the next batch is issued on a separate stream
+        before the current batch is returned, so that it overlaps with compute.
+        """
+        if loader is None:
+            loader = self.dataloader
+        if self.device is None or self.device.type != "cuda":
+            for data in loader:
+                yield data if self.device is None else _to_device(data, self.device)
+            return
+
+        stream = torch.cuda.Stream(self.device)
+        def load(data):
+            with torch.cuda.stream(stream):
+                return _to_device(data, self.device)
+
+        batches = iter(loader)
+        pending = next(batches, _END)
+        pending = load(pending) if pending is not _END else _END
+        while pending is not _END:
+            torch.cuda.current_stream(self.device).wait_stream(stream)
+            data = pending
+            _record_stream(data, torch.cuda.current_stream(self.device))
+            pending = next(batches, _END)
+            pending = load(pending) if pending is not _END else _END
+            yield data
+
+
+_END = object()
+
+def _drop_padding(preds, data, outputs, batch_size):
+    """ Removes the padding rows of a batch, marked False in the "valid" mask of its info dict.
+
+    Returns:
+        tuple: preds, data, outputs and batch size of the valid rows.
+    """
+    info = data[2] if len(data) > 2 and isinstance(data[2], dict) else {}
+    valid = info.get("valid")
+    if valid is None or bool(valid.all()):
+        return preds, data, outputs, batch_size
+
+    keep = valid.tolist()
+    def select(value):
+        if isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == len(keep):
+            return value[valid.to(value.device)]
+        if isinstance(value, (list, tuple)) and len(value) == len(keep):
+            return type(value)(v for v, k in zip(value, keep) if k)
+        if isinstance(value, dict):
+            return {key: select(v) for key, v in value.items()}
+        return value
+
+    data = (select(data[0]), select(data[1])) + tuple(select(d) for d in data[2:])
+    return select(preds), data, select(outputs), sum(keep)
+
+def _to_device(data, device):
+    """ Moves the tensors of a batch to device, non-blocking from pinned memory.
+    """
+    if isinstance(data, torch.Tensor):
+        return data.to(device, non_blocking=data.is_pinned())
+    if isinstance(data, PackedSpikes):
+        return data.to(device)
+    if isinstance(data, (list, tuple)):
+        return type(data)(_to_device(item, device) for item in data)
+    if isinstance(data, dict):
+        return {key: _to_device(value, device) for key, value in data.items()}
+    return data
+
+def _record_stream(data, stream):
+    """ Marks the tensors of a batch as used by stream, so their memory is not reused early.
+    """
+    if isinstance(data, torch.Tensor):
+        data.record_stream(stream)
+    elif isinstance(data, PackedSpikes):
+        data.planes.record_stream(stream)
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            _record_stream(item, stream)
+    elif isinstance(data, dict):
+        for value in data.values():
+            _record_stream(value, stream)
@@ -0,0 +1,187 @@
+import glob
+import os
+import re
+import warnings
+from contextlib import contextmanager
+from functools import partial
+
+import torch
+
+
+class CPUPlan():
+    """ CPU execution configuration of a benchmark run.
+
+    Sets the number of DataLoader workers, the torch intra- and inter-op
+    threads of the model, and pins the model threads and the workers to
+    disjoint sets of cores, so that preprocessing and inference do not compete
+    for the same cores. Use split to derive a plan from the NUMA topology of
+    the machine, and Benchmark.autotune to pick the fastest of several plans.
+    """
+    def __init__(self, num_workers=0, intra_op_threads=None, inter_op_threads=None,
+                 model_cpus=None, worker_cpus=None):
+        """
+        Args:
+            num_workers: Number of DataLoader worker processes.
+            intra_op_threads: Number of torch intra-op threads, defaults to the
+                number of model_cpus if given, else left unchanged.
+            inter_op_threads: Number of torch inter-op threads. Torch only allows
+                setting it once per process, later changes are skipped with a warning.
+            model_cpus: Cores of the main process, running the model. Defaults to no pinning.
+            worker_cpus: Cores of the DataLoader workers, each worker is pinned to
+                one of them in turn. Defaults to no pinning.
+        """
+        self.num_workers = num_workers
+        self.intra_op_threads = intra_op_threads or (len(model_cpus) if model_cpus else None)
+        self.inter_op_threads = inter_op_threads
+        self.model_cpus = sorted(model_cpus) if model_cpus else None
+        self.worker_cpus = sorted(worker_cpus) if worker_cpus else None
+
+    @classmethod
+    def split(cls, num_workers, cpus=None, inter_op_threads=None):
+        """ Plan giving num_workers cores to the DataLoader workers and the remaining cores to the model.
+
+        Worker cores are taken from the end of the last NUMA node, so that the
+        model keeps whole nodes where possible.
+
+        Args:
+            num_workers: Number of DataLoader worker processes, one core each.
+            cpus: Cores to use. Defaults to all cores available to the process.
+            inter_op_threads: Number of torch inter-op threads.
+        Returns:
+            CPUPlan: The plan.
+        """
+        cpus = [cpu for node in numa_nodes() for cpu in node if cpus is None or cpu in cpus]
+        if num_workers >= len(cpus):
+            raise ValueError(f"Cannot give {num_workers} workers their own cores and keep cores for the model, "
+                             f"only {len(cpus)} cores are available")
+        model_cpus = cpus[:len(cpus) - num_workers]
+        worker_cpus = cpus[len(cpus) - num_workers:]
+        return cls(num_workers, inter_op_threads=inter_op_threads, model_cpus=model_cpus, worker_cpus=worker_cpus)
+
+    @classmethod
+    def candidates(cls, cpus=None):
+        """ Plans with 0, 1, 2, 4, ... workers, up to half of the cores.
+
+        Args:
+            cpus: Cores to use. Defaults to all cores available to the process.
+        Returns:
+            list: CPUPlans.
+        """
+        num_cpus = len(cpus) if cpus is not None else sum(len(node) for node in numa_nodes())
+        plans = [cls.split(0, cpus)]
+        num_workers = 1
+        while num_workers <= num_cpus // 2:
+            plans.append(cls.split(num_workers, cpus))
+            num_workers *= 2
+        return plans
+
+    @contextmanager
+    def apply(self, dataloader=None):
+        """ Applies the plan to this process and a DataLoader, and restores the previous settings on exit.
+
+        Args:
+            dataloader: A PyTorch DataLoader, whose num_workers and worker_init_fn are set.
+        """
+        threads = torch.get_num_threads()
+        affinity = _get_affinity()
+        loader_settings = None
+
+        try:
+            if self.intra_op_threads:
+                torch.set_num_threads(self.intra_op_threads)
+            if self.inter_op_threads and self.inter_op_threads != torch.get_num_interop_threads():
+                try:
+                    torch.set_num_interop_threads(self.inter_op_threads)
+                except RuntimeError as e:
+                    warnings.warn(f"Inter-op threads left at {torch.get_num_interop_threads()}: {e}")
+            if self.model_cpus is not None and affinity is not None:
+                _set_affinity(self.model_cpus)
+
+            if isinstance(dataloader, torch.utils.data.DataLoader):
+                loader_settings = (dataloader.num_workers, dataloader.worker_init_fn, dataloader.prefetch_factor)
+                dataloader.num_workers = self.num_workers
+                dataloader.worker_init_fn = partial(_init_worker, self.worker_cpus, dataloader.worker_init_fn)
+                # loaders created without workers have no prefetch factor
+                if self.num_workers > 0 and dataloader.prefetch_factor is None:
+                    dataloader.prefetch_factor = 2
+            yield self
+        finally:
+            torch.set_num_threads(threads)
+            if self.model_cpus is not None and affinity is not None:
+                _set_affinity(affinity)
+            if loader_settings is not None:
+                dataloader.num_workers, dataloader.worker_init_fn, dataloader.prefetch_factor = loader_settings
+
+    def __repr__(self):
+        return (f"CPUPlan(num_workers={self.num_workers}, intra_op_threads={self.intra_op_threads}, "
+                f"inter_op_threads={self.inter_op_threads}, model_cpus={_format_cpulist(self.model_cpus)}, "
+                f"worker_cpus={_format_cpulist(self.worker_cpus)})")
+
+
+def numa_nodes():
+    """ Cores available to this process, grouped by NUMA node.
+
+    Returns:
+        list: For every NUMA node with available cores, the sorted list of its cores.
+    """
+    available = _get_affinity() or set(range(os.cpu_count()))
+    nodes = []
+    paths = glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")
+    for path in sorted(paths, key=lambda path: int(re.search(r"node(\d+)", path).group(1))):
+        with open(path) as f:
+            cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in available]
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(available)]
+
+def parse_cpulist(cpulist):
+    """ Parses a Linux cpulist such as "0-3,8,10-11".
+
+    Args:
+        cpulist: The cpulist string.
+    Returns:
+        list: The cores.
+    """
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def _format_cpulist(cpus):
+    if cpus is None:
+        return None
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{first}-{last}" if last > first else f"{first}" for first, last in ranges)
+
+def _get_affinity():
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return os.sched_getaffinity(0)
+
+def _set_affinity(cpus):
+    """ Sets the affinity of all threads of this process, including running torch threads.
+    """
+    tasks = [int(task) for task in os.listdir("/proc/self/task")] if os.path.isdir("/proc/self/task") else [0]
+    for task in tasks:
+        try:
+            os.sched_setaffinity(task, cpus)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+def _init_worker(worker_cpus, worker_init_fn, worker_id):
+    """ Pins a DataLoader worker to its core and keeps it single-threaded.
+    """
+    torch.set_num_threads(1)
+    # pinning is skipped on platforms without affinity support, as for the model threads
+    if worker_cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {worker_cpus[worker_id % len(worker_cpus)]})
+    if worker_init_fn is not None:
+        worker_init_fn(worker_id)
@@ -0,0 +1,124 @@
+import torch
+
+from .registry import get_metric
+
+
+class ForecastBenchmark():
+    """ Closed-loop autoregressive forecasting benchmark for time-series such as Mackey-Glass.
+
+    Evaluating a forecaster through a DataLoader ties the forecast to the
+    batches: state and prior predictions are lost at every batch boundary.
+    Instead, the model here runs parallel rollouts, one per start offset. Each
+    rollout is teacher-forced on the warmup points before its start, is given
+    the observed value at its start and then forecasts horizon points, feeding
+    back its own predictions. All rollouts advance together, one batched model
+    step per timestep, and the errors are computed on the whole
+    (rollouts, horizon, features) prediction tensor at once.
+
+    The network of the model, model.__net__(), must implement the stepping protocol:
+        reset_state(batch_size): clears the state for batch_size parallel rollouts.
+        step(x): takes a (batch_size, features) tensor of the current values and
+            returns the (batch_size, features) predictions of the next values.
+    """
+    def __init__(self, model, series, horizon=None, starts=None, warmup=0, static_metrics=None,
+                 total_var=None, lyap_exp=None, dt=None, threshold=0.4):
+        """
+        Args:
+            model: A NeuroBenchModel whose network implements reset_state and step.
+            series: Tensor of shape (timesteps, features), or a MackeyGlass dataset, whose
+                series, total_var, lyap_exp and dt are used unless given.
+            horizon: Number of forecast points per rollout. Defaults to the longest horizon
+                the series allows from the last start.
+            starts: Indices of the observed value each rollout starts from. Defaults to the
+                first test index of a MackeyGlass dataset, else to warmup.
+            warmup: Number of teacher-forced points before every start.
+            static_metrics: A list of strings of static metrics to run, as for Benchmark.
+            total_var: Variance normalizing the NRMSE. Defaults to the variance of the series.
+            lyap_exp: Largest Lyapunov exponent of the system, per time unit.
+            dt: Time step of the series. Defaults to 1.
+            threshold: NRMSE up to which a forecast counts as valid, see run.
+        """
+        if not torch.is_tensor(series):
+            total_var = series.total_var if total_var is None else total_var
+            lyap_exp = series.lyap_exp if lyap_exp is None else lyap_exp
+            dt = series.dt if dt is None else dt
+            if starts is None and hasattr(series, "ind_test"):
+                starts = [int(series.ind_test[0])]
+            series = series.mackeyglass_soln
+        if series.dim() == 1:
+            series = series.unsqueeze(-1)
+
+        self.model = model
+        self.series = series
+        self.starts = torch.as_tensor([warmup] if starts is None else starts, dtype=torch.int64).reshape(-1)
+        self.horizon = horizon if horizon is not None else len(series) - 1 - int(self.starts.max())
+        self.warmup = warmup
+        self.static_metrics = {m: get_metric(m) for m in static_metrics or []}
+        self.total_var = torch.var(series, unbiased=True) if total_var is None else total_var
+        self.lyap_exp = lyap_exp
+        self.dt = 1.0 if dt is None else dt
+        self.threshold = threshold
+        self.predictions = None
+
+        if self.horizon < 1:
+            raise ValueError("The forecast horizon must be at least one point")
+        if int(self.starts.min()) < warmup:
+            raise ValueError(f"Every start must leave {warmup} warmup points before it")
+        if int(self.starts.max()) + self.horizon >= len(series):
+            raise ValueError("The forecast of a rollout extends past the end of the series")
+
+    def run(self):
+        """ Runs all rollouts and scores the forecasts.
+
+        Returns:
+            results: A dict of the static metrics and
+                "NRMSE": root mean squared error over all rollouts and the whole horizon,
+                    normalized by the total variance.
+                "NRMSE_horizon": list of the NRMSE at each forecast step, over all rollouts.
+                "valid_time": time until the NRMSE at a forecast step first exceeds threshold.
+                With lyap_exp, also "lyapunov_time", the inverse Lyapunov exponent, and
+                "valid_lyapunov_times" and "horizon_lyapunov_times", the valid time and
+                the horizon in Lyapunov times.
+        """
+        results = {m: metric(self.model) for m, metric in self.static_metrics.items()}
+
+        self.predictions = self.rollout()
+        # targets of step k are the values k + 1 points after each start
+        offsets = torch.arange(1, self.horizon + 1)
+        targets = self.series[self.starts.unsqueeze(1) + offsets]
+        errors = (self.predictions - targets).square()
+
+        nrmse_horizon = torch.sqrt(errors.mean((0, 2)) / self.total_var)
+        results["NRMSE"] = torch.sqrt(errors.mean() / self.total_var).item()
+        results["NRMSE_horizon"] = nrmse_horizon.tolist()
+
+        invalid = torch.nonzero(nrmse_horizon > self.threshold)
+        valid_steps = int(invalid[0]) if len(invalid) > 0 else self.horizon
+        results["valid_time"] = valid_steps * self.dt
+
+        if self.lyap_exp is not None and self.lyap_exp > 0:
+            results["lyapunov_time"] = 1 / self.lyap_exp
+            results["valid_lyapunov_times"] = results["valid_time"] * self.lyap_exp
+            results["horizon_lyapunov_times"] = self.horizon * self.dt * self.lyap_exp
+        return results
+
+    def rollout(self):
+        """ Runs the teacher-forced warmup and the closed-loop forecast of every rollout.
+
+        Returns:
+            predictions: Tensor of shape (rollouts, horizon, features).
+        """
+        net = self.model.__net__()
+        num_rollouts = len(self.starts)
+        predictions = self.series.new_empty((num_rollouts, self.horizon) + self.series.shape[1:])
+
+        with torch.no_grad():
+            net.reset_state(num_rollouts)
+            for offset in range(-self.warmup, 0):
+                net.step(self.series[self.starts + offset])
+
+            x = self.series[self.starts]
+            for step in range(self.horizon):
+                x = net.step(x).reshape(predictions[:, step].shape).to(predictions.dtype)
+                predictions[:, step] = x
+        return predictions
@@ -0,0 +1,201 @@
+import csv
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from .benchmark import Benchmark
+from .sweep import Sweep, _CachedLoader
+
+
+class FSCILRunner():
+    """ Few-shot class-incremental learning (FSCIL) evaluation over sessions of classes.
+
+    The classes of a keyword dataset are split into sessions: a base session,
+    trained on all of its training samples, followed by incremental sessions
+    trained on a few samples (shots) per new class. Before each session is
+    evaluated, the user's train function updates the model with the training
+    samples of the session.
+
+    The test samples of every session are preprocessed once and the features
+    cached, so later sessions only preprocess the samples of their new
+    classes. By default every session evaluates the model on the cached
+    features of all classes seen so far, as the FSCIL protocol requires,
+    since learning new classes may change the predictions of old ones. With
+    incremental=True, a session only evaluates its new classes, and the
+    per-class results of earlier sessions are reused, so that the cost of N
+    sessions grows linearly with the new data. This is only exact for models
+    whose predictions of earlier test samples cannot change once new classes
+    are learned. It is an approximation otherwise, e.g. for nearest-prototype
+    classifiers, where a new prototype may capture old-class samples, so that
+    the accuracy of old classes is overstated.
+
+    The per-session confusion matrices are merged into a cumulative table with
+    the accuracy over all seen classes, over the base classes and over the new
+    classes of each session.
+    """
+    def __init__(self, train_set, test_set, sessions, model, train, metric_list=None, preprocessors=None,
+                 postprocessors=None, shots=5, batch_size=256, incremental=False, seed=0):
+        """
+        Args:
+            train_set: Training dataset of (data, label) samples.
+            test_set: Test dataset of (data, label) samples.
+            sessions: List of lists of class labels, the first being the base session, see split_sessions.
+            model: A NeuroBenchModel, predicting class indices after postprocessing.
+            train: Function train(model, batches, session), updating the model with the
+                preprocessed training batches of a session.
+            metric_list: A list of lists of strings of additional metrics to run, as for
+                Benchmark. Data metrics only cover the classes evaluated in a session.
+            preprocessors: A list of NeuroBenchProcessors, applied to training and test data.
+            postprocessors: A list of NeuroBenchAccumulators.
+            shots: Number of training samples per class of the incremental sessions.
+            batch_size: Batch size of the training and test loaders.
+            incremental: Only evaluate the new classes of each session, reusing the results
+                of earlier sessions. Approximate unless old-class predictions cannot change.
+            seed: Seed of the selection of the few-shot training samples.
+        """
+        self.train_set = train_set
+        self.test_set = test_set
+        self.sessions = [list(classes) for classes in sessions]
+        self.model = model
+        self.train = train
+        self.metric_list = metric_list or [[], []]
+        self.preprocessors = preprocessors or []
+        self.postprocessors = postprocessors or []
+        self.shots = shots
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.seed = seed
+        self.results = []
+
+        seen = [label for classes in self.sessions for label in classes]
+        if len(seen) != len(set(seen)):
+            raise ValueError("A class can only be learned in one session")
+
+        self._train_labels = _labels(train_set)
+        self._test_labels = _labels(test_set)
+        self._features = {}
+
+    def run(self):
+        """ Trains and evaluates every session in turn.
+
+        Returns:
+            results: A list with one dict per session, holding "session", "num_classes",
+                "accuracy" over the classes seen so far, "base_accuracy", "session_accuracy"
+                over the new classes of the session, followed by the results of metric_list.
+        """
+        self.results = []
+        matrices = {}
+        for session, classes in enumerate(self.sessions):
+            indices = self._train_indices(session)
+            loader = DataLoader(Subset(self.train_set, indices), batch_size=self.batch_size)
+            self.train(self.model, Sweep._preprocess(loader, self.preprocessors), session)
+
+            if self.incremental:
+                results = self._evaluate([session])
+                matrices[session] = torch.tensor(results.pop("confusion_matrix"), dtype=torch.int64)
+                merged = _merge(matrices.values())
+            else:
+                results = self._evaluate(list(range(session + 1)))
+                merged = torch.tensor(results.pop("confusion_matrix"), dtype=torch.int64)
+
+            self.results.append({
+                "session": session,
+                "num_classes": sum(len(c) for c in self.sessions[:session + 1]),
+                "accuracy": _accuracy(merged, [c for s in range(session + 1) for c in self.sessions[s]]),
+                "base_accuracy": _accuracy(merged, self.sessions[0]),
+                "session_accuracy": _accuracy(merged, classes),
+                **results,
+            })
+        return self.results
+
+    def to_csv(self, path):
+        """ Writes the cumulative table of the last run.
+
+        Args:
+            path: Output csv file path.
+        """
+        fields = list(dict.fromkeys(key for row in self.results for key in row))
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.results)
+
+    def _train_indices(self, session):
+        """ Training samples of a session, all for the base session and shots per class otherwise.
+        """
+        generator = np.random.default_rng(self.seed + session)
+        indices = []
+        for label in self.sessions[session]:
+            candidates = np.flatnonzero(self._train_labels == label)
+            if session > 0:
+                candidates = generator.choice(candidates, min(self.shots, len(candidates)), replace=False)
+            indices.extend(sorted(candidates.tolist()))
+        return indices
+
+    def _test_features(self, session):
+        """ Preprocessed test batches of the classes of a session, computed once.
+        """
+        if session not in self._features:
+            indices = np.flatnonzero(np.isin(self._test_labels, self.sessions[session])).tolist()
+            loader = DataLoader(Subset(self.test_set, indices), batch_size=self.batch_size)
+            self._features[session] = (Sweep._preprocess(loader, self.preprocessors), len(indices))
+        return self._features[session]
+
+    def _evaluate(self, sessions):
+        """ Runs the benchmark on the cached test features of sessions.
+        """
+        batches, num_samples = [], 0
+        for session in sessions:
+            session_batches, session_samples = self._test_features(session)
+            batches.extend(session_batches)
+            num_samples += session_samples
+
+        static_metrics, data_metrics = self.metric_list
+        benchmark = Benchmark(
+            self.model,
+            _CachedLoader(batches, range(num_samples)),
+            [],
+            self.postprocessors,
+            [static_metrics, [m for m in data_metrics if m != "confusion_matrix"] + ["confusion_matrix"]],
+        )
+        return benchmark.run()
+
+
+def split_sessions(classes, num_base, num_ways):
+    """ Splits classes into a base session and incremental sessions of num_ways classes.
+
+    Args:
+        classes: List of class labels, in session order.
+        num_base: Number of classes of the base session.
+        num_ways: Number of new classes per incremental session.
+    Returns:
+        list: List of lists of class labels.
+    """
+    classes = list(classes)
+    return [classes[:num_base]] + [classes[start:start + num_ways] for start in range(num_base, len(classes), num_ways)]
+
+def _labels(dataset):
+    """ Label of every sample of a dataset, from its targets if it has them.
+    """
+    targets = getattr(dataset, "targets", None)
+    if targets is None:
+        targets = [dataset[idx][1] for idx in range(len(dataset))]
+    return np.asarray([int(label) for label in targets], dtype=np.int64)
+
+def _merge(matrices):
+    """ Sums confusion matrices of different sizes.
+    """
+    matrices = list(matrices)
+    size = max(m.shape[0] for m in matrices)
+    merged = torch.zeros((size, size), dtype=torch.int64)
+    for m in matrices:
+        merged[:m.shape[0], :m.shape[0]] += m
+    return merged
+
+def _accuracy(matrix, classes):
+    """ Accuracy over the samples of classes.
+    """
+    classes = [c for c in classes if c < matrix.shape[0]]
+    total = matrix[classes].sum()
+    return (matrix[classes, classes].sum() / total).item() if total > 0 else 0.0
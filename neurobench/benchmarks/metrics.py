@@ -1,6 +1,8 @@
+import numpy as np
 import torch
 
-from .utils.metric_utils import check_shape
+from .registry import register_intermediate, register_metric
+from .utils.metric_utils import check_shape, box_iou, match_detections
 
 # TODO: separate out the static and data metrics into different modules
 
@@ -97,68 +99,573 @@ def multiply_accumulates(model, preds, data):
     macs = 0.0
     return macs
 
-def classification_accuracy(model, preds, data):
-    """ Classification accuracy of the model predictions.
+def average_timesteps(model, preds, data):
+    """ Average number of timesteps run per sample.
+
+    Reports the timesteps run by the model, which models such as
+    SNNTorchModel and FusedSNNModel store in model.timesteps, a tensor with
+    one entry per sample of the last batch.
 
     Args:
         model: A NeuroBenchModel.
         preds: A tensor of model predictions.
         data: A tuple of data and labels.
     Returns:
-        float: Classification accuracy.
+        torch.Tensor: Average timesteps, as a 0-dim tensor.
+    Raises:
+        ValueError: If the model does not report its timesteps.
+    """
+    timesteps = getattr(model, "timesteps", None)
+    if timesteps is None:
+        raise ValueError("average_timesteps requires a model which reports the timesteps it ran in model.timesteps")
+    return timesteps.float().mean()
+
+# shared intermediates, computed once per batch for all data metrics requiring them
+@register_intermediate("correct")
+def _correct(model, preds, data):
+    """ Boolean tensor of the predictions equal to their labels.
     """
     check_shape(preds, data[1])
-    equal = torch.eq(preds, data[1])
-    return torch.mean(equal.float()).item()
+    return torch.eq(preds, data[1])
 
-def MSE(model, preds, data):
-    """ Mean squared error of the model predictions.
+@register_intermediate("residuals")
+def _residuals(model, preds, data):
+    """ Predictions minus labels.
+    """
+    check_shape(preds, data[1])
+    return preds - data[1]
+
+@register_intermediate("predicted_classes")
+def _predicted_classes(model, preds, data):
+    """ Predicted class of every sample, the argmax of class scores or the predictions themselves.
+    """
+    if preds.dim() == data[1].dim() + 1:
+        preds = preds.argmax(-1)
+    check_shape(preds, data[1])
+    return preds
+
+@register_metric(requires=["correct"])
+def classification_accuracy(model, preds, data, correct=None):
+    """ Classification accuracy of the model predictions.
 
     Args:
         model: A NeuroBenchModel.
         preds: A tensor of model predictions.
         data: A tuple of data and labels.
+        correct: The "correct" intermediate, computed if not given.
     Returns:
-        float: Mean squared error.
+        torch.Tensor: Classification accuracy, as a 0-dim tensor on the device of preds.
     """
-    check_shape(preds, data[1])
-    return torch.mean((preds - data[1])**2).item()
+    if correct is None:
+        correct = _correct(model, preds, data)
+    return torch.mean(correct.float())
 
-def r2(model, preds, data):
-    """ R2 Score of the model predictions.
-
-    Currently implemented for 2D output only.
-
-    Errata: R2 score currently is accumulated by mean for batched eval.
-            Currently it is only correct for full-batch evaluation.
+@register_metric(requires=["residuals"])
+def MSE(model, preds, data, residuals=None):
+    """ Mean squared error of the model predictions.
 
     Args:
         model: A NeuroBenchModel.
         preds: A tensor of model predictions.
         data: A tuple of data and labels.
+        residuals: The "residuals" intermediate, computed if not given.
     Returns:
-        float: R2 Score.
+        torch.Tensor: Mean squared error, as a 0-dim tensor on the device of preds.
     """
-    X_numerator = torch.sum((data[1][:, 0] - preds[:, 0])**2)
-    Y_numerator = torch.sum((data[1][:, 1] - preds[:, 1])**2)
-    X_original_label_mean = torch.mean(data[1][:, 0])
-    Y_original_label_mean = torch.mean(data[1][:, 1])
-    X_denominator = torch.sum((data[1][:, 0] - X_original_label_mean)**2)
-    Y_denominator = torch.sum((data[1][:, 1] - Y_original_label_mean)**2)
-    X_r2 = 1 - (X_numerator/ X_denominator)
-    Y_r2 = 1 - (Y_numerator/ Y_denominator)
-    r2 = (X_r2 + Y_r2)/2
+    if residuals is None:
+        residuals = _residuals(model, preds, data)
+    return torch.mean(residuals**2)
+
+class AccumulatedMetric():
+    """ Base class for data metrics which are accumulated over the whole test set.
+
+    Unlike the function metrics, which return one float per batch that is
+    averaged, an AccumulatedMetric keeps state. Benchmark creates one instance
+    per run, calls it on every batch and reports compute() at the end.
+    Instances evaluated on different shards of a test set can be merged.
+    Subclasses list the shared intermediates they take as keyword arguments
+    of __call__ in requires, see registry.register_intermediate.
+    """
+    requires = ()
+
+    def __call__(self, model, preds, data):
+        """ Accumulates a batch.
+
+        Args:
+            model: A NeuroBenchModel.
+            preds: Model predictions.
+            data: A tuple of data and labels.
+        """
+        raise NotImplementedError("Subclasses of AccumulatedMetric must implement __call__")
+
+    def compute(self):
+        """ Returns the value of the metric over all accumulated batches.
+        """
+        raise NotImplementedError("Subclasses of AccumulatedMetric must implement compute")
+
+    def merge(self, other):
+        """ Adds the state of another instance of the same metric, e.g. from another shard.
+
+        Args:
+            other: An instance of the same metric.
+        Returns:
+            self
+        """
+        raise NotImplementedError("Subclasses of AccumulatedMetric must implement merge")
+
+
+class mAP(AccumulatedMetric):
+    """ COCO-style mean average precision of object detections.
+
+    Averages the AP over the classes with ground truth boxes and over the IoU
+    thresholds 0.5:0.05:0.95. Detections are matched per frame and class with
+    vectorized IoU matrices, after which only per-class histograms of the true
+    and false positive scores are kept, so memory does not grow with the test
+    set. Scores are quantized to score_bins bins, which only affects the order
+    of detections with nearly equal scores.
+
+    Predictions and labels are lists of frames, possibly nested as in the
+    (rows, time bins) targets of Gen4Histograms:
+        preds: per frame, a (detections, 6) tensor of [x1, y1, x2, y2, score, class],
+            with scores in [0, 1].
+        labels: per frame, a (boxes, 5) tensor of [x1, y1, x2, y2, class].
+    If data has an info dict with a "labeled" mask, only labeled frames are evaluated.
+    """
+    def __init__(self, iou_thresholds=None, max_detections=100, score_bins=1000):
+        """
+        Args:
+            iou_thresholds: IoU thresholds to average over. Defaults to 0.5:0.05:0.95.
+            max_detections: Maximum number of detections per frame over all classes, by score.
+            score_bins: Number of score bins of the histograms.
+        """
+        if iou_thresholds is None:
+            iou_thresholds = np.linspace(0.5, 0.95, 10)
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.max_detections = max_detections
+        self.score_bins = score_bins
+
+        self.true_positives = np.zeros((0, len(self.iou_thresholds), score_bins), dtype=np.int64)
+        self.false_positives = np.zeros((0, len(self.iou_thresholds), score_bins), dtype=np.int64)
+        self.num_targets = np.zeros(0, dtype=np.int64)
+
+    def __call__(self, model, preds, data):
+        """ Matches the detections of a batch and accumulates them.
+
+        Args:
+            model: A NeuroBenchModel.
+            preds: Detections of each frame.
+            data: A tuple of data and labels, optionally followed by an info dict.
+        """
+        preds = _flatten_frames(preds)
+        labels = _flatten_frames(data[1])
+        if len(preds) != len(labels):
+            raise ValueError("preds and labels must have the same number of frames")
+
+        labeled = None
+        if len(data) > 2 and isinstance(data[2], dict) and "labeled" in data[2]:
+            labeled = data[2]["labeled"].reshape(-1).tolist()
+
+        for idx, (detections, targets) in enumerate(zip(preds, labels)):
+            if labeled is None or labeled[idx]:
+                self.update(detections, targets)
+
+    def update(self, detections, targets):
+        """ Accumulates a single frame.
+
+        Args:
+            detections: (detections, 6) tensor of [x1, y1, x2, y2, score, class].
+            targets: (boxes, 5) tensor of [x1, y1, x2, y2, class].
+        """
+        detections = detections.detach()
+        targets = targets.detach().to(detections.device)
+
+        det_classes = detections[:, 5].long().cpu().numpy()
+        target_classes = targets[:, 4].long().cpu().numpy()
+        self._grow(max(det_classes.max(initial=-1), target_classes.max(initial=-1)) + 1)
+        np.add.at(self.num_targets, target_classes, 1)
+        if len(detections) == 0:
+            return
+
+        # keep the top detections of the frame across classes, as COCO does per image,
+        # then sort them by class and descending score
+        scores = detections[:, 4].cpu().numpy()
+        order = np.argsort(-scores, kind="stable")[:self.max_detections]
+        order = order[np.lexsort((-scores[order], det_classes[order]))]
+        det_classes, scores = det_classes[order], scores[order]
+
+        ious = box_iou(detections[order, :4], targets[:, :4]).cpu().numpy()
+        ious[det_classes[:, None] != target_classes[None, :]] = -1.
+        matched = match_detections(ious, self.iou_thresholds)
+
+        bins = np.clip((scores * self.score_bins).astype(np.int64), 0, self.score_bins - 1)
+        thresholds = np.arange(len(self.iou_thresholds))
+        index = (det_classes[:, None], thresholds[None, :], bins[:, None])
+        np.add.at(self.true_positives, index, matched)
+        np.add.at(self.false_positives, index, ~matched)
+
+    def compute(self):
+        """ Mean average precision over the classes with ground truth boxes.
+
+        Returns:
+            float: mAP, 0 if no ground truth boxes were seen.
+        """
+        classes = np.nonzero(self.num_targets)[0]
+        if len(classes) == 0:
+            return 0.0
+
+        # cumulative counts from the highest score bin down
+        tp = np.cumsum(self.true_positives[classes, :, ::-1], axis=-1)
+        fp = np.cumsum(self.false_positives[classes, :, ::-1], axis=-1)
+        recall = tp / self.num_targets[classes, None, None]
+        precision = tp / np.maximum(tp + fp, 1)
+        precision = np.maximum.accumulate(precision[..., ::-1], axis=-1)[..., ::-1]
+
+        # precision interpolated at 101 recall points
+        recall_points = np.linspace(0, 1, 101)
+        ap = np.zeros(recall.shape[:2])
+        for c in range(recall.shape[0]):
+            for t in range(recall.shape[1]):
+                idx = np.searchsorted(recall[c, t], recall_points, side="left")
+                valid = idx < recall.shape[-1]
+                ap[c, t] = precision[c, t, idx[valid]].sum() / len(recall_points)
+
+        return float(ap.mean())
+
+    def merge(self, other):
+        """ Adds the histograms of another mAP instance.
+
+        Args:
+            other: An mAP instance with the same IoU thresholds and score bins.
+        Returns:
+            self
+        """
+        if not np.array_equal(self.iou_thresholds, other.iou_thresholds) or self.score_bins != other.score_bins:
+            raise ValueError("Only mAP instances with the same IoU thresholds and score bins can be merged")
+        self._grow(len(other.num_targets))
+        num_classes = len(other.num_targets)
+        self.true_positives[:num_classes] += other.true_positives
+        self.false_positives[:num_classes] += other.false_positives
+        self.num_targets[:num_classes] += other.num_targets
+        return self
+
+    def _grow(self, num_classes):
+        """ Extends the state to at least num_classes classes.
+        """
+        extra = num_classes - len(self.num_targets)
+        if extra <= 0:
+            return
+        pad = ((0, extra), (0, 0), (0, 0))
+        self.true_positives = np.pad(self.true_positives, pad)
+        self.false_positives = np.pad(self.false_positives, pad)
+        self.num_targets = np.pad(self.num_targets, (0, extra))
+
+
+class r2(AccumulatedMetric):
+    """ R2 Score of the model predictions, averaged over the output dimensions.
+
+    Predictions and labels of shape (..., dimensions) are accumulated as
+    per-dimension sufficient statistics: sample count, label mean, sum of
+    squared label deviations and sum of squared residuals. Batches are combined
+    with the parallel variance formula of Chan et al., so the result is the
+    exact R2 of the whole test set regardless of batching.
+    """
+    multioutput = "uniform_average"
+
+    def __init__(self, multioutput=None):
+        """
+        Args:
+            multioutput: How the R2 of the output dimensions are combined. One of
+                "uniform_average", "variance_weighted", weighted by the label
+                variance of each dimension, or "raw_values", returning a list.
+                Defaults to the class attribute.
+        """
+        if multioutput is not None:
+            self.multioutput = multioutput
+        if self.multioutput not in ("uniform_average", "variance_weighted", "raw_values"):
+            raise ValueError(f"Unknown multioutput {self.multioutput}")
+
+        self.count = 0
+        self.mean = None
+        self.sum_squares = None
+        self.sum_residuals = None
+
+    def __call__(self, model, preds, data):
+        """ Accumulates the statistics of a batch.
+
+        Args:
+            model: A NeuroBenchModel.
+            preds: A tensor of model predictions.
+            data: A tuple of data and labels.
+        """
+        check_shape(preds, data[1])
+        labels = data[1].detach().double().reshape(-1, data[1].shape[-1] if data[1].dim() > 1 else 1)
+        preds = preds.detach().double().reshape(labels.shape)
+
+        mean = labels.mean(dim=0)
+        sums = torch.stack((labels - mean, labels - preds)).square_().sum(dim=1)
+        self._add(labels.shape[0], mean, sums[0], sums[1])
+
+    def compute(self):
+        """ R2 of the accumulated statistics.
+
+        Returns:
+            float or list: R2 Score, per dimension for "raw_values".
+        """
+        if self.count == 0:
+            raise ValueError("r2 requires at least one sample")
+
+        # constant labels give 1 if predicted exactly, else 0, as in sklearn
+        exact = self.sum_residuals == 0
+        scores = torch.where(self.sum_squares > 0, 1 - self.sum_residuals / self.sum_squares.clamp(min=1e-300), exact.double())
+
+        if self.multioutput == "raw_values":
+            return scores.tolist()
+        if self.multioutput == "variance_weighted" and self.sum_squares.sum() > 0:
+            return (torch.sum(scores * self.sum_squares) / self.sum_squares.sum()).item()
+        return scores.mean().item()
+
+    def merge(self, other):
+        """ Adds the statistics of another r2 instance.
+
+        Args:
+            other: An r2 instance.
+        Returns:
+            self
+        """
+        if other.count:
+            self._add(other.count, other.mean, other.sum_squares, other.sum_residuals)
+        return self
+
+    def _add(self, count, mean, sum_squares, sum_residuals):
+        if self.count == 0:
+            self.count, self.mean, self.sum_squares, self.sum_residuals = count, mean, sum_squares, sum_residuals
+            return
+
+        total = self.count + count
+        delta = mean.to(self.mean.device) - self.mean
+        self.mean = self.mean + delta * count / total
+        self.sum_squares = self.sum_squares + sum_squares.to(self.mean.device) + delta**2 * self.count * count / total
+        self.sum_residuals = self.sum_residuals + sum_residuals.to(self.mean.device)
+        self.count = total
+
+
+class r2_variance_weighted(r2):
+    """ R2 Score averaged over the output dimensions, weighted by their label variance.
+    """
+    multioutput = "variance_weighted"
 
-    return r2.item()
 
+class r2_per_dimension(r2):
+    """ R2 Score of every output dimension, as a list.
+    """
+    multioutput = "raw_values"
 
 
+class confusion_matrix(AccumulatedMetric):
+    """ Confusion matrix of a classifier, with rows for the labels and columns for the predictions.
 
+    Predictions are class indices, or class scores of shape (..., classes)
+    whose argmax is taken. The matrix is accumulated on the device of the
+    predictions, with one scatter-add per batch, and copied to the host once
+    by compute. The number of classes grows with the largest class seen,
+    which requires a host synchronization per batch, unless num_classes is set.
 
+    Subclasses derive other classification metrics from the matrix.
+    """
+    requires = ("predicted_classes",)
+    num_classes = None
+
+    def __init__(self, num_classes=None):
+        """
+        Args:
+            num_classes: Number of classes. Defaults to the class attribute, or growing
+                with the classes seen if None.
+        """
+        if num_classes is not None:
+            self.num_classes = num_classes
+        self.matrix = None
+
+    def __call__(self, model, preds, data, predicted_classes=None):
+        """ Accumulates the confusion matrix of a batch.
+
+        Args:
+            model: A NeuroBenchModel.
+            preds: A tensor of predicted classes or class scores.
+            data: A tuple of data and labels.
+            predicted_classes: The "predicted_classes" intermediate, computed if not given.
+        """
+        if predicted_classes is None:
+            predicted_classes = _predicted_classes(model, preds, data)
+        self.update(predicted_classes, data[1])
+
+    def update(self, predicted, labels):
+        """ Adds predicted classes and labels to the matrix.
+
+        Args:
+            predicted: A tensor of predicted classes.
+            labels: A tensor of labels of the same shape.
+        Raises:
+            ValueError: If a class is negative, or not below num_classes when it is set.
+        """
+        predicted = predicted.detach().reshape(-1).long()
+        labels = labels.detach().reshape(-1).long().to(predicted.device)
+        if len(labels):
+            low = int(torch.minimum(labels.min(), predicted.min()))
+            high = int(torch.maximum(labels.max(), predicted.max()))
+            if low < 0 or (self.num_classes is not None and high >= self.num_classes):
+                raise ValueError(f"Classes must be in [0, {self.num_classes or 'num_classes'}), got labels or "
+                                 f"predictions from {low} to {high}")
+        if self.num_classes is not None:
+            num_classes = self.num_classes
+        elif len(labels):
+            num_classes = high + 1
+        else:
+            num_classes = 0
+        self._grow(num_classes, predicted.device)
+
+        size = self.matrix.shape[0]
+        self.matrix.view(-1).index_add_(0, labels * size + predicted, torch.ones_like(labels))
+
+    def compute(self):
+        """ Value of the metric, from the matrix copied to the host.
+        """
+        matrix = self.matrix.cpu().double() if self.matrix is not None else torch.zeros((0, 0), dtype=torch.float64)
+        return self.from_matrix(matrix)
+
+    def from_matrix(self, matrix):
+        """ Derives the metric from a confusion matrix.
+
+        Args:
+            matrix: A float64 (classes, classes) tensor of counts.
+        Returns:
+            list: The confusion matrix.
+        """
+        return matrix.long().tolist()
+
+    def merge(self, other):
+        """ Adds the matrix of another confusion matrix metric.
+
+        Args:
+            other: An instance of a confusion_matrix metric.
+        Returns:
+            self
+        """
+        if other.matrix is not None:
+            self._grow(other.matrix.shape[0], other.matrix.device)
+            size = other.matrix.shape[0]
+            self.matrix[:size, :size] += other.matrix.to(self.matrix.device)
+        return self
+
+    def _grow(self, num_classes, device):
+        """ Extends the matrix to at least num_classes classes.
+        """
+        if self.matrix is None:
+            self.matrix = torch.zeros((num_classes, num_classes), dtype=torch.int64, device=device)
+        elif num_classes > self.matrix.shape[0]:
+            size = self.matrix.shape[0]
+            matrix = self.matrix.new_zeros((num_classes, num_classes))
+            matrix[:size, :size] = self.matrix
+            self.matrix = matrix
+
+
+class accuracy(confusion_matrix):
+    """ Classification accuracy over the whole test set.
+    """
+    def from_matrix(self, matrix):
+        total = matrix.sum()
+        return (matrix.trace() / total).item() if total > 0 else 0.0
 
 
+class per_class_recall(confusion_matrix):
+    """ Recall of every class, as a list, NaN for classes without samples.
+    """
+    def from_matrix(self, matrix):
+        return (matrix.diagonal() / matrix.sum(1)).tolist()
 
 
+class balanced_accuracy(confusion_matrix):
+    """ Mean recall over the classes with samples.
+    """
+    def from_matrix(self, matrix):
+        support = matrix.sum(1)
+        present = support > 0
+        if not present.any():
+            return 0.0
+        return (matrix.diagonal()[present] / support[present]).mean().item()
+
+
+class macro_f1(confusion_matrix):
+    """ F1 score averaged over the classes which occur in the labels or the predictions.
+    """
+    def from_matrix(self, matrix):
+        true_positives = matrix.diagonal()
+        denominator = matrix.sum(0) + matrix.sum(1)
+        present = denominator > 0
+        if not present.any():
+            return 0.0
+        return (2 * true_positives[present] / denominator[present]).mean().item()
 
 
-    
\ No newline at end of file
+class top_k_accuracy(AccumulatedMetric):
+    """ Fraction of samples whose label is among the k highest class scores.
+
+    Predictions are class scores of shape (..., classes). Hits are counted on
+    the device of the predictions and copied to the host once by compute.
+    """
+    k = 5
+
+    def __init__(self, k=None):
+        """
+        Args:
+            k: Number of highest scores. Defaults to the class attribute.
+        """
+        if k is not None:
+            self.k = k
+        self.hits = torch.zeros((), dtype=torch.int64)
+        self.count = 0
+
+    def __call__(self, model, preds, data):
+        """ Accumulates the hits of a batch.
+
+        Args:
+            model: A NeuroBenchModel.
+            preds: A tensor of class scores.
+            data: A tuple of data and labels.
+        """
+        labels = data[1]
+        if preds.dim() != labels.dim() + 1:
+            raise ValueError("top_k_accuracy requires class scores of shape (..., classes)")
+        check_shape(preds[..., 0], labels)
+        top = preds.detach().topk(min(self.k, preds.shape[-1]), dim=-1).indices
+        self.hits = self.hits.to(top.device) + (top == labels.to(top.device).unsqueeze(-1)).any(-1).sum()
+        self.count += labels.numel()
+
+    def compute(self):
+        """ Top-k accuracy.
+
+        Returns:
+            float: Top-k accuracy, 0 if no samples were seen.
+        """
+        return self.hits.item() / self.count if self.count else 0.0
+
+    def merge(self, other):
+        """ Adds the hits of another top_k_accuracy instance.
+
+        Args:
+            other: A top_k_accuracy instance with the same k.
+        Returns:
+            self
+        """
+        if self.k != other.k:
+            raise ValueError("Only top_k_accuracy instances with the same k can be merged")
+        self.hits = self.hits + other.hits.to(self.hits.device)
+        self.count += other.count
+        return self
+
+
+def _flatten_frames(frames):
+    """ Flattens nested lists of per-frame tensors into a list.
+    """
+    if isinstance(frames, torch.Tensor):
+        return [frames]
+    return [frame for item in frames for frame in _flatten_frames(item)]
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+
+
+class PredictionCache():
+    """ Content-addressed cache of the postprocessed predictions of benchmark runs.
+
+    An entry holds the predictions and labels of every sample, in evaluation
+    order, and the batch sizes, so that data metrics can be evaluated on the
+    same batches without preprocessing and inference. Entries are keyed by a
+    hash of the model weights, the dataset and dataloader configuration, and
+    the pre- and postprocessor configuration, see fingerprint. Arrays are
+    stored as .npy files and memory-mapped when read.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path: Directory of the cache.
+        """
+        self.path = path
+
+    def load(self, key):
+        """ Returns the cache entry of key, or None.
+
+        Args:
+            key: Fingerprint of the run.
+        Returns:
+            dict: "preds", "labels" and "batch_sizes" arrays, or None if there is no entry.
+        """
+        entry = os.path.join(self.path, key)
+        if not os.path.exists(os.path.join(entry, "complete")):
+            return None
+        return {name: np.load(os.path.join(entry, name + ".npy"), mmap_mode="r")
+                for name in ("preds", "labels", "batch_sizes")}
+
+    def save(self, key, recorder):
+        """ Stores the outputs of a recorder under key.
+
+        Args:
+            key: Fingerprint of the run.
+            recorder: A PredictionRecorder that recorded the whole run.
+        """
+        entry = os.path.join(self.path, key)
+        tmp_entry = entry + ".tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        np.save(os.path.join(tmp_entry, "preds.npy"), np.concatenate(recorder.preds))
+        np.save(os.path.join(tmp_entry, "labels.npy"), np.concatenate(recorder.labels))
+        np.save(os.path.join(tmp_entry, "batch_sizes.npy"), np.array(recorder.batch_sizes, dtype=np.int64))
+        open(os.path.join(tmp_entry, "complete"), "w").close()
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+
+
+class PredictionRecorder():
+    """ Collects the predictions and labels of a run for a PredictionCache.
+
+    Recording stops, and the run is not cached, if a batch has predictions or
+    labels which are not tensors with one row per sample.
+    """
+    def __init__(self):
+        self.preds = []
+        self.labels = []
+        self.batch_sizes = []
+        self.valid = True
+
+    def append(self, preds, labels, batch_size):
+        """ Records a batch.
+
+        Args:
+            preds: Postprocessed model predictions.
+            labels: Labels of the batch.
+            batch_size: Number of samples of the batch.
+        """
+        if not self.valid:
+            return
+        if not all(isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == batch_size
+                   for value in (preds, labels)):
+            self.valid = False
+            self.preds, self.labels = [], []
+            return
+        self.preds.append(preds.detach().cpu().numpy())
+        self.labels.append(labels.detach().cpu().numpy())
+        self.batch_sizes.append(batch_size)
+
+
+def fingerprint(model, dataloader, preprocessors, postprocessors, dataset_key=None):
+    """ Hash identifying the predictions of a benchmark configuration.
+
+    Covers the class and weights of the model network, the class, length,
+    simple attributes and contents of the dataset, the batch size and sampler
+    of the dataloader, and the classes and attributes of the pre- and
+    postprocessors.
+
+    The dataset contents are identified by its tensors and arrays, such as
+    those of a TensorDataset, by the file name and modification time of
+    memory-mapped arrays, and by its file lists and existing paths, recursing
+    into wrapped datasets such as Subset. Datasets without any of these, e.g.
+    generating samples on the fly, must be identified by an explicit dataset_key.
+
+    Args:
+        model: A NeuroBenchModel.
+        dataloader: The dataloader of the run.
+        preprocessors: A list of NeuroBenchProcessors.
+        postprocessors: A list of NeuroBenchAccumulators.
+        dataset_key: String identifying the dataset contents, replacing the content hash.
+    Returns:
+        str: Hex digest, or None if the model network or the dataset cannot be identified.
+    """
+    try:
+        net = model.__net__()
+    except (AttributeError, NotImplementedError):
+        return None
+
+    digest = hashlib.sha256()
+    digest.update(_name(model).encode())
+    _hash_value(digest, net)
+
+    dataset = getattr(dataloader, "dataset", None)
+    description = {
+        "dataset": _name(dataset),
+        "length": len(dataset) if dataset is not None else None,
+        "dataset_config": _config(dataset),
+        "loader": _name(dataloader),
+        "batch_size": getattr(dataloader, "batch_size", None),
+        "sampler": _name(getattr(dataloader, "sampler", None)),
+        "preprocessors": [[_name(alg), _config(alg)] for alg in preprocessors],
+        "postprocessors": [[_name(alg), _config(alg)] for alg in postprocessors],
+    }
+    digest.update(json.dumps(description, sort_keys=True, default=str).encode())
+    if dataset_key is not None:
+        digest.update(f"dataset_key:{dataset_key}".encode())
+    elif not _hash_dataset(digest, dataset):
+        return None
+    for alg in list(preprocessors) + list(postprocessors):
+        for value in _attributes(alg).values():
+            _hash_value(digest, value)
+    return digest.hexdigest()
+
+def _name(obj):
+    cls = obj if callable(obj) and hasattr(obj, "__qualname__") else type(obj)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+def _attributes(obj):
+    try:
+        return dict(vars(obj))
+    except TypeError:
+        return {}
+
+def _config(obj):
+    """ Attributes of obj with simple values, which identify its configuration.
+    """
+    simple = (str, int, float, bool, type(None))
+    config = {}
+    for name, value in _attributes(obj).items():
+        if isinstance(value, simple) or (isinstance(value, (list, tuple)) and len(value) < 1000 and all(isinstance(v, simple) for v in value)):
+            config[name] = value
+        elif isinstance(value, dict) and len(value) < 1000 and all(isinstance(v, simple) for v in value.values()):
+            config[name] = {str(k): v for k, v in value.items()}
+    return config
+
+def _hash_dataset(digest, dataset):
+    """ Adds the contents of a dataset to the hash.
+
+    Returns:
+        bool: Whether any attribute identifying the contents was found.
+    """
+    identified = False
+    for name, value in sorted(_attributes(dataset).items()):
+        digest.update(name.encode())
+        if isinstance(value, np.memmap) and value.filename is not None:
+            # large memory-mapped arrays are identified by their file
+            stat = os.stat(value.filename)
+            digest.update(f"{value.filename}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+            identified = True
+        elif isinstance(value, (torch.Tensor, np.ndarray)):
+            _hash_value(digest, value)
+            identified = True
+        elif isinstance(value, torch.utils.data.Dataset):
+            identified |= _hash_dataset(digest, value)
+        elif isinstance(value, (list, tuple)) and len(value) > 0:
+            if all(isinstance(v, torch.utils.data.Dataset) for v in value):
+                for v in value:
+                    identified |= _hash_dataset(digest, v)
+            elif all(isinstance(v, (torch.Tensor, np.ndarray)) for v in value):
+                for v in value:
+                    _hash_value(digest, v)
+                identified = True
+            elif all(isinstance(v, (str, int, float)) for v in value):
+                # file lists identify the contents, index lists such as those of a Subset only select them
+                digest.update(json.dumps(list(value)).encode())
+                identified |= any(isinstance(v, str) for v in value)
+        elif isinstance(value, str) and os.path.exists(value):
+            digest.update(value.encode())
+            identified = True
+    return identified
+
+def _hash_value(digest, value):
+    """ Adds the weights of modules and the contents of tensors to the hash.
+    """
+    if isinstance(value, torch.nn.Module):
+        for name, tensor in value.state_dict().items():
+            digest.update(name.encode())
+            _hash_value(digest, tensor)
+    elif isinstance(value, np.ndarray):
+        if value.dtype == object:
+            digest.update(f"{value.shape}{value.tolist()}".encode())
+        else:
+            digest.update(f"{value.dtype}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, torch.Tensor):
+        tensor = value.detach().cpu().contiguous()
+        digest.update(f"{tensor.dtype}{tuple(tensor.shape)}".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes() if tensor.numel() else b"")
@@ -0,0 +1,119 @@
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = "neurobench.metrics"
+
+_metrics = {}
+_intermediates = {}
+
+
+def register_metric(name=None, requires=()):
+    """ Decorator registering a static or data metric under a name usable in metric lists.
+
+    A data metric can declare shared intermediates it requires, see
+    register_intermediate. Benchmark computes every required intermediate once
+    per batch and passes it to the metric as a keyword argument of that name,
+    e.g. metric(model, preds, data, correct=...).
+
+    Third-party packages can make metrics available without importing them
+    first through an entry point in the "neurobench.metrics" group, named as
+    the metric and pointing to it, e.g. in pyproject.toml:
+        [project.entry-points."neurobench.metrics"]
+        my_metric = "my_package.metrics:my_metric"
+
+    Args:
+        name: Name of the metric. Defaults to the name of the function or class.
+        requires: Names of the intermediates the metric requires.
+    Returns:
+        decorator: Registers and returns the metric.
+    """
+    def decorator(metric):
+        for intermediate in requires:
+            if intermediate not in _intermediates:
+                raise ValueError(f"Unknown intermediate {intermediate}, register it with register_intermediate")
+        metric.requires = tuple(requires)
+        _metrics[name or metric.__name__] = metric
+        return metric
+    return decorator
+
+def register_intermediate(name):
+    """ Decorator registering a per-batch intermediate shared by data metrics.
+
+    The decorated function is called as fn(model, preds, data), once per batch
+    for all metrics requiring it.
+
+    Args:
+        name: Name of the intermediate, and of the keyword argument it is passed as.
+    Returns:
+        decorator: Registers and returns the function.
+    """
+    def decorator(fn):
+        _intermediates[name] = fn
+        return fn
+    return decorator
+
+def get_metric(name):
+    """ Looks up a metric by name.
+
+    Registered metrics are searched first, then the "neurobench.metrics" entry
+    points, then the functions and classes of neurobench.benchmarks.metrics.
+
+    Args:
+        name: Name of the metric.
+    Returns:
+        The metric function or class.
+    """
+    # the built-in metrics register themselves on import
+    from . import metrics
+
+    if name in _metrics:
+        return _metrics[name]
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP, name=name):
+        metric = entry_point.load()
+        _metrics.setdefault(name, metric)
+        return _metrics[name]
+    if hasattr(metrics, name) and not name.startswith("_"):
+        return getattr(metrics, name)
+    raise ValueError(f"Unknown metric {name}")
+
+def required_intermediates(metric_list):
+    """ Names of the intermediates required by any of the metrics.
+
+    Args:
+        metric_list: Metric functions, classes or instances.
+    Returns:
+        list: Intermediate names, in order of first use.
+    """
+    names = []
+    for metric in metric_list:
+        for name in getattr(metric, "requires", ()):
+            if name not in names:
+                names.append(name)
+    return names
+
+def compute_intermediates(names, model, preds, data):
+    """ Computes intermediates of a batch.
+
+    Args:
+        names: Names of the intermediates.
+        model: A NeuroBenchModel.
+        preds: Model predictions.
+        data: A tuple of data and labels.
+    Returns:
+        dict: Name to value.
+    """
+    return {name: _intermediates[name](model, preds, data) for name in names}
+
+def call_metric(metric, model, preds, data, intermediates):
+    """ Calls a data metric with the intermediates it requires.
+
+    Args:
+        metric: A data metric function or AccumulatedMetric instance.
+        model: A NeuroBenchModel.
+        preds: Model predictions.
+        data: A tuple of data and labels.
+        intermediates: Dict of computed intermediates, see compute_intermediates.
+    Returns:
+        The value returned by the metric.
+    """
+    kwargs = {name: intermediates[name] for name in getattr(metric, "requires", ())}
+    return metric(model, preds, data, **kwargs)
@@ -0,0 +1,170 @@
+import glob
+import os
+import queue
+import threading
+
+import numpy as np
+import torch
+
+from . import metrics
+from .registry import call_metric, compute_intermediates, get_metric, required_intermediates
+
+
+class SampleLog():
+    """ Columnar log of per-sample benchmark outputs.
+
+    Rows are appended per batch as a dict of columns, e.g. sample index,
+    label, prediction and latency. A background thread copies them to host
+    memory, buffers them, and writes chunks of chunk_size rows as
+    <path>/chunk_XXXXXX.npz files, so that logging does not stall evaluation.
+    Use load_sample_log to read the log and rescore to evaluate metrics on it.
+    """
+    def __init__(self, path, chunk_size=65536, keep_chunks=0, max_pending=16):
+        """
+        Args:
+            path: Directory of the chunk files.
+            chunk_size: Number of rows per chunk file.
+            keep_chunks: Number of existing chunks to keep and append to, e.g. when
+                resuming a run. Later chunks are deleted. Defaults to starting a new log.
+            max_pending: Number of batches that may wait for the writer thread
+                before append blocks.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        for chunk in _chunk_files(path)[keep_chunks:]:
+            os.remove(chunk)
+        self.num_chunks = len(_chunk_files(path))
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def append(self, columns):
+        """ Appends the rows of a batch.
+
+        Args:
+            columns: Dict of column name to a tensor or array with one row per sample.
+                Every append must have the same columns.
+        """
+        self._check_error()
+        self._queue.put(("rows", columns))
+
+    def flush(self):
+        """ Writes the buffered rows as a chunk and waits until all chunks are written.
+
+        Returns:
+            int: Number of chunk files of the log.
+        """
+        self._check_error()
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait()
+        self._check_error()
+        return self.num_chunks
+
+    def close(self):
+        """ Writes the remaining rows and stops the writer thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(("close", None))
+            self._thread.join()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_loop(self):
+        buffer, num_rows = [], 0
+        while True:
+            kind, item = self._queue.get()
+            try:
+                if kind == "rows" and self._error is None:
+                    columns = {name: _to_numpy(value) for name, value in item.items()}
+                    buffer.append(columns)
+                    num_rows += len(next(iter(columns.values()))) if columns else 0
+                    if num_rows >= self.chunk_size:
+                        self._write_chunk(buffer)
+                        buffer, num_rows = [], 0
+                elif kind in ("flush", "close") and buffer and self._error is None:
+                    self._write_chunk(buffer)
+                    buffer, num_rows = [], 0
+            except Exception as e:
+                self._error = e
+            if kind == "flush":
+                item.set()
+            elif kind == "close":
+                return
+
+    def _write_chunk(self, buffer):
+        columns = {name: np.concatenate([rows[name] for rows in buffer]) for name in buffer[0]}
+        filename = os.path.join(self.path, f"chunk_{self.num_chunks:06d}.npz")
+        with open(filename + ".tmp", "wb") as f:
+            np.savez(f, **columns)
+        os.replace(filename + ".tmp", filename)
+        self.num_chunks += 1
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError(f"Writing the sample log to {self.path} failed") from self._error
+
+
+def load_sample_log(path):
+    """ Reads a sample log.
+
+    Args:
+        path: Directory of the chunk files.
+    Returns:
+        dict: Column name to a numpy array with one row per logged sample.
+    """
+    chunks = []
+    for filename in _chunk_files(path):
+        with np.load(filename) as chunk:
+            chunks.append({name: chunk[name] for name in chunk.files})
+    if not chunks:
+        return {}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+def rescore(path, data_metrics):
+    """ Evaluates data metrics on the predictions and labels of a sample log, without inference.
+
+    Only metrics that depend on the predictions and labels alone can be
+    evaluated, the model passed to them is None.
+
+    Args:
+        path: Directory of the sample log.
+        data_metrics: List of names of data metrics.
+    Returns:
+        dict: Metric name to result.
+    """
+    log = load_sample_log(path)
+    if "prediction" not in log or "label" not in log:
+        raise ValueError(f"Sample log {path} has no prediction and label columns")
+    data = (None, torch.from_numpy(log["label"]))
+    preds = torch.from_numpy(log["prediction"])
+
+    data_metrics = {m: get_metric(m) for m in data_metrics}
+    intermediates = compute_intermediates(required_intermediates(data_metrics.values()), None, preds, data)
+
+    results = {}
+    for m, metric in data_metrics.items():
+        if isinstance(metric, type) and issubclass(metric, metrics.AccumulatedMetric):
+            metric = metric()
+            call_metric(metric, None, preds, data, intermediates)
+            results[m] = metric.compute()
+        else:
+            result = call_metric(metric, None, preds, data, intermediates)
+            results[m] = result.item() if isinstance(result, torch.Tensor) else result
+    return results
+
+def _chunk_files(path):
+    return sorted(glob.glob(os.path.join(path, "chunk_[0-9]*.npz")))
+
+def _to_numpy(value):
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+    return np.asarray(value)
@@ -0,0 +1,239 @@
+import csv
+import inspect
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from torch.utils.data import DataLoader
+
+from .benchmark import Benchmark
+
+# Stages of a run, in dependency order. A stage may depend on any earlier stage.
+STAGES = ("dataset", "dataloader", "preprocessors", "model", "postprocessors")
+
+
+class Sweep():
+    """ Runs a Benchmark over a grid of configurations.
+
+    Each stage of a run is built by a user function. The arguments of a stage
+    function are matched by name either to grid parameters or to the outputs of
+    earlier stages, e.g. ``model=lambda dataset, seed_id: ...``. This defines a
+    dependency graph between the stages and the grid: a stage output is computed
+    once per distinct value of the parameters it depends on, and shared between
+    all runs that need it. The preprocessed features of a dataloader are also
+    computed once, so runs that only differ in model or postprocessing do not
+    rerun preprocessing.
+
+    Runs that share a model are executed sequentially, other runs are spread
+    over a pool of worker threads. Stage outputs and preprocessed features are
+    released once the last run using them has finished, so that a grid over
+    preprocessor configurations does not keep every variant of the dataset.
+    """
+    def __init__(self, dataset, model, metric_list, grid, dataloader=None,
+                 preprocessors=None, postprocessors=None, dataloader_kwargs=None, num_workers=1):
+        """
+        Args:
+            dataset: Function returning the evaluation dataset, or anything the
+                dataloader function consumes.
+            model: Function returning a NeuroBenchModel.
+            metric_list: A list of lists of strings of metrics to run, as for Benchmark.
+            grid: Either a dict mapping each parameter to a list of values, which is
+                expanded to the cartesian product, or a list of configuration dicts.
+            dataloader: Function returning a DataLoader. Defaults to wrapping the
+                dataset in a DataLoader with dataloader_kwargs.
+            preprocessors: Function returning a list of NeuroBenchProcessors. Defaults to none.
+            postprocessors: Function returning a list of NeuroBenchAccumulators. Defaults to none.
+            dataloader_kwargs: Keyword arguments for the default DataLoader.
+            num_workers: Number of worker threads running independent runs.
+        """
+        self.dataloader_kwargs = dataloader_kwargs or {}
+        self.stages = {
+            "dataset": dataset,
+            "dataloader": dataloader or (lambda dataset: DataLoader(dataset, **self.dataloader_kwargs)),
+            "preprocessors": preprocessors or (lambda: []),
+            "model": model,
+            "postprocessors": postprocessors or (lambda: []),
+        }
+        self.metric_list = metric_list
+        self.configs = expand_grid(grid)
+        self.num_workers = num_workers
+        self.results = []
+
+        parameters = set().union(*(config.keys() for config in self.configs))
+        self._dependencies = {}
+        for idx, stage in enumerate(STAGES):
+            args = list(inspect.signature(self.stages[stage]).parameters)
+            for arg in args:
+                if arg not in parameters and arg not in STAGES[:idx]:
+                    raise ValueError(f"Argument '{arg}' of the {stage} function is neither a grid parameter nor an earlier stage")
+            self._dependencies[stage] = args
+
+        self._cache = {}
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    def run(self):
+        """ Runs the benchmark for every configuration of the grid.
+
+        Returns:
+            results: A list with one dict per configuration, holding the
+                configuration parameters followed by the benchmark results.
+        """
+        # group runs by model so that a model is never used by two threads at once
+        groups = {}
+        for idx, config in enumerate(self.configs):
+            groups.setdefault(self._key("model", config), []).append(idx)
+
+        # number of remaining runs using each cache entry
+        with self._lock:
+            for config in self.configs:
+                for key in self._cache_keys(config):
+                    self._uses[key] = self._uses.get(key, 0) + 1
+
+        rows = [None] * len(self.configs)
+        def run_group(indices):
+            for idx in indices:
+                try:
+                    rows[idx] = {**self.configs[idx], **self._run_config(self.configs[idx])}
+                finally:
+                    self._release(self.configs[idx])
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for future in [executor.submit(run_group, indices) for indices in groups.values()]:
+                future.result()
+
+        self.results = rows
+        return rows
+
+    def to_csv(self, path):
+        """ Writes the results of the last run as a csv table.
+
+        Args:
+            path: Output csv file path.
+        """
+        fields = list(dict.fromkeys(key for row in self.results for key in row))
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.results)
+
+    def _run_config(self, config):
+        """ Runs the benchmark for a single configuration.
+        """
+        dataloader = self._stage("dataloader", config)
+        batches = self._memoize(self._features_key(config),
+                                lambda: self._preprocess(dataloader, self._stage("preprocessors", config)))
+
+        benchmark = Benchmark(
+            self._stage("model", config),
+            _CachedLoader(batches, dataloader.dataset),
+            [],
+            self._stage("postprocessors", config),
+            self.metric_list,
+        )
+        return benchmark.run()
+
+    @staticmethod
+    def _preprocess(dataloader, preprocessors):
+        """ Applies the preprocessors to every batch of the dataloader.
+        """
+        batches = []
+        for data in dataloader:
+            if type(data) is not tuple:
+                data = tuple(data)
+            for alg in preprocessors:
+                data = alg(data)
+            batches.append(data)
+        return batches
+
+    def _stage(self, stage, config):
+        """ Returns the memoized output of a stage for a configuration.
+        """
+        def build():
+            kwargs = {}
+            for arg in self._dependencies[stage]:
+                kwargs[arg] = self._stage(arg, config) if arg in STAGES else config[arg]
+            return self.stages[stage](**kwargs)
+
+        return self._memoize(self._key(stage, config), build)
+
+    def _key(self, stage, config):
+        """ Key identifying the output of a stage, from the parameters it depends on.
+        """
+        key = []
+        for arg in self._dependencies[stage]:
+            key.append(self._key(arg, config) if arg in STAGES else (arg, repr(config[arg])))
+        return (stage, tuple(key))
+
+    def _features_key(self, config):
+        """ Key of the preprocessed batches of a configuration.
+        """
+        return ("features", self._key("dataloader", config), self._key("preprocessors", config))
+
+    def _cache_keys(self, config):
+        """ Keys of all cache entries a run of config uses.
+        """
+        keys = {self._features_key(config)}
+        def add(stage):
+            keys.add(self._key(stage, config))
+            for arg in self._dependencies[stage]:
+                if arg in STAGES:
+                    add(arg)
+        for stage in STAGES:
+            add(stage)
+        return keys
+
+    def _release(self, config):
+        """ Drops the cache entries of which config was the last remaining run.
+        """
+        with self._lock:
+            for key in self._cache_keys(config):
+                self._uses[key] -= 1
+                if self._uses[key] == 0:
+                    del self._uses[key]
+                    self._cache.pop(key, None)
+
+    def _memoize(self, key, build):
+        """ Computes build() once per key, also when requested from several threads.
+        """
+        with self._lock:
+            future = self._cache.get(key)
+            owner = future is None
+            if owner:
+                future = self._cache[key] = Future()
+
+        if owner:
+            try:
+                future.set_result(build())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+
+class _CachedLoader():
+    """ Minimal stand-in for a DataLoader which replays a list of batches.
+    """
+    def __init__(self, batches, dataset):
+        self.batches = batches
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+
+def expand_grid(grid):
+    """ Expands a parameter grid into a list of configurations.
+
+    Args:
+        grid: Either a dict mapping each parameter to a list of values, or a
+            list of configuration dicts which is returned as is.
+    Returns:
+        list: A list of configuration dicts.
+    """
+    if isinstance(grid, dict):
+        keys = list(grid.keys())
+        return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    return [dict(config) for config in grid]
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 
 def check_shape(preds, labels):
@@ -5,3 +6,51 @@ def check_shape(preds, labels):
 	"""
 	if preds.shape != labels.shape:
 		raise ValueError("preds and labels must have the same shape")
+
+def box_iou(boxes1, boxes2):
+	""" Pairwise intersection over union of two sets of boxes.
+
+	Args:
+		boxes1: (N, 4) tensor of [x1, y1, x2, y2] boxes.
+		boxes2: (M, 4) tensor of [x1, y1, x2, y2] boxes.
+	Returns:
+		torch.Tensor: (N, M) IoU matrix.
+	"""
+	area1 = (boxes1[:, 2] - boxes1[:, 0]).clamp(min=0) * (boxes1[:, 3] - boxes1[:, 1]).clamp(min=0)
+	area2 = (boxes2[:, 2] - boxes2[:, 0]).clamp(min=0) * (boxes2[:, 3] - boxes2[:, 1]).clamp(min=0)
+
+	top_left = torch.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+	bottom_right = torch.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+	inter = (bottom_right - top_left).clamp(min=0).prod(dim=-1)
+
+	union = area1[:, None] + area2[None, :] - inter
+	return torch.where(union > 0, inter / union, torch.zeros_like(inter))
+
+def match_detections(ious, iou_thresholds):
+	""" Greedy COCO matching of detections to ground truth boxes.
+
+	Detections are visited in order, i.e. they should be sorted by descending
+	score, and each is matched to the unmatched ground truth box with the
+	highest IoU, independently for every IoU threshold.
+
+	Args:
+		ious: (N, M) numpy array of IoUs of the detections with the ground truth
+			boxes. Pairs that may not be matched, e.g. of different classes, should be negative.
+		iou_thresholds: (T,) numpy array of IoU thresholds.
+	Returns:
+		np.ndarray: (N, T) boolean array, True where a detection is a true positive.
+	"""
+	matched = np.zeros((ious.shape[0], len(iou_thresholds)), dtype=bool)
+	if ious.shape[1] == 0:
+		# no ground truth boxes, every detection is a false positive
+		return matched
+	taken = np.zeros((len(iou_thresholds), ious.shape[1]), dtype=bool)
+	thresholds = np.asarray(iou_thresholds)[:, None]
+	rows = np.arange(len(iou_thresholds))
+	for det in range(ious.shape[0]):
+		candidates = np.where((ious[det] >= thresholds) & ~taken, ious[det], -1.)
+		best = candidates.argmax(axis=1)
+		hit = candidates[rows, best] >= 0
+		taken[rows[hit], best[hit]] = True
+		matched[det] = hit
+	return matched
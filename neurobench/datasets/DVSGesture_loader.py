@@ -9,10 +9,13 @@ from neurobench.datasets.dataset import NeuroBenchDataset
 
 import os
 import numpy as np
-import matplotlib.pyplot as plt
+from functools import partial
 
-# make animation
-from matplotlib.animation import FuncAnimation
+from ..preprocessing.packed_spikes import PackedSpikes
+from ..utils import _optional_import
+
+# compact event layout of the 'events' data type, 9 bytes per event
+EVENT_DTYPE = np.dtype([("x", np.int16), ("y", np.int16), ("p", bool), ("t", np.int32)])
 
 
 class DVSGesture(NeuroBenchDataset):
@@ -36,7 +39,9 @@ class DVSGesture(NeuroBenchDataset):
         Args:
             path (str): Path of DVS Gesture dataset folder if applicable, else the destination of DVS Gesture dataset.
             split (str): Return testing or training data.
-            data_type (str): If 'frames', returns frames with preprocessing applied; else returns raw events.
+            data_type (str): If 'frames', returns frames with preprocessing applied. If 'events', returns a
+                compact structured array of events, see EVENT_DTYPE and collate_events; else returns
+                raw events as an int64 xypt tensor.
             preprocessing (str): Preprocessing to get frames from raw events.
         """
         # download or load data
@@ -71,46 +76,33 @@ class DVSGesture(NeuroBenchDataset):
 
         Returns:
             sample (tensor): Individual data sample, which can be a sequence of frames or raw data.
+                For the 'events' data type, a structured numpy array with dtype EVENT_DTYPE.
             target (tensor): Corresponding gesture label.
         """
-        structured_array = self.dataset[idx][0]
-
-        # label = torch.nn.functional.one_hot(torch.tensor(self.dataset[idx][1]), num_classes=11)
-        label = torch.tensor(self.dataset[idx][1])
-
-        # get data
-        x_data = np.array(structured_array["x"], dtype=np.int16)
-        y_data = np.array(structured_array["y"], dtype=np.int16)
-        p_data = np.array(structured_array["p"], dtype=bool)
-        t_data = np.array(
-            structured_array["t"], dtype=np.int64
-        )  # time is in microseconds
-
-        xypt = torch.stack(
-            (
-                torch.tensor(x_data),
-                torch.tensor(y_data),
-                torch.tensor(p_data),
-                torch.tensor(t_data),
-            ),
-            dim=1,
-        )
+        structured_array, target = self.dataset[idx]
 
-        # create sample
-        t_end = (
-            t_data[-1] - self._T * 1000
-        )  # find latest time at which we can sample including buffer of factor 1.5 (*1000 to convert to microseconds)
-        start_time = np.random.randint(0, t_end) if self.random_window else 0
-        sample = xypt[
-            (start_time <= xypt[:, 3]) & (xypt[:, 3] <= (start_time + self._T * 1000))
-        ]
-        sample[:, 3] = sample[:, 3] - sample[0, 3]  # shift timestamps
+        # label = torch.nn.functional.one_hot(torch.tensor(target), num_classes=11)
+        label = torch.tensor(target)
+
+        window = self.get_window(structured_array)
+        t_data = window["t"] - window["t"][0]  # shift timestamps, time is in microseconds
+
+        if self.data_type == "events":
+            events = np.empty(len(window), dtype=EVENT_DTYPE)
+            events["x"] = window["x"]
+            events["y"] = window["y"]
+            events["p"] = window["p"]
+            events["t"] = t_data
+            return events, label
+
+        # the frame builders consume the (N, 4) xypt layout, built from the window only
+        xypt = np.stack((window["x"], window["y"], window["p"], t_data), axis=1).astype(np.int32)
         tbins = self._T * 1000 // self._deltat
         if self.data_type == "frames":
             # add own preprocessing functions
             if self.prepr == "histo_diff":
                 events = histogram_difference_preprocessing(
-                    sample,
+                    xypt,
                     tbins=tbins,
                     delta_t=self._deltat,
                     h_og=128,
@@ -121,7 +113,7 @@ class DVSGesture(NeuroBenchDataset):
 
             elif self.prepr == "stack":
                 events = stack_preprocessing(
-                    sample,
+                    xypt,
                     delta_t=self._deltat,
                     tbins=tbins,
                     h_og=128,
@@ -130,8 +122,54 @@ class DVSGesture(NeuroBenchDataset):
                 )
                 return events, label
 
+        sample = torch.from_numpy(xypt.astype(np.int64))
         return sample, label
 
+    def get_window(self, structured_array):
+        """ Selects the events of a sample window, as a view of the sorted event array.
+
+        The window starts at time 0, or at a random time if random_window is set, and
+        includes the events up to and including its end.
+
+        Args:
+            structured_array (np.ndarray): Events of a sample, sorted by time.
+
+        Returns:
+            window (np.ndarray): Slice of structured_array within the window.
+        """
+        t_data = structured_array["t"]
+        t_end = t_data[-1] - self._T * 1000  # latest time at which a window can start (*1000 to convert to microseconds)
+        start_time = np.random.randint(0, t_end) if self.random_window else 0
+        first, last = np.searchsorted(t_data, start_time, side="left"), np.searchsorted(
+            t_data, start_time + self._T * 1000, side="right"
+        )
+        return structured_array[first:last]
+
+    def collate_fn(self, output="frames", mode="stack", downsample=1, channels=2):
+        """
+        Returns a collate function for DataLoaders over the 'events' data type, using the
+        sample parameters of this dataset.
+
+        Args:
+            output (str): 'frames' for dense frames, 'sparse' for a sparse COO tensor,
+                'packed' for binary frames as PackedSpikes.
+            mode (str): 'stack' for binary frames, 'histogram' for event counts.
+            downsample (int): Factor by which the frame resolution is reduced.
+            channels (int): Number of channels of each frame, polarities fill the first two.
+
+        Returns:
+            collate (callable): A collate function for torch.utils.data.DataLoader.
+        """
+        return partial(
+            collate_events,
+            output=output,
+            mode=mode,
+            delta_t=self._deltat,
+            tbins=self._T * 1000 // self._deltat,
+            downsample=downsample,
+            channels=channels,
+        )
+
     def set_sample_params(self, delta_t=5, length=1700, random_window=False):
         """
         Sets sample parameters used if frames are created from events.
@@ -146,6 +184,83 @@ class DVSGesture(NeuroBenchDataset):
         self.random_window = random_window
 
 
+def collate_events(batch, output="frames", mode="stack", delta_t=5000, tbins=340, h_og=128, w_og=128,
+                   downsample=1, channels=2):
+    """
+    Collates samples of compact events into a batch of frames, directly at reduced resolution.
+
+    An event at time t falls into frame t // delta_t, i.e. frame k covers the half-open window
+    [k * delta_t, (k + 1) * delta_t), and events past the last frame are dropped. This differs
+    from stack_preprocessing and histogram_difference_preprocessing, whose windows are closed:
+    an event at t = k * delta_t with k > 0 is counted in both frames k - 1 and k there, and only
+    in frame k here. Apart from these boundary events, 'stack' mode gives the frames of
+    stack_preprocessing. Positive events go to channel 0 and negative events to channel 1, and
+    frames are indexed as [x, y] like in stack_preprocessing. Downsampling averages each
+    downsample x downsample block of pixels, which matches applying AvgPool to the full
+    resolution frames.
+
+    Args:
+        batch (list): List of (events, label), where events is a structured array with fields x, y, p, t.
+        output (str): 'frames' for a dense float32 tensor, 'sparse' for a sparse COO tensor,
+            'packed' for PackedSpikes with 1 bit per pixel and frame, which requires stack mode
+            without downsampling.
+        mode (str): 'stack' sets a pixel to 1 if at least one event occurred, 'histogram' counts events.
+        delta_t (int): Duration of a frame in microseconds.
+        tbins (int): Number of frames.
+        h_og (int): Number of pixels in height.
+        w_og (int): Number of pixels in width.
+        downsample (int): Factor by which the frame resolution is reduced.
+        channels (int): Number of channels of each frame, at least 2.
+
+    Returns:
+        frames (tensor): Tensor of shape (batch, tbins, channels, h_og // downsample, w_og // downsample).
+        labels (tensor): Tensor of labels.
+    """
+    if output == "packed" and (mode != "stack" or downsample != 1):
+        raise ValueError("output 'packed' requires binary frames, mode 'stack' without downsampling")
+    h, w = h_og // downsample, w_og // downsample
+    shape = (len(batch), tbins, channels, h, w)
+
+    sample_idx = np.repeat(np.arange(len(batch)), [len(events) for events, _ in batch])
+    events = np.concatenate([events for events, _ in batch])
+    tbin = events["t"] // delta_t
+    valid = tbin < tbins
+    sample_idx, events, tbin = sample_idx[valid], events[valid], tbin[valid]
+
+    channel = (~events["p"]).astype(np.int64)
+    if mode == "stack":
+        # one event per full resolution pixel and frame
+        full_idx = np.ravel_multi_index((sample_idx, tbin, channel, events["x"], events["y"]),
+                                        (len(batch), tbins, 2, h_og, w_og))
+        sample_idx, tbin, channel, x, y = np.unravel_index(np.unique(full_idx), (len(batch), tbins, 2, h_og, w_og))
+    elif mode == "histogram":
+        x, y = events["x"], events["y"]
+    else:
+        raise ValueError("mode should be 'stack' or 'histogram'")
+
+    x, y = x // downsample, y // downsample
+    keep = (x < h) & (y < w)
+    idx, counts = np.unique(
+        np.ravel_multi_index((sample_idx[keep], tbin[keep], channel[keep], x[keep], y[keep]), shape),
+        return_counts=True,
+    )
+    values = torch.from_numpy(counts.astype(np.float32) / downsample**2)
+    labels = torch.stack([torch.as_tensor(label) for _, label in batch])
+
+    if output == "sparse":
+        indices = torch.from_numpy(np.stack(np.unravel_index(idx, shape)))
+        return torch.sparse_coo_tensor(indices, values, shape).coalesce(), labels
+    elif output == "frames":
+        frames = torch.zeros(shape, dtype=torch.float32)
+        frames.view(-1)[torch.from_numpy(idx)] = values
+        return frames, labels
+    elif output == "packed":
+        frames = torch.zeros(shape, dtype=torch.bool)
+        frames.view(-1)[torch.from_numpy(idx)] = True
+        return PackedSpikes.pack(frames), labels
+    raise ValueError("output should be 'frames', 'sparse' or 'packed'")
+
+
 def stack_preprocessing(
     xypt, delta_t=5000, tbins=200, h_og=128, w_og=128, channels=3, display_frame=False
 ):
@@ -178,14 +293,7 @@ def stack_preprocessing(
         frame[1, :, :][neg_pol[:, 0], neg_pol[:, 1]] = 1
 
     if display_frame:
-        frame = frame.astype(float) / np.max(frame) 
-
-        animation = FuncAnimation(
-            fig, update, frames=tbins, fargs=(frames,), interval=delta_t/1000
-        )  
-        animation.save("test.gif")
-        plt.suptitle('Stack preprocessing')
-        plt.show()
+        animate(frames, "Stack preprocessing", "test.gif", interval=delta_t/1000)
 
     return frames
 
@@ -235,31 +343,38 @@ def histogram_difference_preprocessing(xypt, delta_t=5000, tbins=200, h_og=128,
         frame[1, :, :][neg_pol[:, 0], neg_pol[:, 1]] = -neg_pol[:,2] # avoid clipping between [0,1]
 
     if display_frame:
-        frame = frame.astype(float) / np.max(frame) 
-        
-        animation = FuncAnimation(
-            fig, update, frames=tbins, fargs=(histogram,), interval=5
-        )  
-        animation.save("waving_hand.gif", fps=1 / (5e-3))
-        
-        plt.suptitle('Histogram difference method')
-        plt.show()
+        animate(histogram, "Histogram difference method", "waving_hand.gif", interval=5, fps=1 / (5e-3))
 
     return histogram
 
 
-fig, ax = plt.subplots()
-
-
-def update(frame, frames):
+def animate(frames, title, filename, interval=5, **save_kwargs):
     """
-    Helper function for animation. 
+    Creates an animation of event frames, saves it to filename and shows it. Requires matplotlib.
+
+    Args:
+        frames (np.ndarray): Frames of shape (tbins, channels, h, w).
+        title (str): Title of the figure.
+        filename (str): Output file of the animation.
+        interval (float): Delay between frames in milliseconds.
+        **save_kwargs: Keyword arguments for FuncAnimation.save.
     """
-    ax.clear()
-    image = frames[frame].transpose(1, 2, 0)
+    plt = _optional_import("matplotlib.pyplot", "matplotlib")
+    FuncAnimation = _optional_import("matplotlib.animation", "matplotlib").FuncAnimation
+
+    fig, ax = plt.subplots()
+
+    def update(frame):
+        ax.clear()
+        image = frames[frame].transpose(1, 2, 0)
+
+        ax.imshow(image, cmap="brg")  # You can adjust the colormap as needed
+        ax.set_title(f"Frame {frame}")
 
-    ax.imshow(image, cmap="brg")  # You can adjust the colormap as needed
-    ax.set_title(f"Frame {frame}")
+    animation = FuncAnimation(fig, update, frames=len(frames), interval=interval)
+    animation.save(filename, **save_kwargs)
+    plt.suptitle(title)
+    plt.show()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,22 @@
-from .dataset import *
-from ..utils import _lazy_import
+from ..utils import _lazy_import, _lazy_getattr
+
+# names exported by the former `from .dataset import *`
+__getattr__ = _lazy_getattr("neurobench.datasets", {"NeuroBenchDataset": ".dataset", "Dataset": ".dataset"})
 
 def SpeechCommands(*args, **kwargs):
     return _lazy_import("neurobench.datasets", ".speech_commands", "SpeechCommands")(*args, **kwargs)
 
+def PackedSpeechCommands(*args, **kwargs):
+    return _lazy_import("neurobench.datasets", ".speech_commands", "PackedSpeechCommands")(*args, **kwargs)
+
 def PrimateReaching(*args, **kwargs):
     return _lazy_import("neurobench.datasets", ".primate_reaching", "PrimateReaching")(*args, **kwargs)
 
 def MegapixelAutomotive(*args, **kwargs):
-    return _lazy_import("neurobench.datasets", ".megapixel_automotive", "MegapixelAutomotive")(*args, **kwargs)
+    return _lazy_import("neurobench.datasets", ".megapixel_automotive", "Gen4DetectionDataLoader")(*args, **kwargs)
+
+def Gen4Histograms(*args, **kwargs):
+    return _lazy_import("neurobench.datasets", ".gen4_histograms", "Gen4Histograms")(*args, **kwargs)
 
 def DVSGesture(*args, **kwargs):
     return _lazy_import("neurobench.datasets", ".DVSGesture_loader", "DVSGesture")(*args, **kwargs)
@@ -0,0 +1,277 @@
+import glob
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, DataLoader, get_worker_info
+from ..utils import _optional_import
+
+FOLDERS = {"training": "train", "validation": "val", "testing": "test"}
+DEFAULT_LABEL_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "label_map_dictionary.json")
+
+
+class Gen4Histograms(IterableDataset):
+    """ Sequential streaming dataset for the Prophesee Gen4 precomputed histograms.
+
+    Reads the h5 histogram files directly with h5py, without the Metavision SDK.
+    Recordings are hours long, so they are not split into independent samples:
+    the dataset keeps batch_size concurrent streams, each reading its
+    recordings in chunks of num_tbins time bins. When a recording ends, the
+    next one is started in the same batch row, so a stateful model can carry
+    its memory along each row and reset it where keep_memory is 0.
+
+    Each item is a whole batch (frames, targets, info):
+        frames (torch.Tensor): (batch_size, num_tbins, channels, height, width) float
+            histograms, clipped at max_incr_per_pixel and scaled to [0, 1].
+        targets (list): for each row, a list of num_tbins float tensors of shape
+            (boxes, 5) holding [x1, y1, x2, y2, class index] of the boxes of a time bin.
+        info (dict): "keep_memory", a (batch_size,) float tensor which is 0 on the
+            first chunk of a recording; "valid", a (batch_size,) bool tensor which is
+            False for padding rows once the recordings run out, which Benchmark
+            does not score; "labeled", a
+            (batch_size, num_tbins) bool tensor of the time bins with boxes.
+
+    Files are assigned to rows up front, from the number of time bins of each
+    file, so that all rows finish at about the same time. Using
+    create_dataloader, the rows are sharded over worker processes, each worker
+    always reading the same contiguous block of rows.
+    """
+    def __init__(
+        self,
+        dataset_path="data/Gen 4 Histograms",
+        split="testing",
+        label_map_path=DEFAULT_LABEL_MAP,
+        batch_size: int = 4,
+        num_tbins: int = 12,
+        channels=2,
+        height=360,
+        width=640,
+        max_incr_per_pixel=5,
+        class_selection=["pedestrian", "two wheeler", "car"],
+        min_box_diag=60,
+    ):
+        """ Initializes the Gen4Histograms dataset.
+
+        Only the headers of the h5 files are read here.
+
+        Args:
+            dataset_path: path to the dataset folder, holding the train, val and test folders
+            split: split to use, can be 'training', 'validation' or 'testing'
+            label_map_path: path to the label_map_dictionary.json file
+            batch_size: number of concurrent streams
+            num_tbins: number of time bins in a chunk
+            channels: number of channels in the input data, 2 by default for histograms
+            height: height of the input data
+            width: width of the input data
+            max_incr_per_pixel: event count at which histogram values saturate
+            class_selection: list of classes to use, class indices follow this order
+            min_box_diag: boxes with a smaller diagonal in pixels are discarded
+        """
+        h5py = _optional_import("h5py")
+
+        self.dataset_path = dataset_path
+        self.split = split
+        self.files = sorted(glob.glob(os.path.join(dataset_path, FOLDERS[split], "*.h5")))
+        self.batch_size = batch_size
+        self.num_tbins = num_tbins
+        self.channels = channels
+        self.height = height
+        self.width = width
+        self.max_incr_per_pixel = max_incr_per_pixel
+        self.min_box_diag = min_box_diag
+
+        with open(label_map_path) as f:
+            label_map = json.load(f)
+        self.class_lookup = {int(idx): class_selection.index(name) for idx, name in label_map.items() if name in class_selection}
+
+        self.lengths = []
+        self.delta_t = []
+        for filepath in self.files:
+            with h5py.File(filepath, "r") as f:
+                data = f["data"]
+                if tuple(data.shape[1:]) != (channels, height, width):
+                    raise ValueError(f"Expected histograms of shape {(channels, height, width)}, got {data.shape[1:]} in {filepath}")
+                self.lengths.append(data.shape[0])
+                self.delta_t.append(int(data.attrs["delta_t"]))
+
+    def __len__(self):
+        """ Returns the number of valid rows yielded, i.e. of chunks of all recordings.
+
+        Padding rows are not counted, so that data metrics averaged over the
+        dataset are not diluted by them.
+
+        Returns:
+            int: number of chunks.
+        """
+        return sum(self._chunks(idx) for idx in range(len(self.files)))
+
+    def num_batches(self):
+        """ Number of batches in an epoch.
+
+        Returns:
+            int: number of chunks of the longest row.
+        """
+        return max((sum(self._chunks(idx) for idx in row) for row in self._schedule()), default=0)
+
+    def __iter__(self):
+        """ Iterates over the batches of this process' shard of the rows.
+        """
+        worker_info = get_worker_info()
+        worker, num_workers = (worker_info.id, worker_info.num_workers) if worker_info else (0, 1)
+        if self.batch_size % num_workers:
+            raise ValueError(f"batch_size {self.batch_size} is not divisible by num_workers {num_workers}")
+        rows_per_worker = self.batch_size // num_workers
+
+        rows = self._schedule()[worker * rows_per_worker:(worker + 1) * rows_per_worker]
+        streams = [_Stream(self, row) for row in rows]
+        try:
+            for _ in range(self.num_batches()):
+                yield self._batch(streams)
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def create_dataloader(self, num_workers=0, prefetch_factor=2, pin_memory=False):
+        """ Creates a loader reading the streams in parallel worker processes.
+
+        Each worker reads batch_size // num_workers rows. The sub-batches of all
+        workers are concatenated, so that the rows keep their position in the batch.
+
+        Args:
+            num_workers: number of worker processes, batch_size must be divisible by it.
+            prefetch_factor: number of sub-batches loaded in advance by each worker.
+            pin_memory: copy frames into pinned memory.
+        Returns:
+            loader: iterable of (frames, targets, info) batches, with len() and a dataset attribute.
+        """
+        return _StreamLoader(self, num_workers, prefetch_factor, pin_memory)
+
+    def _schedule(self):
+        """ Assigns the files to the rows, longest first, each file going to the row that finishes first.
+
+        Returns:
+            list: for each row, the list of its file indices.
+        """
+        rows = [[] for _ in range(self.batch_size)]
+        ends = [0] * self.batch_size
+        for idx in sorted(range(len(self.files)), key=lambda idx: -self.lengths[idx]):
+            row = int(np.argmin(ends))
+            rows[row].append(idx)
+            ends[row] += self._chunks(idx)
+        return rows
+
+    def _chunks(self, idx):
+        return -(-self.lengths[idx] // self.num_tbins)
+
+    def _batch(self, streams):
+        """ Reads the next chunk of every stream into a batch.
+        """
+        frames = torch.zeros((len(streams), self.num_tbins, self.channels, self.height, self.width))
+        keep_memory = torch.zeros(len(streams))
+        valid = torch.zeros(len(streams), dtype=torch.bool)
+        labeled = torch.zeros((len(streams), self.num_tbins), dtype=torch.bool)
+        targets = []
+        for row, stream in enumerate(streams):
+            chunk = stream.next_chunk()
+            if chunk is None:
+                targets.append([torch.zeros((0, 5))] * self.num_tbins)
+                continue
+            data, boxes, keep_memory[row] = chunk
+            frames[row, :len(data)].copy_(torch.from_numpy(data)).clamp_(max=self.max_incr_per_pixel).div_(self.max_incr_per_pixel)
+            valid[row] = True
+            labeled[row] = torch.tensor([len(b) > 0 for b in boxes])
+            targets.append(boxes)
+        return frames, targets, {"keep_memory": keep_memory, "valid": valid, "labeled": labeled}
+
+    def load_boxes(self, idx):
+        """ Loads the selected boxes of a file.
+
+        A box with timestamp ts belongs to the time bin ending at or after ts.
+
+        Args:
+            idx: file index.
+        Returns:
+            tbins (np.ndarray): sorted time bin index of each box.
+            boxes (torch.Tensor): (boxes, 5) float tensor of [x1, y1, x2, y2, class index].
+        """
+        events = np.load(os.path.splitext(self.files[idx])[0] + "_bbox.npy")
+        lookup = np.full(256, -1)
+        for class_id, class_idx in self.class_lookup.items():
+            lookup[class_id] = class_idx
+        classes = lookup[events["class_id"]]
+        keep = (classes >= 0) & (np.hypot(events["w"], events["h"]) >= self.min_box_diag)
+        events, classes = events[keep], classes[keep]
+
+        tbins = (events["ts"].astype(np.int64) - 1) // self.delta_t[idx]
+        order = np.argsort(tbins, kind="stable")
+        boxes = np.stack((events["x"], events["y"], events["x"] + events["w"], events["y"] + events["h"], classes), axis=1)
+        return tbins[order], torch.from_numpy(boxes[order].astype(np.float32))
+
+
+class _Stream():
+    """ Sequential reader of the files of one batch row.
+    """
+    def __init__(self, dataset, files):
+        self.dataset = dataset
+        self.files = list(files)
+        self.file = None
+
+    def next_chunk(self):
+        """ Returns (data, boxes, keep_memory) of the next chunk, or None at the end.
+        """
+        h5py = _optional_import("h5py")
+
+        keep_memory = 1.
+        if self.file is None or self.start >= self.data.shape[0]:
+            self.close()
+            if not self.files:
+                return None
+            idx = self.files.pop(0)
+            self.file = h5py.File(self.dataset.files[idx], "r")
+            self.data = self.file["data"]
+            self.tbins, self.boxes = self.dataset.load_boxes(idx)
+            self.start = 0
+            keep_memory = 0.
+
+        end = self.start + self.dataset.num_tbins
+        data = self.data[self.start:end]
+        bounds = np.searchsorted(self.tbins, np.arange(self.start, end + 1))
+        boxes = [self.boxes[first:last] for first, last in zip(bounds[:-1], bounds[1:])]
+        self.start = end
+        return data, boxes, keep_memory
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class _StreamLoader():
+    """ Concatenates the sub-batches of the workers of a DataLoader.
+    """
+    def __init__(self, dataset, num_workers, prefetch_factor, pin_memory):
+        self.dataset = dataset
+        self.num_workers = num_workers
+        kwargs = {"prefetch_factor": prefetch_factor} if num_workers > 0 else {}
+        self.loader = DataLoader(dataset, batch_size=None, num_workers=num_workers, pin_memory=pin_memory, **kwargs)
+
+    def __len__(self):
+        return self.dataset.num_batches()
+
+    def __iter__(self):
+        # the DataLoader yields one sub-batch of every worker in turn
+        parts = []
+        for part in self.loader:
+            parts.append(part)
+            if len(parts) < max(self.num_workers, 1):
+                continue
+            if len(parts) == 1:
+                yield parts[0]
+            else:
+                yield (
+                    torch.cat([frames for frames, _, _ in parts]),
+                    [row for _, targets, _ in parts for row in targets],
+                    {key: torch.cat([info[key] for _, _, info in parts]) for key in parts[0][2]},
+                )
+            parts = []
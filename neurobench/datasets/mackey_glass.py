@@ -2,7 +2,7 @@ from neurobench.datasets.dataset import Dataset
 import numpy as np
 import torch
 import math
-from jitcdde import jitcdde, y, t, jitcdde_lyap
+from ..utils import _optional_import
 
 
 class MackeyGlass(Dataset):
@@ -61,6 +61,8 @@ class MackeyGlass(Dataset):
         self.maxtime_pts = self.traintime_pts + self.testtime_pts + 1 # eval one past the end
 
         # Specify the system using the provided parameters
+        jitcdde = _optional_import("jitcdde")
+        y, t = jitcdde.y, jitcdde.t
         self.mackeyglass_specification = [ self.beta * y(0,t-self.tau) / (1 + y(0,t-self.tau)**self.nmg) - self.gamma*y(0) ]
 
         # Generate time-series
@@ -76,7 +78,7 @@ class MackeyGlass(Dataset):
         np.random.seed(self.seed_id)
 
         # Create the equation object based on the settings
-        self.DDE = jitcdde_lyap(self.mackeyglass_specification)
+        self.DDE = _optional_import("jitcdde").jitcdde_lyap(self.mackeyglass_specification)
         self.DDE.constant_past([self.constant_past])
         self.DDE.step_on_discontinuities()
 
@@ -1,8 +1,10 @@
 from pathlib import Path
 from functools import partial
-from metavision_ml.data import box_processing as box_api
-from metavision_ml.data import SequentialDataLoader
 import glob
+from ..utils import _optional_import
+
+box_api = _optional_import("metavision_ml.data.box_processing", "metavision_ml (Prophesee Metavision SDK)")
+SequentialDataLoader = _optional_import("metavision_ml.data", "metavision_ml (Prophesee Metavision SDK)").SequentialDataLoader
 
 
 class Gen4DetectionDataLoader(SequentialDataLoader):
@@ -4,8 +4,7 @@ import os
 import torch
 import math
 import numpy as np
-import h5py
-from scipy.signal import convolve2d
+from ..utils import _optional_import
 
 # The spikes recorded in the Primate Reaching datasets have an interval of 4ms.
 SAMPLING_RATE = 4e-3
@@ -121,6 +120,9 @@ class PrimateReaching(NeuroBenchDataset):
             Load the data from the matlab file and spike data 
             if spike data has been processed and stored already
         """
+        h5py = _optional_import("h5py")
+        convolve2d = _optional_import("scipy.signal", "scipy").convolve2d
+
         # Assume input is the original dataset, instead of the reconstructed one
         if ".mat" in self.filename:
             file_path = os.path.join(self.path, self.filename)
@@ -1,9 +1,14 @@
 import torch
 import os
-from glob import glob
+import wave
+import numpy as np
 from torchaudio.datasets import SPEECHCOMMANDS
 from .dataset import NeuroBenchDataset
 
+FOLDER_IN_ARCHIVE = os.path.join("SpeechCommands", "speech_commands_v0.02")
+EXCEPT_FOLDER = "_background_noise_"
+SAMPLE_RATE = 16000
+
 class SpeechCommands(NeuroBenchDataset, SPEECHCOMMANDS):
     """ Speech commands dataset v0.02 with 35 keywords.
 
@@ -22,39 +27,38 @@ class SpeechCommands(NeuroBenchDataset, SPEECHCOMMANDS):
         self.truncate_or_pad_to_1s = truncate_or_pad_to_1s
 
         # convert labels to indices
-        self.labels = sorted(glob("*/", root_dir=os.path.join(path, "SpeechCommands", "speech_commands_v0.02")))
-        # subtract 1 to account for _background_noise_
-        self.labels = {key[:-1]: idx-1 for idx, key in enumerate(self.labels)}
+        self.labels = label_index(path)
+        # label index of every sample, from the keyword folders without reading the audio
+        self.targets = np.array([self.labels[os.path.basename(os.path.dirname(filepath))] for filepath in self._walker], dtype=np.int64)
 
     def __getitem__(self, idx):
         """ Getter method for dataset.
 
-        Args:  
+        Args:
             idx (int): index of sample to return
         Returns:
             waveform (torch.Tensor): waveform of audio sample
             label (torch.Tensor): label index of audio sample
         """
         waveform, sample_rate, label, speaker_id, utterance_num =  SPEECHCOMMANDS.__getitem__(self, idx)
+        waveform = waveform.reshape(-1)
         if self.truncate_or_pad_to_1s:
             if waveform.shape[0] > sample_rate:
                 waveform = waveform[:sample_rate]
             else:
-                temp_waveform = torch.zeros((sample_rate,))
-                temp_waveform[:waveform.numel()] = waveform
-                waveform = temp_waveform
+                waveform = torch.nn.functional.pad(waveform, (0, sample_rate - waveform.shape[0]))
 
         waveform = waveform.unsqueeze(-1)
         label = self.label_to_index(label)
 
         return waveform, label
-    
+
     def label_to_index(self, label):
         """ Converts a label to an index.
 
-        Args: 
+        Args:
             label (str): label of audio sample
-        Returns:   
+        Returns:
             torch.Tensor: index of label
         """
         return torch.tensor(self.labels[label])
@@ -65,4 +69,179 @@ class SpeechCommands(NeuroBenchDataset, SPEECHCOMMANDS):
         Returns:
             int: number of samples in dataset
         """
-        return SPEECHCOMMANDS.__len__(self)
\ No newline at end of file
+        return SPEECHCOMMANDS.__len__(self)
+
+
+class PackedSpeechCommands(NeuroBenchDataset):
+    """ Speech commands dataset v0.02 stored in a packed format.
+
+    All waveforms of a subset are concatenated into a single memory-mapped int16
+    array, next to offset, length and label index arrays. The packed arrays are
+    built once from the WAV tree by pack_speech_commands, after which samples
+    and batches are slices of the memory map and no WAV files are opened.
+
+    Indexing with a list of indices returns a whole batch, see create_dataloader.
+    """
+
+    def __init__(self, path, subset:str=None, truncate_or_pad_to_1s=True, packed_path=None):
+        """ Initializes the PackedSpeechCommands dataset, packing the WAV tree if needed.
+
+        Args:
+            path (str): path to the root directory of the dataset, as for SpeechCommands
+            subset (str, optional): one of "training", "validation", or "testing". Defaults to None.
+            truncate_or_pad_to_1s (bool, optional): whether to truncate or pad samples to 1s. Defaults to True.
+            packed_path (str, optional): directory of the packed arrays. Defaults to
+                <path>/SpeechCommands/packed/<subset>.
+        """
+        if packed_path is None:
+            packed_path = os.path.join(path, "SpeechCommands", "packed", subset or "all")
+        if not os.path.exists(os.path.join(packed_path, "index.npz")):
+            pack_speech_commands(path, packed_path, subset)
+
+        self.path = path
+        self.subset = subset
+        self.packed_path = packed_path
+        self.truncate_or_pad_to_1s = truncate_or_pad_to_1s
+
+        self.waveforms = np.load(os.path.join(packed_path, "waveforms.npy"), mmap_mode="r")
+        with np.load(os.path.join(packed_path, "index.npz")) as index:
+            self.offsets = index["offsets"]
+            self.lengths = index["lengths"]
+            self.targets = index["labels"]
+            self.labels = {str(name): idx for idx, name in enumerate(index["label_names"])}
+
+    def __len__(self):
+        """ Returns number of samples in dataset.
+
+        Returns:
+            int: number of samples in dataset
+        """
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        """ Getter method for dataset.
+
+        Args:
+            idx (int or list of int): index of sample to return, or indices of a batch
+        Returns:
+            waveform (torch.Tensor): waveform of audio sample of shape (timesteps, 1), or
+                (batch, timesteps, 1) if idx is a list
+            label (torch.Tensor): label index of audio sample
+        """
+        if np.ndim(idx) > 0:
+            return self.get_batch(idx)
+
+        length = SAMPLE_RATE if self.truncate_or_pad_to_1s else int(self.lengths[idx])
+        waveform = np.zeros(length, dtype=np.float32)
+        self._fill(waveform, idx)
+
+        return torch.from_numpy(waveform).unsqueeze(-1), torch.tensor(int(self.targets[idx]))
+
+    def get_batch(self, indices):
+        """ Returns a batch of samples with a single allocation.
+
+        Without truncation or padding, samples are padded to the longest sample in the batch.
+
+        Args:
+            indices (list of int): indices of the samples in the batch
+        Returns:
+            waveforms (torch.Tensor): waveforms of shape (batch, timesteps, 1)
+            labels (torch.Tensor): label indices of shape (batch,)
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.truncate_or_pad_to_1s:
+            length = SAMPLE_RATE
+        else:
+            length = int(self.lengths[indices].max(initial=0))
+
+        waveforms = np.zeros((len(indices), length), dtype=np.float32)
+        for row, idx in enumerate(indices):
+            self._fill(waveforms[row], idx)
+
+        return torch.from_numpy(waveforms).unsqueeze(-1), torch.from_numpy(self.targets[indices].astype(np.int64))
+
+    def create_dataloader(self, batch_size=256, shuffle=False, drop_last=False, **kwargs):
+        """ Creates a DataLoader that fetches whole batches with get_batch.
+
+        Args:
+            batch_size (int): size of batch being processed
+            shuffle (bool): shuffle data
+            drop_last (bool): drop last batch
+            **kwargs: additional keyword arguments for the DataLoader, e.g. num_workers
+        Returns:
+            DataLoader: loader yielding (waveforms, labels) batches
+        """
+        if shuffle:
+            sampler = torch.utils.data.RandomSampler(self)
+        else:
+            sampler = torch.utils.data.SequentialSampler(self)
+        batch_sampler = torch.utils.data.BatchSampler(sampler, batch_size, drop_last)
+
+        return torch.utils.data.DataLoader(self, sampler=batch_sampler, batch_size=None, **kwargs)
+
+    def _fill(self, out, idx):
+        """ Writes the scaled waveform of sample idx into the start of out.
+        """
+        length = min(int(self.lengths[idx]), out.shape[0])
+        offset = int(self.offsets[idx])
+        np.multiply(self.waveforms[offset:offset + length], 1 / 32768, out=out[:length])
+
+
+def label_index(path):
+    """ Maps the keyword folder names of the dataset to label indices.
+
+    Args:
+        path (str): path to the root directory of the dataset
+    Returns:
+        dict: {label: index}, with labels sorted alphabetically
+    """
+    root = os.path.join(path, FOLDER_IN_ARCHIVE)
+    labels = sorted(entry.name for entry in os.scandir(root) if entry.is_dir() and entry.name != EXCEPT_FOLDER and not entry.name.startswith("."))
+    return {label: idx for idx, label in enumerate(labels)}
+
+
+def pack_speech_commands(path, packed_path, subset:str=None):
+    """ Packs the WAV files of a subset into a memory-mappable format.
+
+    Writes waveforms.npy, the concatenated int16 samples, and index.npz, holding
+    the offsets, lengths and label indices of each sample as well as the label names.
+    Sample order is the same as in SpeechCommands.
+
+    Args:
+        path (str): path to the root directory of the dataset
+        packed_path (str): directory to write the packed arrays to
+        subset (str, optional): one of "training", "validation", or "testing". Defaults to None.
+    """
+    walker = SPEECHCOMMANDS(path, download=True, subset=subset)._walker
+    labels = label_index(path)
+
+    # read headers first to size the output array
+    lengths = np.zeros(len(walker), dtype=np.int32)
+    targets = np.zeros(len(walker), dtype=np.int16)
+    for idx, filepath in enumerate(walker):
+        with wave.open(filepath, "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError(f"Expected 16-bit mono PCM, got {filepath}")
+            lengths[idx] = wav.getnframes()
+        targets[idx] = labels[os.path.basename(os.path.dirname(filepath))]
+    offsets = np.zeros(len(walker), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+
+    os.makedirs(packed_path, exist_ok=True)
+    waveforms = np.lib.format.open_memmap(
+        os.path.join(packed_path, "waveforms.npy"), mode="w+", dtype=np.int16, shape=(int(lengths.sum()),)
+    )
+    for idx, filepath in enumerate(walker):
+        with wave.open(filepath, "rb") as wav:
+            waveforms[offsets[idx]:offsets[idx] + lengths[idx]] = np.frombuffer(wav.readframes(lengths[idx]), dtype="<i2")
+    waveforms.flush()
+    del waveforms
+
+    # index is written last, its presence marks a complete pack
+    np.savez(
+        os.path.join(packed_path, "index.npz"),
+        offsets=offsets,
+        lengths=lengths,
+        labels=targets,
+        label_names=np.array(list(labels.keys())),
+    )
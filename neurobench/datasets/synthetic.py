@@ -0,0 +1,288 @@
+"""
+Synthetic stand-ins for the NeuroBench datasets, for offline load testing.
+
+Each generator writes files in the on-disk layout that the corresponding
+NeuroBench dataset expects, so the regular dataset classes can be pointed at
+the output. Data is random but shaped like the real recordings, and sizes are
+configurable so that throughput and scaling can be measured locally.
+"""
+
+import json
+import os
+import wave
+
+import numpy as np
+
+DVS_GESTURE_CLASSES = 11
+GEN4_CLASSES = ["pedestrian", "two wheeler", "car", "truck", "bus", "traffic sign", "traffic light"]
+
+
+def make_speech_commands(path, labels=None, samples_per_label=20, test_fraction=0.1,
+                         validation_fraction=0.1, variable_length=True, seed=0):
+    """ Writes a WAV tree in the layout of Speech Commands v0.02.
+
+    Clips are 16kHz 16-bit mono. Each keyword is a short harmonic burst with a
+    label dependent pitch, placed at a random offset in background noise.
+    One hour of audio is about 3600 clips, e.g. 35 labels with 103 samples each.
+
+    Args:
+        path (str): Root directory, to be passed as path to SpeechCommands.
+        labels (list of str, optional): Keyword folder names. Defaults to 35 synthetic keywords.
+        samples_per_label (int): Number of clips per keyword.
+        test_fraction (float): Fraction of clips listed in testing_list.txt.
+        validation_fraction (float): Fraction of clips listed in validation_list.txt.
+        variable_length (bool): If True, clip lengths vary between 0.5s and 1s, else all clips are 1s.
+        seed (int): Seed of the random generator.
+    Returns:
+        str: path
+    """
+    rng = np.random.default_rng(seed)
+    labels = labels or [f"keyword{idx:02d}" for idx in range(35)]
+    base = os.path.join(path, "SpeechCommands", "speech_commands_v0.02")
+    os.makedirs(os.path.join(base, "_background_noise_"), exist_ok=True)
+    _write_wav(os.path.join(base, "_background_noise_", "white_noise.wav"),
+               rng.normal(0, 0.1, 16000 * 10))
+
+    files = []
+    t = np.arange(16000) / 16000
+    for label_idx, label in enumerate(labels):
+        os.makedirs(os.path.join(base, label), exist_ok=True)
+        pitch = 150 + 10 * label_idx
+        for sample in range(samples_per_label):
+            length = int(rng.integers(8000, 16001)) if variable_length else 16000
+            burst = int(rng.integers(2000, length // 2 + 1))
+            start = int(rng.integers(0, length - burst + 1))
+
+            audio = rng.normal(0, 0.01, length)
+            envelope = np.hanning(burst)
+            audio[start:start + burst] += envelope * sum(
+                np.sin(2 * np.pi * pitch * harmonic * t[:burst]) / harmonic for harmonic in range(1, 4)
+            ) * 0.3
+
+            name = f"{label}/{sample // 5:08x}_nohash_{sample % 5}.wav"
+            _write_wav(os.path.join(base, name), audio)
+            files.append(name)
+
+    order = rng.permutation(len(files))
+    num_test = int(len(files) * test_fraction)
+    num_validation = int(len(files) * validation_fraction)
+    with open(os.path.join(base, "testing_list.txt"), "w") as f:
+        f.writelines(files[idx] + "\n" for idx in sorted(order[:num_test]))
+    with open(os.path.join(base, "validation_list.txt"), "w") as f:
+        f.writelines(files[idx] + "\n" for idx in sorted(order[num_test:num_test + num_validation]))
+
+    return path
+
+
+def _write_wav(filepath, audio):
+    """ Writes a float waveform in [-1, 1] as 16kHz 16-bit mono PCM.
+    """
+    with wave.open(filepath, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def make_dvs_gesture(path, split="testing", num_recordings=10, events_per_sample=300000,
+                     duration=6000, seed=0):
+    """ Writes event streams in the layout of the tonic DVSGesture dataset.
+
+    Every recording folder holds one sample per gesture class. Events of a
+    sample are generated by a blob of activity moving on a class dependent
+    trajectory over the 128x128 sensor, with uniform background noise. tonic
+    expects at least 100 samples per split, i.e. num_recordings >= 10.
+
+    Args:
+        path (str): Root directory, to be passed as path to DVSGesture.
+        split (str): "training" or "testing".
+        num_recordings (int): Number of user/lighting recordings.
+        events_per_sample (int): Number of events per sample.
+        duration (int): Duration of a sample in milliseconds.
+        seed (int): Seed of the random generator.
+    Returns:
+        str: path
+    """
+    rng = np.random.default_rng(seed)
+    if split == "training":
+        folder, filename = "ibmGestureTrain", "ibmGestureTrain.tar.gz"
+    else:
+        folder, filename = "ibmGestureTest", "ibmGestureTest.tar.gz"
+
+    root = os.path.join(path, "DVSGesture")
+    os.makedirs(root, exist_ok=True)
+    # tonic only checks that the archive exists before falling back to downloading
+    open(os.path.join(root, filename), "a").close()
+
+    for recording in range(num_recordings):
+        recording_dir = os.path.join(root, folder, f"user{recording + 1:02d}_fluorescent")
+        os.makedirs(recording_dir, exist_ok=True)
+        for label in range(DVS_GESTURE_CLASSES):
+            t = np.sort(rng.integers(0, duration, events_per_sample))
+            phase = 2 * np.pi * t / duration * (1 + label % 3) + label
+            radius = 20 + 3 * label
+            x = 64 + radius * np.cos(phase) + rng.normal(0, 6, events_per_sample)
+            y = 64 + radius * np.sin(phase * (1 + label % 2)) + rng.normal(0, 6, events_per_sample)
+
+            noise = rng.random(events_per_sample) < 0.1
+            x[noise] = rng.integers(0, 128, noise.sum())
+            y[noise] = rng.integers(0, 128, noise.sum())
+
+            events = np.stack((
+                np.clip(x, 0, 127),
+                np.clip(y, 0, 127),
+                rng.integers(0, 2, events_per_sample),
+                t,
+            ), axis=1).astype(np.int32)
+            np.save(os.path.join(recording_dir, f"{label}.npy"), events)
+
+    return path
+
+
+def make_primate_reaching(file_path, filename="indy_synthetic.mat", duration=600.0,
+                          num_channels=96, num_units=5, max_rate=30.0, seed=0):
+    """ Writes a MATLAB v7.3 (HDF5) file with the structure of the primate reaching files.
+
+    The file holds `spikes`, a (units, channels) array of references to spike
+    time datasets, `cursor_pos` and `target_pos` of shape (2, timesteps) and
+    the sample times `t` of shape (1, timesteps), sampled every 4ms. The
+    cursor reaches towards targets that change every few seconds, and units
+    are cosine tuned to the cursor velocity.
+
+    Requires h5py.
+
+    Args:
+        file_path (str): Directory of the file, to be passed as file_path to PrimateReaching.
+        filename (str): File name. PrimateReaching expects "indy" or "loco" in the name,
+            with 96 or 192 channels respectively.
+        duration (float): Duration of the recording in seconds.
+        num_channels (int): Number of electrode channels.
+        num_units (int): Number of sorted units per channel.
+        max_rate (float): Maximum firing rate of a unit in Hz.
+        seed (int): Seed of the random generator.
+    Returns:
+        str: path of the written file
+    """
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    dt = 4e-3
+    t = np.arange(0, duration, dt)
+
+    # targets change every 1.5 - 4s, the cursor follows with a time constant of 250ms
+    target_pos = np.zeros((2, len(t)))
+    start = 0
+    while start < len(t):
+        end = start + int(rng.uniform(1.5, 4.0) / dt)
+        target_pos[:, start:end] = rng.uniform(-0.1, 0.1, (2, 1))
+        start = end
+    cursor_pos = np.zeros_like(target_pos)
+    for idx in range(1, len(t)):
+        cursor_pos[:, idx] = cursor_pos[:, idx - 1] + dt / 0.25 * (target_pos[:, idx] - cursor_pos[:, idx - 1])
+    velocity = np.gradient(cursor_pos, dt, axis=1)
+    speed = np.linalg.norm(velocity, axis=0)
+    direction = np.arctan2(velocity[1], velocity[0])
+    speed = speed / max(speed.max(), 1e-12)
+
+    os.makedirs(file_path, exist_ok=True)
+    filepath = os.path.join(file_path, filename)
+    with h5py.File(filepath, "w") as f:
+        refs = np.empty((num_units, num_channels), dtype=h5py.ref_dtype)
+        for unit in range(num_units):
+            preferred = rng.uniform(-np.pi, np.pi, num_channels)
+            baseline = rng.uniform(0.1, 0.5, num_channels)
+            for channel in range(num_channels):
+                rate = max_rate * (baseline[channel] + (1 - baseline[channel]) * speed
+                                   * (1 + np.cos(direction - preferred[channel])) / 2)
+                spikes = t[rng.random(len(t)) < rate * dt] + rng.uniform(0, dt)
+                refs[unit, channel] = f.create_dataset(f"#refs#/{unit}_{channel}", data=spikes[None, :]).ref
+        f.create_dataset("spikes", data=refs)
+        f.create_dataset("cursor_pos", data=cursor_pos)
+        f.create_dataset("target_pos", data=target_pos)
+        f.create_dataset("t", data=t[None, :])
+
+    return filepath
+
+
+def make_gen4_histograms(path, splits=("testing",), num_files=2, duration=60.0, delta_t=50000,
+                         height=360, width=640, event_rate=2e6, boxes_per_frame=5, seed=0):
+    """ Writes precomputed histogram files in the layout of the Prophesee Gen4 histograms dataset.
+
+    Every split folder (train, val, test) holds <name>.h5 files with a `data`
+    dataset of shape (timebins, 2, height, width) of uint8 event counts per
+    polarity, and <name>_bbox.npy files with the bounding boxes. A
+    label_map_dictionary.json is written to the root.
+
+    Requires h5py.
+
+    Args:
+        path (str): Root directory, to be passed as dataset_path to the Gen4 loaders.
+        splits (tuple of str): Splits to write, any of "training", "validation" and "testing".
+        num_files (int): Number of files per split.
+        duration (float): Duration of each file in seconds.
+        delta_t (int): Duration of a time bin in microseconds.
+        height (int): Histogram height.
+        width (int): Histogram width.
+        event_rate (float): Mean event rate of the sensor in events per second.
+        boxes_per_frame (int): Number of moving objects per file.
+        seed (int): Seed of the random generator.
+    Returns:
+        str: path
+    """
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    folders = {"training": "train", "validation": "val", "testing": "test"}
+    num_tbins = int(duration * 1e6 // delta_t)
+    events_per_bin = event_rate * delta_t * 1e-6
+
+    with open(os.path.join(_makedirs(path), "label_map_dictionary.json"), "w") as f:
+        json.dump({str(idx): name for idx, name in enumerate(GEN4_CLASSES)}, f)
+
+    bbox_dtype = np.dtype([("ts", "<u8"), ("x", "<f4"), ("y", "<f4"), ("w", "<f4"), ("h", "<f4"),
+                           ("class_id", "u1"), ("confidence", "<f4"), ("track_id", "<u4")])
+
+    for split in splits:
+        split_dir = _makedirs(os.path.join(path, folders[split]))
+        for file_idx in range(num_files):
+            name = os.path.join(split_dir, f"synthetic_{file_idx:04d}")
+
+            # objects move linearly across the frame with constant size
+            sizes = rng.uniform(20, 120, (boxes_per_frame, 2))
+            starts = rng.uniform(0, 1, (boxes_per_frame, 2)) * (width, height)
+            velocities = rng.normal(0, 20, (boxes_per_frame, 2))
+            classes = rng.integers(0, 3, boxes_per_frame)
+
+            boxes = []
+            with h5py.File(name + ".h5", "w") as f:
+                data = f.create_dataset("data", shape=(num_tbins, 2, height, width), dtype=np.uint8,
+                                        chunks=(1, 2, height, width), compression="gzip")
+                data.attrs["events_to_tensor"] = np.bytes_("histo")
+                data.attrs["delta_t"] = delta_t
+                data.attrs["shape"] = (height, width)
+                for tbin in range(num_tbins):
+                    frame = np.zeros((2, height, width), dtype=np.uint16)
+                    positions = (starts + velocities * tbin * delta_t * 1e-6) % (width, height)
+                    for (x, y), (w, h) in zip(positions, sizes):
+                        x0, y0 = int(x), int(y)
+                        x1, y1 = min(int(x + w), width), min(int(y + h), height)
+                        count = rng.poisson(events_per_bin / (2 * boxes_per_frame))
+                        np.add.at(frame, (rng.integers(0, 2, count), rng.integers(y0, max(y1, y0 + 1), count),
+                                          rng.integers(x0, max(x1, x0 + 1), count)), 1)
+                    count = rng.poisson(events_per_bin / 2)
+                    np.add.at(frame, (rng.integers(0, 2, count), rng.integers(0, height, count),
+                                      rng.integers(0, width, count)), 1)
+                    data[tbin] = np.minimum(frame, 255)
+
+                    ts = (tbin + 1) * delta_t
+                    for track, ((x, y), (w, h), cls) in enumerate(zip(positions, sizes, classes)):
+                        boxes.append((ts, x, y, min(w, width - x), min(h, height - y), cls, 1.0, track))
+
+            np.save(name + "_bbox.npy", np.array(boxes, dtype=bbox_dtype))
+
+    return path
+
+
+def _makedirs(path):
+    os.makedirs(path, exist_ok=True)
+    return path
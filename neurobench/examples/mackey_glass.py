@@ -1,10 +1,10 @@
 import torch
 
-from torch.utils.data import Subset, DataLoader
+from torch.utils.data import Subset
 
 from neurobench.datasets import MackeyGlass
 from neurobench.models import TorchModel
-from neurobench.benchmarks import Benchmark
+from neurobench.benchmarks import ForecastBenchmark
 
 from model_data.echo_state_network import EchoStateNetwork
 
@@ -44,17 +44,22 @@ torch.save(esn, 'neurobench/examples/model_data/esn.pth')
 
 ## Load Model ##
 net = torch.load('neurobench/examples/model_data/esn.pth')
-test_set_loader = DataLoader(test_set, batch_size=2000, shuffle=False)
 
 model = TorchModel(net)
 
 # static_metrics = ["model_size", "connection_sparsity"]
-# data_metrics = ["activation_sparsity", "multiply_accumulates", "MSE"]
 
 static_metrics = ["model_size"]
-data_metrics = ["MSE"]
 
-benchmark = Benchmark(model, test_set_loader, [], [], [static_metrics, data_metrics]) 
+# closed-loop forecast over the whole test horizon, as a single rollout from the
+# first test point, warmed up on the training points before it
+benchmark = ForecastBenchmark(model, mg, starts=[mg.traintime_pts], warmup=warmup_pts, static_metrics=static_metrics)
 results = benchmark.run()
 print(results)
 
+# parallel rollouts from 20 start offsets of the test split, over 4 Lyapunov times each
+horizon = round(4 / mg.lyap_exp / mg.dt)
+starts = torch.linspace(mg.traintime_pts, len(mg) - 1 - horizon, 20).long()
+benchmark = ForecastBenchmark(model, mg, horizon=horizon, starts=starts, warmup=warmup_pts)
+results = benchmark.run()
+print(results["NRMSE"], results["valid_lyapunov_times"])
@@ -146,26 +146,36 @@ class EchoStateNetwork(nn.Module):
         self.prediction_train =  self.Wout(self.reservoir_tr[:,warmup_pts:].T)
 
     def single_forward(self, sample):
-        # Update the reservoir state for the next predicition 
+        return self.step(sample.T)
+
+    ##
+    ## Stepping protocol of the forecasting benchmark, for parallel rollouts
+    ##
+    def reset_state(self, batch_size):
+        # One reservoir state column per rollout
+        self.reservoir = torch.zeros((self.reservoir_size, batch_size),dtype=torch.float64)
+
+    def step(self, samples):
+        # samples has shape (batch, in_channels), one row per rollout
         if self.include_bias:
-            sample_b = torch.concatenate((1*torch.ones((1, 1)), sample,), axis=0)
+            samples_b = torch.concatenate((1*torch.ones((samples.shape[0], 1)), samples,), axis=1)
         else:
-            sample_b = sample       
+            samples_b = samples
 
         # Project input to the reservoir & Update the reservoir
-        x = torch.tanh(self.W(self.reservoir.T) + self.Win(sample_b.T)) 
+        x = torch.tanh(self.W(self.reservoir.T) + self.Win(samples_b))
         self.reservoir = (1-self.leakage)*self.reservoir + self.leakage*x.T
-        
+
         # Include input if applicable
         if self.include_input:
-            x = torch.cat((sample_b,self.reservoir), dim=0)
+            x = torch.cat((samples_b.T,self.reservoir), dim=0)
         else:
             x = self.reservoir
-                
-        # Make predictions based on the current reservoir state
-        prediction = self.Wout(x.T)
 
-        return prediction
+        # Make predictions based on the current reservoir states
+        predictions = self.Wout(x.T)
+
+        return predictions
 
     ##
     ## Forecast with ESN for a batch of inputs
@@ -1,48 +1,75 @@
 #
-# NOTE: This task is still under development.
+# NOTE: This task is still under development. Speech Commands stands in for MSWC,
+# with the 35 keywords split into a base session and incremental sessions.
 #
 
 import torch
+import snntorch as snn
 
-from speech2spikes import S2S
+from torch import nn
+from snntorch import surrogate
+
+from neurobench.datasets import SpeechCommands
+from neurobench.preprocessing import S2SProcessor
 
-from neurobench.datasets import MSWC_FSCIL
 from neurobench.models import NeuroBenchModel
-from neurobench.benchmarks import Benchmark
+from neurobench.benchmarks import FSCILRunner, split_sessions
 
 # seed run
 torch.manual_seed(0)
 
-# TODO: discuss general FSCIL dataloader in subgroup
-
-# iterable loaders
-#   train_loader = MSWC_FSCIL("data/mswc", split="training")
-#   test_loader = MSWC_FSCIL("data/mswc", split="testing")
+train_set = SpeechCommands(path="data/speech_commands/", subset="training")
+test_set = SpeechCommands(path="data/speech_commands/", subset="testing")
 
-# generalized format
-#   mswc = MSWC()
-#   train_loader, test_loader = FSCIL_Loader(mswc, classes=[[base_classes],[ses1],[ses2],...], max_train_samples=..., max_test_samples=...)
+# 15 base classes, then 5 sessions of 4 new classes
+sessions = split_sessions(range(35), num_base=15, num_ways=4)
 
-s2s = S2S()
+beta = 0.9
+spike_grad = surrogate.fast_sigmoid()
+net = nn.Sequential(
+    nn.Flatten(),
+    nn.Linear(20, 256),
+    snn.Leaky(beta=beta, spike_grad=spike_grad, init_hidden=True),
+    nn.Linear(256, 256),
+    snn.Leaky(beta=beta, spike_grad=spike_grad, init_hidden=True),
+)
 
 ## Define model ##
-class SNN_MAML(TorchModel):
+class PrototypeSNN(NeuroBenchModel):
+    """ Nearest class prototype over the spike counts of a frozen SNN feature extractor.
+    """
     def __init__(self, net):
         self.net = net
+        self.prototypes = {}
+
+    def features(self, data):
+        snn.utils.reset(self.net)
+        with torch.no_grad():
+            return torch.stack([self.net(data[:, step]) for step in range(data.shape[1])], dim=1).sum(1)
 
     def __call__(self, data):
-        ...
+        labels = torch.tensor(list(self.prototypes.keys()))
+        prototypes = torch.stack(list(self.prototypes.values()))
+        return labels[torch.cdist(self.features(data), prototypes).argmin(-1)]
+
+    def __net__(self):
+        return self.net
+
+def train(model, batches, session):
+    # the feature extractor is frozen, a session only adds the prototypes of its new classes
+    features = torch.cat([model.features(data) for data, _ in batches])
+    labels = torch.cat([targets for _, targets in batches])
+    for label in labels.unique().tolist():
+        model.prototypes[label] = features[labels == label].mean(0)
 
-net = ...
-model = SNN_MAML(net)
-benchmark = Benchmark(model, test_data, [s2s], ["accuracy", "model_size", "latency", "MACs"])
+model = PrototypeSNN(net)
 
-for session, (train_data, test_data) in enumerate(zip(train_loader, test_loader)):
-    print("Session: {}".format(session))
-    
-    ## train model using train_data ##
-    net = train(net, train_data)
+static_metrics = ["model_size"]
+data_metrics = ["macro_f1"]
 
-    ## run benchmark ##
-    session_results = benchmark.run() # TODO: need to re-instantiate model/benchmark when net changes?
-    print(session_results)
\ No newline at end of file
+# new prototypes may capture samples of old classes, so every session evaluates all seen classes
+runner = FSCILRunner(train_set, test_set, sessions, model, train, [static_metrics, data_metrics],
+                     preprocessors=[S2SProcessor()], shots=5)
+for row in runner.run():
+    print(row)
+runner.to_csv("mswc_fscil.csv")
@@ -2,22 +2,39 @@
 # NOTE: This task is still under development.
 #
 
-from neurobench.datasets import Prophesee1MP
+from neurobench.datasets import Gen4Histograms
+from neurobench.preprocessing import NeuroBenchProcessor
 from neurobench.models import NeuroBenchModel
-from neurobench.benchmarks import Benchmark
+from neurobench.benchmarks import Benchmark, load_sample_log
 
-test_set = Prophesee1MP(..., split="testing")
-
-# Data preprocessors, wrap metavision
-preprocessors = [Preprocessor(), ...]
+# streams the recordings in chunks of 12 time bins, 8 recordings at a time
+test_set = Gen4Histograms("data/Gen 4 Histograms", split="testing", batch_size=8, num_tbins=12)
+test_set_loader = test_set.create_dataloader(num_workers=4, pin_memory=True)
 
 ## Define model ##
 class ObjDetectionModel(NeuroBenchModel):
     def __init__(self, net, box_coder, head):
         ...
 
+    def reset(self, keep_memory):
+        # multiply the recurrent state of each batch row by keep_memory
+        ...
+
     def __call__(self, x):
-    	...
+        # x is (batch, num_tbins, channels, height, width), returns for every row and time bin
+        # a (detections, 6) tensor of [x1, y1, x2, y2, score, class]
+        ...
+
+class ResetMemory(NeuroBenchProcessor):
+    """ Resets the model state of the rows which start a new recording.
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, dataset):
+        frames, targets, info = dataset
+        self.model.reset(info["keep_memory"])
+        return dataset
 
 # load model
 net = ...
@@ -25,10 +42,16 @@ box_coder = ...
 head = ...
 model = ObjDetectionModel(net, box_coder, head)
 
-# metric implementations should also wrap metavision
-metrics = ["mAP", "model_size", "detection_latency", "MACs"]
+preprocessors = [ResetMemory(model)]
 
-# TODO: anything different for batched test set for user side / in Benchmark?
-benchmark = Benchmark(model, test_set, preprocessors, metrics)
-results = benchmark.run()
+static_metrics = ["model_size"]
+data_metrics = ["mAP"]
+
+benchmark = Benchmark(model, test_set_loader, preprocessors, [], [static_metrics, data_metrics])
+# the sample log records the model latency of every chunk, padding rows excluded
+results = benchmark.run(sample_log="obj_detection_log")
 print(results)
+
+# detection latency per time bin
+latency = load_sample_log("obj_detection_log")["latency"]
+print("latency per time bin (s):", latency.mean() / test_set.num_tbins)
@@ -6,3 +6,9 @@ def SNNTorchModel(*args, **kwargs):
 
 def TorchModel(*args, **kwargs):
     return _lazy_import("neurobench.models", ".torch_model", "TorchModel")(*args, **kwargs)
+
+def FusedSNNModel(*args, **kwargs):
+    return _lazy_import("neurobench.models", ".fused_snn", "FusedSNNModel")(*args, **kwargs)
+
+def LayerProfiler(*args, **kwargs):
+    return _lazy_import("neurobench.models", ".profiler", "LayerProfiler")(*args, **kwargs)
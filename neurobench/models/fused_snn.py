@@ -0,0 +1,168 @@
+from functools import lru_cache
+
+import torch
+from torch import nn
+
+from .model import NeuroBenchModel
+from ..preprocessing.packed_spikes import PackedSpikes
+from ..utils import _optional_import
+
+snn = _optional_import("snntorch")
+
+
+class FusedSNNModel(NeuroBenchModel):
+    """ Fused CPU/GPU inference engine for sequential SNNTorch networks of Leaky and Synaptic neurons.
+
+    Instead of stepping every module of the network once per timestep, the
+    network is run layer by layer over the whole sequence: stateless layers,
+    such as Linear, Conv2d and Flatten, process all timesteps of the batch in
+    one call, and the neuron layers run their recurrence over a preallocated
+    (timesteps, batch, ...) buffer with in-place tensor operations. This
+    removes the per-timestep module overhead, which dominates at small batch
+    sizes and for long sequences.
+
+    The results are those of SNNTorchModel on the same network, up to the
+    rounding differences of batching the stateless layers over time. The
+    network must be an nn.Sequential, nested Sequentials included, of
+    snntorch Leaky and Synaptic neurons with init_hidden=True and modules
+    which process every sample independently, such as Linear, Conv2d,
+    pooling, Flatten, and Dropout and BatchNorm in eval mode.
+    """
+    def __init__(self, net):
+        """ Init using a trained network.
+
+        Args:
+            net: A trained SNNTorch network, as an nn.Sequential.
+        """
+        self.net = net
+        self.net.eval()
+        self.layers = _flatten(net)
+        for layer in self.layers:
+            if isinstance(layer, snn.SpikingNeuron):
+                _check_neuron(layer)
+        self.timesteps = None
+        self._buffers = {}
+
+    def __call__(self, data):
+        """ Executes the fused forward pass on data that follows the NeuroBench specification.
+
+        Args:
+            data: A PyTorch tensor of shape (batch, timesteps, ...), or PackedSpikes.
+
+        Returns:
+            spikes: A PyTorch tensor of shape (batch, timesteps, ...)
+        """
+        if isinstance(data, PackedSpikes):
+            data = data.unpack()
+        batch, num_steps = data.shape[:2]
+        self.timesteps = torch.full((batch,), num_steps)
+
+        with torch.no_grad():
+            # time-major, so that every timestep is a contiguous slice
+            x = data.transpose(0, 1).contiguous()
+            for idx, layer in enumerate(self.layers):
+                if isinstance(layer, snn.Synaptic):
+                    x = self._synaptic(idx, layer, x)
+                elif isinstance(layer, snn.Leaky):
+                    x = self._leaky(idx, layer, x)
+                else:
+                    x = layer(x.reshape((num_steps * batch,) + x.shape[2:]))
+                    x = x.reshape((num_steps, batch) + x.shape[1:])
+
+        return x.transpose(0, 1)
+
+    def __net__(self):
+        """ Returns the underlying network.
+        """
+        return self.net
+
+    def _buffer(self, idx, name, like):
+        """ Preallocated state buffer of a layer, reused while the shape of its input does not change.
+        """
+        buffer = self._buffers.get((idx, name))
+        if buffer is None or buffer.shape != like.shape or buffer.dtype != like.dtype or buffer.device != like.device:
+            buffer = torch.empty_like(like)
+            self._buffers[(idx, name)] = buffer
+        return buffer
+
+    def _leaky(self, idx, layer, x):
+        """ Leaky recurrence over all timesteps, as in snntorch's init_hidden forward pass.
+        """
+        beta = layer.beta.clamp(0, 1)
+        threshold = layer.threshold
+        reset_mechanism = int(layer.reset_mechanism_val)
+        spikes = torch.empty_like(x)
+        mem = self._buffer(idx, "mem", x[0]).zero_()
+        reset = self._buffer(idx, "reset", x[0])
+
+        for step in range(x.shape[0]):
+            # the reset uses the membrane of the previous timestep
+            torch.gt(mem, threshold, out=reset)
+            if reset_mechanism == 0:
+                mem.mul_(beta).add_(x[step]).sub_(reset * threshold)
+            elif reset_mechanism == 1:
+                mem.mul_(1 - reset).mul_(beta).add_(x[step])
+            else:
+                mem.mul_(beta).add_(x[step])
+            torch.gt(mem, threshold, out=spikes[step])
+
+        return spikes.mul_(layer.graded_spikes_factor)
+
+    def _synaptic(self, idx, layer, x):
+        """ Synaptic recurrence over all timesteps, as in snntorch's init_hidden forward pass.
+        """
+        alpha = layer.alpha.clamp(0, 1)
+        beta = layer.beta.clamp(0, 1)
+        threshold = layer.threshold
+        reset_mechanism = int(layer.reset_mechanism_val)
+        integrates_current = _synaptic_integrates_current()
+        spikes = torch.empty_like(x)
+        syn = self._buffer(idx, "syn", x[0]).zero_()
+        mem = self._buffer(idx, "mem", x[0]).zero_()
+        reset = self._buffer(idx, "reset", x[0])
+
+        for step in range(x.shape[0]):
+            torch.gt(mem, threshold, out=reset)
+            syn.mul_(alpha).add_(x[step])
+            decayed = mem * beta
+            mem.copy_(decayed).add_(syn if integrates_current else x[step])
+            if reset_mechanism == 0:
+                mem.sub_(reset * threshold)
+            elif reset_mechanism == 1:
+                mem.sub_(reset * (decayed + syn))
+            torch.gt(mem, threshold, out=spikes[step])
+
+        return spikes.mul_(layer.graded_spikes_factor)
+
+
+def _flatten(net):
+    """ Modules of a nested nn.Sequential in execution order.
+    """
+    if not isinstance(net, nn.Sequential):
+        raise TypeError(f"FusedSNNModel requires an nn.Sequential network, got {type(net).__name__}")
+    layers = []
+    for module in net:
+        layers.extend(_flatten(module) if isinstance(module, nn.Sequential) else [module])
+    return layers
+
+def _check_neuron(layer):
+    if type(layer) not in (snn.Leaky, snn.Synaptic):
+        raise NotImplementedError(f"FusedSNNModel does not support {type(layer).__name__} neurons")
+    if not layer.init_hidden:
+        raise ValueError("FusedSNNModel requires neurons with init_hidden=True")
+    if layer.inhibition or layer.state_quant:
+        raise NotImplementedError("FusedSNNModel does not support inhibition or state_quant")
+
+@lru_cache(maxsize=None)
+def _synaptic_integrates_current():
+    """ Whether the installed snntorch adds the synaptic current to the membrane of init_hidden Synaptic neurons.
+
+    Some snntorch versions add the input instead, the engine follows the
+    installed version to match SNNTorchModel.
+    """
+    neuron = snn.Synaptic(alpha=0.5, beta=0.5, threshold=100., init_hidden=True, output=True)
+    with torch.no_grad():
+        neuron(torch.ones(1))
+        _, _, mem = neuron(torch.zeros(1))
+    # syn = 1, then 0.5: the membrane is 1, then 0.5 + 0.5 with the current and 0.5 + 0 with the input
+    return bool(mem.item() > 0.75)
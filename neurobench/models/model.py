@@ -22,4 +22,13 @@ class NeuroBenchModel:
     def __net__(self):
         """ Returns the underlying network
         """
-        raise NotImplementedError("Subclasses of NeuroBenchModel should implement __net__")
\ No newline at end of file
+        raise NotImplementedError("Subclasses of NeuroBenchModel should implement __net__")
+
+    def profile(self, **kwargs):
+        """ Returns a LayerProfiler of the model, recording per-layer costs while used as a context manager.
+
+        Args:
+            **kwargs: Keyword arguments of LayerProfiler, e.g. pj_per_op and pj_per_byte.
+        """
+        from .profiler import LayerProfiler
+        return LayerProfiler(self, **kwargs)
@@ -0,0 +1,189 @@
+import csv
+import itertools
+import time
+
+import torch
+from torch import nn
+
+# Energy proxies of 45 nm CMOS (Horowitz, ISSCC 2014): a 32-bit float
+# multiply-accumulate, and a 32-bit DRAM access per byte
+PJ_PER_OP = 4.6
+PJ_PER_BYTE = 160.
+
+
+class LayerProfiler():
+    """ Per-layer wall time, memory traffic and operation counts of a NeuroBenchModel.
+
+    Forward pre- and post-hooks on every leaf module of the network record,
+    per call, the wall time of the module, the bytes it reads (its input
+    tensors, parameters and buffers) and writes (its output tensors), and its
+    operation count. Linear and convolution layers count one op per
+    multiply-accumulate, other layers one op per output element. Counts
+    accumulate over all calls while profiling, e.g. over a whole benchmark
+    run, until reset.
+
+    The report ranks the layers by cost, with an energy proxy of
+    pj_per_op * ops + pj_per_byte * (bytes read + written). Only module calls
+    are seen: computation outside of modules, such as the neuron recurrences
+    of FusedSNNModel, is not attributed to any layer.
+
+    Use it as a context manager around the runs to profile:
+        with model.profile() as profiler:
+            benchmark.run()
+        print(profiler.report())
+    """
+    def __init__(self, model, pj_per_op=PJ_PER_OP, pj_per_byte=PJ_PER_BYTE, op_counters=None):
+        """
+        Args:
+            model: A NeuroBenchModel.
+            pj_per_op: Energy per op in pJ.
+            pj_per_byte: Energy per byte read or written in pJ.
+            op_counters: Dict mapping module types to functions fn(module, inputs, output)
+                returning the op count of a call, extending or overriding the defaults.
+        """
+        self.model = model
+        self.pj_per_op = pj_per_op
+        self.pj_per_byte = pj_per_byte
+        # user counters are matched first, so that they also apply to subclasses of the default types
+        self.op_counters = dict(op_counters or {})
+        for cls, counter in _OP_COUNTERS.items():
+            self.op_counters.setdefault(cls, counter)
+        self.stats = {}
+        self._handles = []
+        self._starts = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """ Registers the hooks on the leaf modules of the network.
+        """
+        if self._handles:
+            return
+        for name, module in self.model.__net__().named_modules():
+            if next(module.children(), None) is not None:
+                continue
+            name = name or type(module).__name__
+            self.stats.setdefault(name, {
+                "layer": name, "type": type(module).__name__, "calls": 0, "time": 0.0,
+                "bytes_read": 0, "bytes_written": 0, "ops": 0,
+            })
+            self._handles.append(module.register_forward_pre_hook(self._pre_hook(name)))
+            self._handles.append(module.register_forward_hook(self._post_hook(name)))
+
+    def stop(self):
+        """ Removes the hooks, keeping the recorded counts.
+        """
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._starts = {}
+
+    def reset(self):
+        """ Clears the recorded counts.
+        """
+        for stats in self.stats.values():
+            stats.update(calls=0, time=0.0, bytes_read=0, bytes_written=0, ops=0)
+
+    def report(self, sort_by="energy"):
+        """ Per-layer costs, ranked.
+
+        Args:
+            sort_by: Column to rank the layers by, descending, e.g. "energy", "time" or "ops".
+        Returns:
+            list: One dict per called layer, holding "layer", "type", "calls", "time" in
+                seconds, "time_fraction" of the total layer time, "bytes_read",
+                "bytes_written", "ops" and "energy" in pJ.
+        """
+        rows = [dict(stats) for stats in self.stats.values() if stats["calls"] > 0]
+        total_time = sum(row["time"] for row in rows)
+        for row in rows:
+            row["time_fraction"] = row["time"] / total_time if total_time > 0 else 0.0
+            row["energy"] = self.pj_per_op * row["ops"] + self.pj_per_byte * (row["bytes_read"] + row["bytes_written"])
+        if rows and sort_by not in rows[0]:
+            raise ValueError(f"Unknown report column {sort_by}")
+        return sorted(rows, key=lambda row: row[sort_by], reverse=True)
+
+    def to_csv(self, path, sort_by="energy"):
+        """ Writes the ranked report.
+
+        Args:
+            path: Output csv file path.
+            sort_by: Column to rank the layers by, see report.
+        """
+        rows = self.report(sort_by)
+        fields = ["layer", "type", "calls", "time", "time_fraction", "bytes_read", "bytes_written", "ops", "energy"]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def _pre_hook(self, name):
+        def hook(module, inputs):
+            _synchronize(inputs)
+            self._starts[name] = time.perf_counter()
+        return hook
+
+    def _post_hook(self, name):
+        def hook(module, inputs, output):
+            _synchronize(output)
+            elapsed = time.perf_counter() - self._starts.pop(name)
+
+            stats = self.stats[name]
+            stats["calls"] += 1
+            stats["time"] += elapsed
+            state = itertools.chain(module.parameters(recurse=False), module.buffers(recurse=False))
+            stats["bytes_read"] += _nbytes(inputs) + sum(t.numel() * t.element_size() for t in state)
+            stats["bytes_written"] += _nbytes(output)
+            counter = next((fn for cls, fn in self.op_counters.items() if isinstance(module, cls)), _elementwise_ops)
+            stats["ops"] += int(counter(module, inputs, output))
+        return hook
+
+
+def _tensors(value):
+    """ Tensors of a possibly nested tuple, list or dict of outputs.
+    """
+    if torch.is_tensor(value):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _tensors(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _tensors(item)
+
+def _nbytes(value):
+    return sum(t.numel() * t.element_size() for t in _tensors(value))
+
+def _synchronize(value):
+    """ Waits for pending GPU work, so that the wall time covers the kernels of a layer.
+    """
+    if any(t.is_cuda for t in _tensors(value)):
+        torch.cuda.synchronize()
+
+def _first_output(output):
+    return next(_tensors(output), None)
+
+def _linear_ops(module, inputs, output):
+    out = _first_output(output)
+    return out.numel() * module.in_features
+
+def _conv_ops(module, inputs, output):
+    out = _first_output(output)
+    kernel = 1
+    for size in module.kernel_size:
+        kernel *= size
+    return out.numel() * (module.in_channels // module.groups) * kernel
+
+def _elementwise_ops(module, inputs, output):
+    out = _first_output(output)
+    return out.numel() if out is not None else 0
+
+_OP_COUNTERS = {
+    nn.Linear: _linear_ops,
+    nn.modules.conv._ConvNd: _conv_ops,
+}
@@ -1,46 +1,191 @@
-import torch
+from contextlib import contextmanager
 
-from snntorch import utils
+import torch
+from torch import nn
 
 from .model import NeuroBenchModel
+from ..preprocessing.packed_spikes import PackedSpikes
+from ..utils import _optional_import
+
+snn = _optional_import("snntorch")
+utils = _optional_import("snntorch.utils", "snntorch")
+
+# hidden state attributes of snntorch neurons with init_hidden=True, one row per sample
+HIDDEN_STATES = ("mem", "syn", "syn_exc", "syn_inh", "spk", "reset")
 
 class SNNTorchModel(NeuroBenchModel):
     """ The SNNTorch class wraps the forward pass of the SNNTorch framework and ensures that spikes are in the correct 
     format for downstream NeuroBench components.
     """
-    def __init__(self, net):
+    def __init__(self, net, early_exit=None, event_driven=None):
         """ Init using a trained network.
 
         Args:
             net: A trained SNNTorch network.
+            early_exit: An optional exit criterion, e.g. accumulators.EarlyExit, which
+                stops samples before the last timestep once their output is confident.
+            event_driven: Input density below which nn.Linear layers run event-driven:
+                only the weight columns of the inputs which are active in any sample of
+                the batch are gathered and accumulated, so that the cost scales with the
+                activity. Denser inputs use the dense layer. Convolutions always run
+                dense, their density is reported as well. Defaults to dense execution.
         """
         self.net = net
         self.net.eval()
+        self.early_exit = early_exit
+        self.event_driven = event_driven
+        self.timesteps = None
+        self.layer_density = {}
 
     def __call__(self, data):
         """ Executes the forward pass of SNNTorch models on data that follows the
         NeuroBench specification. Ensures spikes are compatible with downstream
         components.
 
+        With event_driven set, self.layer_density holds for every nn.Linear and
+        convolution layer the mean input density over the timesteps, "density",
+        and the fraction of timesteps run event-driven, "event_driven". The
+        density of a Linear layer is the fraction of its input features active
+        in the batch, of a convolution the fraction of non-zero input values.
+
         Args:
-            data: A PyTorch tensor of shape (batch, timesteps, ...)
+            data: A PyTorch tensor of shape (batch, timesteps, ...), or PackedSpikes,
+                which are unpacked one timestep at a time.
 
         Returns:
-            spikes: A PyTorch tensor of shape (batch, timesteps, ...)
+            spikes: A PyTorch tensor of shape (batch, timesteps, ...). With early exit,
+                timesteps is the longest number of timesteps run, and the spikes of a
+                sample are zero after it stopped.
         """
-        spikes = []
         utils.reset(self.net)
+        if self.event_driven is None:
+            return self._forward(data)
+
+        with _event_driven(self.net, self.event_driven) as stats:
+            spikes = self._forward(data)
+        # convolution densities are accumulated on the device and read once here
+        self.layer_density = {name: {"density": float(density) / calls, "event_driven": sparse / calls}
+                              for name, (calls, density, sparse) in stats.items() if calls}
+        return spikes
+
+    def _forward(self, data):
+        if self.early_exit is not None:
+            return self._adaptive_forward(data)
+
+        self.timesteps = torch.full((data.shape[0],), data.shape[1])
         spikes = []
 
         # Data is expected to be shape (batch, timestep, features*)
         for step in range(data.shape[1]):
-            spk_out, _ = self.net(data[:, step, ...])
+            spk_out, _ = self.net(_timestep(data, step))
             spikes.append(spk_out)
         spikes = torch.stack(spikes).transpose(0, 1)
         
         return spikes
 
+    def _adaptive_forward(self, data):
+        """ Forward pass which stops samples once the early exit criterion is met.
+
+        The number of timesteps run for each sample is stored in self.timesteps.
+        Finished samples are removed from the hidden states of the snntorch
+        neurons of the network, see HIDDEN_STATES; other stateful modules are
+        not supported.
+        """
+        batch, num_steps = data.shape[:2]
+        active = torch.arange(batch, device=data.device)
+        self.timesteps = torch.full((batch,), num_steps, device=data.device)
+        spikes = counts = None
+
+        for step in range(num_steps):
+            spk_out, _ = self.net(_timestep(data, step)[active])
+            if spikes is None:
+                spikes = spk_out.new_zeros((batch, num_steps) + spk_out.shape[1:])
+                counts = spk_out.new_zeros((batch,) + spk_out.shape[1:])
+            spikes[active, step] = spk_out
+            counts[active] += spk_out
+
+            done = self.early_exit.done(counts[active].flatten(1), step)
+            if not self.early_exit.per_sample:
+                if done.all():
+                    self.timesteps[:] = step + 1
+                    break
+            elif done.any():
+                self.timesteps[active[done]] = step + 1
+                active = active[~done]
+                if len(active) == 0:
+                    break
+                _select_state(self.net, ~done)
+
+        return spikes[:, :int(self.timesteps.max())]
+
     def __net__(self):
         """ Returns the underlying network.
         """
-        return self.net
\ No newline at end of file
+        return self.net
+
+
+def _timestep(data, step):
+    if isinstance(data, PackedSpikes):
+        return data.timestep(step)
+    return data[:, step, ...]
+
+@contextmanager
+def _event_driven(net, threshold):
+    """ Runs the nn.Linear layers of net event-driven below an input density threshold.
+
+    Yields the per-layer statistics [calls, summed density, event-driven calls].
+    """
+    stats = {}
+    patched = []
+    for name, module in net.named_modules():
+        if isinstance(module, (nn.Linear, nn.Conv1d, nn.Conv2d, nn.Conv3d)):
+            stats[name] = [0, 0., 0]
+            module.forward = _event_forward(module, threshold if isinstance(module, nn.Linear) else None, stats[name])
+            patched.append(module)
+    try:
+        yield stats
+    finally:
+        for module in patched:
+            del module.forward
+
+def _event_forward(module, threshold, stats):
+    dense_forward = type(module).forward.__get__(module)
+    # input-major copy of the weights, so that the weights of the active inputs are contiguous rows
+    weight_t = module.weight.detach().t().contiguous() if threshold is not None else None
+
+    def forward(x):
+        if threshold is None:
+            stats[0] += 1
+            # no host synchronization, the density is only a statistic here
+            stats[1] = stats[1] + x.count_nonzero() / x.numel()
+            return dense_forward(x)
+
+        # an input feature is active if it is non-zero in any sample of the batch
+        active = x.reshape(-1, x.shape[-1]).any(0)
+        density = active.float().mean().item()
+        stats[0] += 1
+        stats[1] += density
+        if density >= threshold:
+            return dense_forward(x)
+
+        stats[2] += 1
+        columns = active.nonzero().squeeze(1)
+        out = x[..., columns] @ weight_t[columns]
+        if module.bias is not None:
+            out += module.bias
+        return out
+    return forward
+
+def _select_state(net, keep):
+    """ Keeps the rows of keep in the hidden states of the snntorch neurons of the network.
+
+    Only the hidden state attributes are sliced, so that parameters and other
+    tensors are left alone even if their first dimension matches the batch.
+    """
+    for module in net.modules():
+        if not isinstance(module, snn.SpikingNeuron):
+            continue
+        for name in HIDDEN_STATES:
+            value = getattr(module, name, None)
+            if isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == keep.shape[0]:
+                setattr(module, name, value[keep])
@@ -1,5 +1,7 @@
 from .preprocessor import *
-from ..utils import _lazy_import
+from ..utils import _lazy_import, _lazy_getattr
+
+__getattr__ = _lazy_getattr("neurobench.preprocessing", {"PackedSpikes": ".packed_spikes"})
 
 def S2SProcessor(*args, **kwargs):
     return _lazy_import("neurobench.preprocessing", ".speech2spikes", "S2SProcessor")(*args, **kwargs)
@@ -1,12 +1,21 @@
 from . import NeuroBenchProcessor
+from ..utils import _torch_threads
 from torchaudio.transforms import MFCC
+import copy
+
 import torch
 
 
 class MFCCProcessor(NeuroBenchProcessor):
-    """ Does MFCC computation on dataset using torchaudio.transforms.MFCC.
+    """ Does MFCC computation on dataset using the filterbanks of torchaudio.transforms.MFCC.
     Call expects loaded .wav data and targets as a tuple (data, targets).
     Expects sample_rate to be the same for all samples in data.
+
+    The mel filterbank and DCT matrix are built once at init and applied as
+    matmuls on the power spectrogram. They are computed on the device of the
+    data, with copies of the matrices and the spectrogram window cached per device. If data is a list of clips with
+    different lengths, clips are grouped into buckets of similar padded length
+    so that short clips are not padded up to the longest clip of the batch.
     """
     def __init__(
         self,
@@ -16,6 +25,8 @@ class MFCCProcessor(NeuroBenchProcessor):
         norm: str = "ortho",
         log_mels: bool = False,
         melkwargs: dict = None,
+        bucket_width: int = 1600,
+        num_threads: int = None,
     ):
         super(NeuroBenchProcessor).__init__()
         """
@@ -26,13 +37,19 @@ class MFCCProcessor(NeuroBenchProcessor):
             norm (str, optional): Norm to use. (Default: "ortho")
             log_mels (bool, optional): Whether to use log-mel spectrograms instead of db-scaled. (Default: False)
             melkwargs (dict or None, optional): Arguments for MelSpectrogram. (Default: None)
+            bucket_width (int, optional): Granularity in samples of the padded lengths that
+                list inputs are bucketed into. (Default: 1600)
+            num_threads (int or None, optional): Number of CPU threads used by torch during
+                the computation. If None, the current torch setting is used. (Default: None)
         """
         self.sample_rate = sample_rate
         self.n_mfcc = n_mfcc
-        self.dct_type = 2
+        self.dct_type = dct_type
         self.norm = norm
         self.log_mels = log_mels
         self.melkwargs = melkwargs
+        self.bucket_width = bucket_width
+        self.num_threads = num_threads
 
         self.mfcc = MFCC(
             sample_rate=self.sample_rate,
@@ -43,25 +60,111 @@ class MFCCProcessor(NeuroBenchProcessor):
             melkwargs=self.melkwargs,
         )
 
+        # precomputed matrices, reused for every batch
+        self._spectrogram = self.mfcc.MelSpectrogram.spectrogram
+        self._mel_fb = self.mfcc.MelSpectrogram.mel_scale.fb # (n_freqs, n_mels)
+        self._dct_mat = self.mfcc.dct_mat # (n_mels, n_mfcc)
+        self._top_db = self.mfcc.top_db
+        self._hop_length = self._spectrogram.hop_length
+        self._center = self._spectrogram.center
+        self._n_fft = self._spectrogram.n_fft
+        self._device_cache = {}
+
     def __call__(self, dataset):
         """ Executes the MFCC computation on the dataset.
 
         Args:
-            dataset (tuple): A tuple of (data, targets).
+            dataset (tuple): A tuple of (data, targets). data is either a tensor
+                of shape (..., time) or a list of 1D clips, which may differ in length.
 
         Returns:
-            results: mfcc applied on data
+            results: mfcc applied on data, of shape (..., n_mfcc, frames)
             targets: targets from dataset
         """
         self.dataset_validity_check(dataset)
 
         data, targets = dataset
-        if isinstance(data, list):
-            data = torch.vstack(data)
+        with _torch_threads(self.num_threads), torch.no_grad():
+            if isinstance(data, list):
+                results = self._bucketed_mfcc(data)
+            else:
+                results = self._mfcc(data)
+
+        return results, targets
+
+    def _mfcc(self, waveform):
+        """ MFCC of a tensor of shape (..., time), returns (..., n_mfcc, frames).
+
+        The decibel cut-off (top_db) is computed per sample of the first dimension,
+        so that a sample's features do not depend on the rest of its batch.
+        """
+        spectrogram, mel_fb, dct_mat = self._transforms(waveform.device)
+        spec = spectrogram(waveform) # (..., n_freqs, frames)
+        mel = torch.matmul(spec.transpose(-1, -2), mel_fb) # (..., frames, n_mels)
+        del spec
+
+        if self.log_mels:
+            mel.add_(1e-6).log_()
+        else:
+            # power to dB with reference 1.0, same as torchaudio's AmplitudeToDB
+            mel.clamp_(min=1e-10).log10_().mul_(10.0)
+            if mel.dim() > 2:
+                flat = mel.view(mel.shape[0], -1)
+                torch.maximum(flat, (flat.amax(dim=1, keepdim=True) - self._top_db), out=flat)
+            else:
+                mel.clamp_(min=(mel.max() - self._top_db).item())
+
+        return torch.matmul(mel, dct_mat).transpose(-1, -2)
+
+    def _transforms(self, device):
+        """ Spectrogram module, mel filterbank and DCT matrix on device, copied once per device.
+        """
+        if device == self._mel_fb.device:
+            return self._spectrogram, self._mel_fb, self._dct_mat
+        if device not in self._device_cache:
+            self._device_cache[device] = (
+                copy.deepcopy(self._spectrogram).to(device),
+                self._mel_fb.to(device),
+                self._dct_mat.to(device),
+            )
+        return self._device_cache[device]
+
+    def _num_frames(self, length):
+        """ Number of STFT frames for a clip of length samples.
+        """
+        if self._center:
+            return length // self._hop_length + 1
+        return (length - self._n_fft) // self._hop_length + 1
+
+    def _bucketed_mfcc(self, clips):
+        """ MFCC of a list of clips, computed per bucket of similar padded length.
+
+        Output is zero beyond the last frame of each clip.
+        """
+        clips = [clip.reshape(-1) for clip in clips]
+        lengths = torch.tensor([clip.numel() for clip in clips])
+        padded = (lengths + self.bucket_width - 1) // self.bucket_width * self.bucket_width
+
+        results = None
+        for bucket_length in torch.unique(padded).tolist():
+            bucket = torch.nonzero(padded == bucket_length).flatten().tolist()
+
+            batch = clips[0].new_zeros((len(bucket), bucket_length))
+            for row, idx in enumerate(bucket):
+                batch[row, :lengths[idx]] = clips[idx]
+
+            features = self._mfcc(batch)
+            del batch
 
-        self.results = self.mfcc(data)
+            if results is None:
+                max_frames = self._num_frames(int(padded.max()))
+                results = features.new_zeros((len(clips), self.n_mfcc, max_frames))
+            for row, idx in enumerate(bucket):
+                frames = max(0, min(self._num_frames(int(lengths[idx])), features.shape[-1]))
+                results[idx, :, :frames] = features[row, :, :frames]
+            del features
 
-        return self.results, targets
+        return results
 
     @staticmethod
     def dataset_validity_check(dataset):
@@ -0,0 +1,148 @@
+import torch
+
+# number of set bits of every byte value
+_POPCOUNT = torch.tensor([bin(value).count("1") for value in range(256)], dtype=torch.uint8)
+
+
+class PackedSpikes():
+    """ Bit-packed spike tensor of shape (batch, timesteps, ...).
+
+    Binary spikes are stored with 1 bit per event, packed along the time
+    dimension into (batch, ceil(timesteps / 8), ...) uint8 words, 32 times
+    less memory than float32 spikes. Signed spikes in {-1, 0, 1}, such as the
+    events of Speech2Spikes, use 2 bits per event, as one bit plane for the
+    positive and one for the negative events.
+
+    Spike counts over time are computed with a popcount of the packed words,
+    without unpacking, and are returned by sum(1), so that accumulators such
+    as choose_max_count and aggregate take packed spikes as well. Models
+    unpack them with unpack or, one timestep at a time, with timestep.
+    """
+    def __init__(self, planes, num_steps, signed=False):
+        """
+        Args:
+            planes: uint8 tensor of shape (1 or 2, batch, ceil(num_steps / 8), ...) of packed
+                bits, bit i of word w holding timestep 8 * w + i. The second plane holds
+                the negative events of signed spikes.
+            num_steps: Number of timesteps.
+            signed: Whether the spikes are signed.
+        """
+        self.planes = planes
+        self.num_steps = num_steps
+        self.signed = signed
+
+    @classmethod
+    def pack(cls, spikes, signed=False):
+        """ Packs a spike tensor.
+
+        Args:
+            spikes: Tensor of shape (batch, timesteps, ...) with values in {0, 1}, or in
+                {-1, 0, 1} if signed. Other non-zero values are treated as 1, or as their sign.
+            signed: Whether to keep the sign of the spikes.
+        Returns:
+            PackedSpikes: The packed spikes.
+        """
+        if not signed and (spikes < 0).any():
+            raise ValueError("Spikes have negative values, pack them with signed=True")
+        planes = (spikes > 0, spikes < 0) if signed else (spikes != 0,)
+
+        batch, num_steps = spikes.shape[:2]
+        num_words = -(-num_steps // 8)
+        shifts = _shifts(spikes.dim() + 1, spikes.device)
+        packed = []
+        for bits in planes:
+            bits = bits.to(torch.uint8)
+            if num_words * 8 != num_steps:
+                padding = bits.new_zeros((batch, num_words * 8 - num_steps) + bits.shape[2:])
+                bits = torch.cat((bits, padding), dim=1)
+            bits = bits.reshape((batch, num_words, 8) + bits.shape[2:])
+            packed.append((bits << shifts).sum(2, dtype=torch.uint8))
+        return cls(torch.stack(packed), num_steps, signed)
+
+    def unpack(self, dtype=torch.float32):
+        """ Returns the spikes as a dense tensor.
+
+        Args:
+            dtype: Data type of the spikes.
+        Returns:
+            spikes: Tensor of shape (batch, timesteps, ...).
+        """
+        shifts = _shifts(self.planes.dim(), self.planes.device)
+        bits = (self.planes.unsqueeze(3) >> shifts.unsqueeze(0)) & 1
+        bits = bits.reshape(self.planes.shape[:2] + (-1,) + self.planes.shape[3:])[:, :, :self.num_steps]
+        return self._combine(bits, dtype)
+
+    def timestep(self, step, dtype=torch.float32):
+        """ Returns the spikes of one timestep.
+
+        Args:
+            step: Index of the timestep.
+            dtype: Data type of the spikes.
+        Returns:
+            spikes: Tensor of shape (batch, ...).
+        """
+        return self._combine((self.planes[:, :, step // 8] >> (step % 8)) & 1, dtype)
+
+    def counts(self):
+        """ Spike counts over time, from a popcount of the packed words.
+
+        Returns:
+            counts: int64 tensor of shape (batch, ...), the number of positive minus
+                the number of negative spikes if signed.
+        """
+        counts = _POPCOUNT.to(self.planes.device)[self.planes.long()].sum(2, dtype=torch.int64)
+        return counts[0] - counts[1] if self.signed else counts[0]
+
+    def sum(self, dim):
+        """ Sum over the time dimension, as for a spike tensor.
+
+        Args:
+            dim: Must be 1, the time dimension.
+        Returns:
+            counts: int64 tensor of shape (batch, ...).
+        """
+        if dim != 1:
+            raise NotImplementedError("PackedSpikes can only be summed over the time dimension 1")
+        return self.counts()
+
+    def to(self, device):
+        """ Returns the packed spikes on device.
+        """
+        return PackedSpikes(self.planes.to(device), self.num_steps, self.signed)
+
+    @property
+    def shape(self):
+        """ Shape of the unpacked spikes, (batch, timesteps, ...).
+        """
+        return torch.Size((self.planes.shape[1], self.num_steps) + self.planes.shape[3:])
+
+    @property
+    def device(self):
+        return self.planes.device
+
+    @property
+    def nbytes(self):
+        """ Number of bytes of the packed spikes.
+        """
+        return self.planes.numel() * self.planes.element_size()
+
+    def size(self, dim=None):
+        return self.shape if dim is None else self.shape[dim]
+
+    def dim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _combine(self, bits, dtype):
+        spikes = bits[0].to(dtype)
+        if self.signed:
+            spikes -= bits[1].to(dtype)
+        return spikes
+
+
+def _shifts(dims, device):
+    """ Bit positions 0..7 along dimension 2 of a tensor with dims dimensions.
+    """
+    return torch.arange(8, dtype=torch.uint8, device=device).reshape((1, 1, 8) + (1,) * (dims - 3))
@@ -34,6 +34,9 @@ https://github.com/Accenture/speech2spikes
 """
 
 from .preprocessor import NeuroBenchProcessor
+from .packed_spikes import PackedSpikes
+
+import copy
 
 import torch
 import torchaudio
@@ -48,18 +51,18 @@ def tensor_to_events(batch, threshold=1, device=None):
         threshold (float): The difference between the residual and signal that
             will be considered an increase or decrease. Defaults to 1.
         device (torch.device, optional): A torch.Device used by PyTorch for the
-            computation. Defaults to None.
+            computation. Defaults to None, which computes on the device of batch.
 
     Returns:
-        Tensor: A PyTorch int8 tensor of events of shape (..., timesteps).
+        Tensor: A PyTorch float tensor of events in {-1, 0, 1} of shape (..., timesteps).
 
     TODO:
         Add support for using multiple channels for polarity instead of signs.
     """
-    events = torch.zeros(batch.shape)
-    levels = torch.round(batch[..., 0])
     if device:
-        events = events.to(device)
+        batch = batch.to(device)
+    events = torch.zeros(batch.shape, device=batch.device)
+    levels = torch.round(batch[..., 0])
 
     for t in range(batch.shape[-1]):
         events[..., t] = (batch[..., t] - levels > threshold).to(torch.int8) - (
@@ -73,13 +76,16 @@ class S2SProcessor(NeuroBenchProcessor):
     """ The SpikeEncoder class manages the conversion from raw audio into spikes
     and stores the required conversion parameters.
     """
-    def __init__(self, device=None):
+    def __init__(self, device=None, packed=False):
         """
         Args:
             device (torch.device, optional): A torch.Device used by PyTorch for the
                 computation. Defaults to None.
+            packed (bool): If True, returns the events as signed PackedSpikes, 2 bits
+                per event. Defaults to False.
         """
         self.device = device
+        self.packed = packed
         self._default_spec_kwargs = {
             "sample_rate": 16000,
             "n_mels": 20,
@@ -91,6 +97,7 @@ class S2SProcessor(NeuroBenchProcessor):
         self.transform = torchaudio.transforms.MelSpectrogram(
             **self._default_spec_kwargs
         )
+        self._device_cache = {}
 
     def __call__(self, batch):
         """ Converts raw audio data to spikes using Speech2Spikes algorithm
@@ -100,7 +107,8 @@ class S2SProcessor(NeuroBenchProcessor):
             batch: A tuple of data and corresponding targets (data_tensor, targets)
 
         Returns:
-            tensors: PyTorch int8 tensor of shape (batch, timesteps, ...)
+            tensors: PyTorch float tensor of events in {-1, 0, 1} of shape (batch, timesteps, ...),
+                or PackedSpikes of this shape if packed.
             targets: A tensor of corresponding targets.
 
         TODO:
@@ -108,11 +116,16 @@ class S2SProcessor(NeuroBenchProcessor):
         """
         tensors, targets = batch
 
+        if self.device:
+            tensors = tensors.to(self.device)
+
         # Tensors will be batch, timestep, channels and need to be transposed
-        tensors = self.transform(tensors.transpose(1, 2))
+        tensors = self._transform(tensors.device)(tensors.transpose(1, 2))
         tensors = torch.log(tensors)
         tensors = tensor_to_events(tensors, device=self.device)
         tensors = tensors.transpose(1, 3).squeeze() # Transpose back to timestep last
+        if self.packed:
+            tensors = PackedSpikes.pack(tensors, signed=True)
         return tensors, targets
 
     def configure(self, threshold=1, **spec_kwargs):
@@ -130,4 +143,14 @@ class S2SProcessor(NeuroBenchProcessor):
         self.threshold = threshold
 
         spec_kwargs = {**self._default_spec_kwargs, **spec_kwargs}
-        self.transform = torchaudio.transforms.MelSpectrogram(spec_kwargs)
+        self.transform = torchaudio.transforms.MelSpectrogram(**spec_kwargs)
+        self._device_cache = {}
+
+    def _transform(self, device):
+        """ MelSpectrogram transform on device, copied once per device.
+        """
+        if device == self.transform.spectrogram.window.device:
+            return self.transform
+        if device not in self._device_cache:
+            self._device_cache[device] = copy.deepcopy(self.transform).to(device)
+        return self._device_cache[device]
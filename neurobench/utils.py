@@ -1,5 +1,68 @@
 from importlib import import_module
+from contextlib import contextmanager
 
 def _lazy_import(package_name, module_name, class_name):
     module = import_module(module_name, package=package_name)
     return getattr(module, class_name)
+
+def _lazy_getattr(package_name, names):
+    """ Module __getattr__ resolving names of submodules on first access.
+
+    Classes that are subclassed or used through their classmethods cannot be
+    replaced by wrapper functions calling _lazy_import, so packages export
+    them through this hook instead, without importing the submodules upfront.
+
+    Args:
+        package_name (str): Name of the package.
+        names (dict): Maps each exported name to the relative name of its module.
+
+    Returns:
+        function: The __getattr__ of the package.
+    """
+    def __getattr__(name):
+        if name in names:
+            return _lazy_import(package_name, names[name], name)
+        raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+    return __getattr__
+
+def _optional_import(module_name, package_name=None):
+    """ Imports an optional dependency, with an install hint if it is missing.
+
+    Args:
+        module_name (str): Name of the module to import.
+        package_name (str, optional): Name of the package providing the module,
+            if different from the top-level module name.
+
+    Returns:
+        module: The imported module.
+    """
+    try:
+        return import_module(module_name)
+    except ImportError as e:
+        package_name = package_name or module_name.split(".")[0]
+        raise ImportError(
+            f"{module_name} is required for this feature but could not be imported. "
+            f"Install the {package_name} package to use it."
+        ) from e
+
+
+@contextmanager
+def _torch_threads(num_threads):
+    """ Temporarily sets the number of torch intra-op threads.
+
+    Args:
+        num_threads (int or None): Number of threads. If None, the current
+            setting is left unchanged.
+    """
+    if num_threads is None:
+        yield
+        return
+
+    import torch
+
+    previous = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
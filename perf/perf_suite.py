@@ -0,0 +1,324 @@
+"""
+Throughput and memory regression suite for the NeuroBench hot paths.
+
+Every case builds synthetic data of realistic size, so no dataset downloads
+are needed, and runs in a fresh process to isolate its memory use. For each
+case the median wall time and the peak RSS growth during the timed section
+are appended to a JSON history file and compared against a stored baseline.
+
+Usage:
+    python perf/perf_suite.py                     # run all cases, compare to baseline
+    python perf/perf_suite.py --suite micro       # only the micro benchmarks
+    python perf/perf_suite.py --update-baseline   # store the results as the new baseline
+
+The process exits with a non-zero status if any case regresses by more than
+the configured thresholds, or fails: crashes, runs out of memory or exceeds
+the per-case timeout.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PERF_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PERF_DIR))
+
+import numpy as np
+import torch
+
+CASES = {}
+
+
+def case(name, suite="micro"):
+    """ Registers a benchmark case.
+
+    The decorated function does the setup for a given size scale and returns
+    the zero-argument callable that is timed.
+    """
+    def register(fn):
+        CASES[name] = (suite, fn)
+        return fn
+    return register
+
+
+IMPORT_STATEMENT = (
+    "import neurobench.benchmarks, neurobench.datasets, neurobench.models, "
+    "neurobench.preprocessing, neurobench.accumulators"
+)
+
+
+@case("import_time")
+def import_time_case(scale):
+    # cold start of a fresh interpreter, as paid by every spawned DataLoader worker
+    return lambda: subprocess.run([sys.executable, "-c", IMPORT_STATEMENT], check=True, cwd=os.path.dirname(PERF_DIR))
+
+
+@case("tensor_to_events")
+def tensor_to_events_case(scale):
+    from neurobench.preprocessing.speech2spikes import tensor_to_events
+
+    # log mel spectrograms of a GSC batch: (batch, channel, n_mels, frames)
+    batch = torch.log(torch.rand((int(256 * scale), 1, 20, 201)) * 100 + 1)
+    return lambda: tensor_to_events(batch)
+
+
+def _dvs_events(scale):
+    """ Events of a 1.7s DVS Gesture sample in the (N, 4) xypt layout of DVSGesture.
+    """
+    rng = np.random.default_rng(0)
+    num_events = int(200000 * scale)
+    return torch.stack((
+        torch.from_numpy(rng.integers(0, 128, num_events)),
+        torch.from_numpy(rng.integers(0, 128, num_events)),
+        torch.from_numpy(rng.integers(0, 2, num_events)),
+        torch.from_numpy(np.sort(rng.integers(0, 1700000, num_events))),
+    ), dim=1)
+
+
+@case("dvs_stack_preprocessing")
+def dvs_stack_case(scale):
+    from neurobench.datasets.DVSGesture_loader import stack_preprocessing
+
+    xypt = _dvs_events(scale)
+    return lambda: stack_preprocessing(xypt.clone(), delta_t=5000, tbins=340)
+
+
+@case("dvs_histogram_preprocessing")
+def dvs_histogram_case(scale):
+    from neurobench.datasets.DVSGesture_loader import histogram_difference_preprocessing
+
+    xypt = _dvs_events(scale)
+    return lambda: histogram_difference_preprocessing(xypt.clone(), delta_t=5000, tbins=340)
+
+
+@case("primate_reaching_load_data", suite="macro")
+def primate_reaching_case(scale):
+    from neurobench.datasets.primate_reaching import PrimateReaching
+    from neurobench.datasets.synthetic import make_primate_reaching
+
+    path = tempfile.mkdtemp()
+    make_primate_reaching(path, "indy_synthetic.mat", duration=600 * scale)
+    return lambda: PrimateReaching(path, "indy_synthetic.mat", num_steps=7)
+
+
+def _echo_state_network():
+    sys.path.insert(0, os.path.join(os.path.dirname(PERF_DIR), "neurobench", "examples", "model_data"))
+    from echo_state_network import EchoStateNetwork
+
+    return EchoStateNetwork(in_channels=1, reservoir_size=200, input_scale=torch.tensor([0.2, 1], dtype=torch.float64),
+                            connect_prob=0.15, spectral_radius=1.25, leakage=0.3, ridge_param=1.e-8, seed_id=0)
+
+
+def _mackey_glass_like(points):
+    t = torch.arange(points + 1, dtype=torch.float64)
+    return (0.9 + 0.2 * torch.sin(t / 17) * torch.cos(t / 5.3)).unsqueeze(-1)
+
+
+@case("esn_fit")
+def esn_fit_case(scale):
+    esn = _echo_state_network()
+    series = _mackey_glass_like(int(8000 * scale))
+    data = series[:-1].unsqueeze(0)
+    return lambda: esn.fit(data, series[1001:], 1000)
+
+
+@case("esn_forward")
+def esn_forward_case(scale):
+    esn = _echo_state_network()
+    series = _mackey_glass_like(2000)
+    esn.fit(series[:-1].unsqueeze(0), series[1001:], 1000)
+    esn.mode = "single_step"
+    batch = _mackey_glass_like(int(2000 * scale))[:-1].unsqueeze(1)
+    return lambda: esn(batch)
+
+
+@case("benchmark_run_snn", suite="macro")
+def benchmark_run_case(scale):
+    import snntorch as snn
+    from snntorch import surrogate
+    from torch.utils.data import DataLoader, TensorDataset
+
+    from neurobench.accumulators import choose_max_count
+    from neurobench.benchmarks import Benchmark
+    from neurobench.models import SNNTorchModel
+
+    torch.manual_seed(0)
+    spike_grad = surrogate.fast_sigmoid()
+    net = torch.nn.Sequential(
+        torch.nn.Flatten(),
+        torch.nn.Linear(20, 256),
+        snn.Leaky(beta=0.9, spike_grad=spike_grad, init_hidden=True),
+        torch.nn.Linear(256, 256),
+        snn.Leaky(beta=0.9, spike_grad=spike_grad, init_hidden=True),
+        torch.nn.Linear(256, 35),
+        snn.Leaky(beta=0.9, spike_grad=spike_grad, init_hidden=True, output=True),
+    )
+    num_samples = int(1024 * scale)
+    dataset = TensorDataset((torch.rand((num_samples, 100, 20)) < 0.1).float(), torch.randint(0, 35, (num_samples,)))
+    loader = DataLoader(dataset, batch_size=256)
+    benchmark = Benchmark(SNNTorchModel(net), loader, [], [choose_max_count], [["model_size"], ["classification_accuracy"]])
+    return benchmark.run
+
+
+def _max_rss():
+    """ Peak resident set size of this process in bytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _measure(name, scale, repeat, queue):
+    """ Runs a case in the current (child) process and reports its measurements.
+    """
+    suite, fn = CASES[name]
+    run = fn(scale)
+    before = _max_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    queue.put({"time": statistics.median(times), "peak_memory": _max_rss() - before})
+
+
+def measure(name, scale=1.0, repeat=3, timeout=None):
+    """ Runs a case in a fresh process.
+
+    Args:
+        name (str): Name of the registered case.
+        scale (float): Size multiplier of the synthetic data.
+        repeat (int): Number of timed repetitions, the median is reported.
+        timeout (float): Seconds after which the case is killed. Defaults to no timeout.
+    Returns:
+        dict: {"time": seconds, "peak_memory": bytes}, or {"error": description} if the
+            process exited without reporting, e.g. after a crash or OOM kill, or timed out.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(name, scale, repeat, queue))
+    process.start()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    result = None
+    while result is None:
+        exited = not process.is_alive()
+        try:
+            result = queue.get(timeout=1.0)
+        except queue_module.Empty:
+            # the result is put before exiting, so an empty queue after exit means a failure
+            if exited:
+                process.join()
+                result = {"error": f"process exited with code {process.exitcode}"}
+            elif deadline is not None and time.monotonic() > deadline:
+                process.kill()
+                result = {"error": f"timed out after {timeout} s"}
+    process.join()
+    return result
+
+
+def compare(results, baseline, time_threshold, memory_threshold):
+    """ Compares results against a baseline.
+
+    Args:
+        results (dict): {case: {"time": ..., "peak_memory": ..., "scale": ...}}
+        baseline (dict): Same structure as results.
+        time_threshold (float): Allowed relative increase in time.
+        memory_threshold (float): Allowed relative increase in peak memory.
+    Returns:
+        list: Descriptions of the regressions, empty if there are none.
+    """
+    thresholds = {"time": time_threshold, "peak_memory": memory_threshold}
+    regressions = []
+    for name, result in results.items():
+        # baselines recorded at a different data size are not comparable
+        if name not in baseline or baseline[name].get("scale") != result.get("scale"):
+            continue
+        for key, threshold in thresholds.items():
+            reference = baseline[name][key]
+            # memory growth of a few MB is within the noise of the allocator
+            if key == "peak_memory" and result[key] - reference < 4 * 2**20:
+                continue
+            if result[key] > reference * (1 + threshold):
+                regressions.append(f"{name}: {key} {result[key]:.4g} > {reference:.4g} * (1 + {threshold})")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=PERF_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load(path, default):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return default
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NeuroBench throughput and memory regression suite")
+    parser.add_argument("--suite", choices=["micro", "macro", "all"], default="all")
+    parser.add_argument("--cases", nargs="*", help="names of the cases to run, default all of the suite")
+    parser.add_argument("--scale", type=float, default=1.0, help="size multiplier of the synthetic data")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600., help="seconds after which a case fails")
+    parser.add_argument("--history", default=os.path.join(PERF_DIR, "history.json"), help="ignored by git")
+    parser.add_argument("--baseline", default=os.path.join(PERF_DIR, "baseline.json"))
+    parser.add_argument("--time-threshold", type=float, default=0.2)
+    parser.add_argument("--memory-threshold", type=float, default=0.2)
+    parser.add_argument("--import-budget", type=float, default=1.0,
+                        help="maximum seconds for a cold start of the neurobench packages")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    names = args.cases or [name for name, (suite, _) in CASES.items() if args.suite in ("all", suite)]
+
+    results, failures = {}, []
+    for name in names:
+        result = measure(name, args.scale, args.repeat, args.timeout)
+        if "error" in result:
+            failures.append(f"{name}: {result['error']}")
+            print(f"{name:40s} FAILED {result['error']}")
+            continue
+        results[name] = {**result, "scale": args.scale}
+        print(f"{name:40s} {results[name]['time']:10.4f} s {results[name]['peak_memory'] / 2**20:10.1f} MB")
+
+    history = _load(args.history, [])
+    history.append({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "results": results,
+        "failures": failures,
+    })
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=2)
+
+    for failure in failures:
+        print("FAILED", failure)
+
+    if args.update_baseline:
+        baseline = _load(args.baseline, {})
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        return 1 if failures else 0
+
+    regressions = compare(results, _load(args.baseline, {}), args.time_threshold, args.memory_threshold)
+    if "import_time" in results and results["import_time"]["time"] > args.import_budget:
+        regressions.append(f"import_time: {results['import_time']['time']:.4g} s over budget of {args.import_budget} s")
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import torch
 
 from neurobench.accumulators import choose_max_count
+from neurobench.preprocessing import PackedSpikes
 
 def test_choose_max_count():
     # Create a tensor of all 0's except for one class
@@ -8,4 +9,4 @@ def test_choose_max_count():
     a[:, :, 5] = 1
     assert choose_max_count(a).shape == (256, )
     assert torch.equal(choose_max_count(a), torch.tensor([5] * 256))
-
+    assert torch.equal(choose_max_count(PackedSpikes.pack(a)), torch.tensor([5] * 256))
@@ -0,0 +1,480 @@
+import os
+import torch
+import pytest
+
+from torch import nn
+from torch.utils.data import TensorDataset
+
+from neurobench.models import TorchModel
+from neurobench.benchmarks import Benchmark, Sweep, expand_grid
+
+
+def test_expand_grid():
+    configs = expand_grid({"a": [1, 2], "b": ["x", "y", "z"]})
+    assert len(configs) == 6
+    assert configs[0] == {"a": 1, "b": "x"}
+    assert expand_grid([{"a": 1}]) == [{"a": 1}]
+
+def test_sweep_shares_stages():
+    calls = {"dataset": 0, "preprocess": 0, "model": 0}
+
+    def dataset(scale):
+        calls["dataset"] += 1
+        data = torch.rand((100, 1, 4))
+        return TensorDataset(data, scale * data.sum(-1, keepdim=True))
+
+    class Preprocessor():
+        def __call__(self, batch):
+            calls["preprocess"] += 1
+            return batch
+
+    def model(dataset, weight):
+        calls["model"] += 1
+        net = nn.Linear(4, 1, bias=False)
+        with torch.no_grad():
+            net.weight.fill_(weight)
+        return TorchModel(net)
+
+    sweep = Sweep(
+        dataset=dataset,
+        model=model,
+        metric_list=[["parameter_count"], ["MSE"]],
+        grid={"scale": [1.0, 2.0], "weight": [1.0, 2.0], "rep": [0, 1]},
+        preprocessors=lambda: [Preprocessor()],
+        dataloader_kwargs={"batch_size": 10},
+        num_workers=2,
+    )
+    results = sweep.run()
+
+    assert len(results) == 8
+    assert calls == {"dataset": 2, "preprocess": 20, "model": 4}
+    for row in results:
+        assert row["parameter_count"] == 4
+        if row["scale"] == row["weight"]:
+            assert row["MSE"] < 1e-10
+        else:
+            assert row["MSE"] > 0
+    # everything is released after the last run using it
+    assert sweep._cache == {}
+
+def test_sweep_releases_features():
+
+    features = []
+
+    def preprocessors(offset):
+        return [lambda batch: (batch[0] + offset, batch[1])]
+
+    def model():
+        return TorchModel(nn.Identity())
+
+    def dataset():
+        data = torch.rand((20, 1))
+        return TensorDataset(data, data)
+
+    sweep = Sweep(
+        dataset=dataset,
+        model=model,
+        metric_list=[[], ["MSE"]],
+        grid={"offset": [0.0, 1.0, 2.0]},
+        preprocessors=preprocessors,
+        dataloader_kwargs={"batch_size": 5},
+    )
+    original = sweep._run_config
+    def run_config(config):
+        features.append(sum(1 for key in sweep._cache if key[0] == "features"))
+        return original(config)
+    sweep._run_config = run_config
+    results = sweep.run()
+
+    # the features of a preprocessor configuration are dropped before the next one is computed
+    assert features == [0, 0, 0]
+    assert [row["MSE"] for row in results] == pytest.approx([0.0, 1.0, 4.0])
+
+def test_benchmark_accumulated_metric():
+    targets = [[torch.tensor([[0., 0., 10., 10., 0]])], [torch.tensor([[20., 20., 30., 30., 1]])]]
+    detections = [[torch.tensor([[0., 0., 10., 10., 0.9, 0]])], [torch.tensor([[0., 0., 10., 10., 0.9, 1]])]]
+    loader = [(torch.zeros((1, 3)), [target], {"labeled": torch.ones((1, 1), dtype=torch.bool)}) for target in targets]
+
+    class Loader(list):
+        dataset = loader
+
+    outputs = iter(detections * 2)
+    benchmark = Benchmark(lambda x: [next(outputs)], Loader(loader), [], [], [[], ["mAP"]])
+    # class 0 is found, class 1 is missed; every run starts from an empty state
+    assert benchmark.run() == {"mAP": 0.5}
+    assert benchmark.run() == {"mAP": 0.5}
+
+def test_benchmark_device():
+    torch.manual_seed(0)
+    net = nn.Linear(4, 1)
+    data = TensorDataset(torch.rand((100, 4)), torch.rand((100, 1)))
+    loader = torch.utils.data.DataLoader(data, batch_size=32)
+
+    reference = Benchmark(TorchModel(net), loader, [], [], [[], ["MSE", "r2"]]).run()
+    threads = torch.get_num_threads()
+    for device in ["cpu", "auto"]:
+        results = Benchmark(TorchModel(net), loader, [], [], [[], ["MSE", "r2"]], device=device, num_threads=1).run()
+        # tensor metrics are converted once at the end of the run
+        assert isinstance(results["MSE"], float)
+        assert abs(results["MSE"] - reference["MSE"]) < 1e-6
+        assert abs(results["r2"] - reference["r2"]) < 1e-6
+    assert torch.get_num_threads() == threads
+
+def test_cpu_plan():
+    from neurobench.benchmarks import CPUPlan
+    from neurobench.benchmarks.cpu_plan import parse_cpulist, numa_nodes
+
+    assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    cpus = [cpu for node in numa_nodes() for cpu in node]
+    assert set(cpus) <= os.sched_getaffinity(0)
+
+    plan = CPUPlan.split(0)
+    assert plan.model_cpus == sorted(cpus) and plan.intra_op_threads == len(cpus)
+    plan = CPUPlan(num_workers=2, intra_op_threads=1, model_cpus=cpus[:1], worker_cpus=cpus[-1:])
+
+    data = TensorDataset(torch.rand((64, 4)), torch.rand((64, 1)))
+    loader = torch.utils.data.DataLoader(data, batch_size=8)
+    threads, affinity = torch.get_num_threads(), os.sched_getaffinity(0)
+    with plan.apply(loader):
+        assert torch.get_num_threads() == 1
+        assert os.sched_getaffinity(0) == set(cpus[:1])
+        assert loader.num_workers == 2
+        assert len(list(loader)) == 8
+    assert torch.get_num_threads() == threads and os.sched_getaffinity(0) == affinity
+    assert loader.num_workers == 0 and loader.worker_init_fn is None
+
+    benchmark = Benchmark(TorchModel(nn.Linear(4, 1)), loader, [], [], [[], ["MSE"]])
+    results = benchmark.autotune([CPUPlan(), CPUPlan(num_workers=1)], num_batches=2)
+    assert len(results) == 2 and all(throughput > 0 for _, throughput in results)
+    assert benchmark.cpu_plan in [plan for plan, _ in results]
+    assert "MSE" in benchmark.run()
+
+def test_cpu_plan_without_affinity(monkeypatch):
+    from neurobench.benchmarks.cpu_plan import _init_worker
+
+    # workers are left unpinned where the platform cannot set affinities
+    monkeypatch.delattr(os, "sched_setaffinity")
+    calls, threads = [], torch.get_num_threads()
+    try:
+        _init_worker([0, 1], calls.append, 1)
+        assert calls == [1] and torch.get_num_threads() == 1
+    finally:
+        torch.set_num_threads(threads)
+
+def test_benchmark_resume(tmp_path):
+    torch.manual_seed(0)
+    net = nn.Linear(4, 1)
+    data = TensorDataset(torch.rand((100, 4)), torch.rand((100, 1)))
+    loader = torch.utils.data.DataLoader(data, batch_size=10, shuffle=True)
+    metric_list = [["parameter_count"], ["MSE", "r2"]]
+    reference = Benchmark(TorchModel(net), loader, [], [], metric_list).run()
+
+    class Preempted(Exception):
+        pass
+
+    calls = []
+    def model(batch):
+        calls.append(batch)
+        if len(calls) == 7:
+            raise Preempted()
+        return net(batch)
+    model.__net__ = lambda: net
+
+    path = str(tmp_path / "run.ckpt")
+    benchmark = Benchmark(model, loader, [], [], metric_list)
+    try:
+        benchmark.run(checkpoint_path=path, checkpoint_every=3)
+    except Preempted:
+        pass
+
+    # batches 1-6 are in the checkpoint, evaluation restarts at batch 7 of the saved order
+    calls.clear()
+    results = benchmark.run(checkpoint_path=path, checkpoint_every=3, resume=True)
+    assert len(calls) == 4
+    assert results["parameter_count"] == 5
+    assert abs(results["MSE"] - reference["MSE"]) < 1e-6
+    assert abs(results["r2"] - reference["r2"]) < 1e-6
+
+    # a finished checkpoint returns the results without evaluating again
+    calls.clear()
+    assert benchmark.run(checkpoint_path=path, resume=True) == results
+    assert len(calls) == 0
+
+def test_sample_log(tmp_path):
+    from neurobench.benchmarks import SampleLog, load_sample_log, rescore
+
+    torch.manual_seed(0)
+    net = nn.Linear(4, 3)
+    data = TensorDataset(torch.rand((50, 4)), torch.randint(0, 3, (50,)))
+    loader = torch.utils.data.DataLoader(data, batch_size=8, shuffle=True)
+    model = TorchModel(net)
+    path = str(tmp_path / "log")
+
+    benchmark = Benchmark(model, loader, [], [lambda preds: preds.argmax(-1)], [[], ["classification_accuracy"]])
+    results = benchmark.run(sample_log=path)
+
+    log = load_sample_log(path)
+    assert sorted(log["index"].tolist()) == list(range(50))
+    order = log["index"]
+    assert (log["label"] == data.tensors[1].numpy()[order]).all()
+    expected = net(data.tensors[0][order]).argmax(-1).numpy()
+    assert (log["prediction"] == expected).all()
+    assert (log["latency"] > 0).all()
+
+    # metrics are evaluated from the log without the model
+    rescored = rescore(path, ["classification_accuracy"])
+    assert abs(rescored["classification_accuracy"] - results["classification_accuracy"]) < 1e-6
+
+    with SampleLog(path, chunk_size=10) as log:
+        for start in range(0, 25, 5):
+            log.append({"x": torch.arange(start, start + 5)})
+    assert load_sample_log(path)["x"].tolist() == list(range(25))
+    assert len(os.listdir(path)) == 3
+
+
+def test_prediction_cache(tmp_path):
+    torch.manual_seed(0)
+    net = nn.Linear(4, 3)
+    data = TensorDataset(torch.rand((50, 4)), torch.randint(0, 3, (50,)))
+    loader = torch.utils.data.DataLoader(data, batch_size=8)
+    path = str(tmp_path / "cache")
+
+    calls = []
+    def model(x):
+        calls.append(len(x))
+        return net(x)
+    model.__net__ = lambda: net
+    argmax = lambda preds: preds.argmax(-1)
+
+    results = Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy"]]).run(prediction_cache=path)
+    assert sum(calls) == 50
+    assert len(os.listdir(path)) == 1
+
+    # other metrics are evaluated from the cache, without inference
+    cached = Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy", "r2"]]).run(prediction_cache=path)
+    assert sum(calls) == 50
+    assert abs(cached["classification_accuracy"] - results["classification_accuracy"]) < 1e-6
+    assert "r2" in cached
+
+    # changed weights miss the cache
+    with torch.no_grad():
+        net.bias += 1
+    Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy"]]).run(prediction_cache=path)
+    assert sum(calls) == 100
+    assert len(os.listdir(path)) == 2
+
+    # a dataset of the same class and length with other contents misses the cache
+    labels = argmax(net(data.tensors[0])).detach()
+    perfect = TensorDataset(data.tensors[0], labels)
+    half = TensorDataset(data.tensors[0], torch.where(torch.arange(50) < 25, labels, (labels + 1) % 3))
+    for dataset, accuracy in ((perfect, 1.0), (half, 0.5)):
+        loader = torch.utils.data.DataLoader(dataset, batch_size=8)
+        uncached = Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy"]]).run()
+        cached = Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy"]]).run(prediction_cache=path)
+        assert uncached["classification_accuracy"] == pytest.approx(accuracy)
+        assert cached["classification_accuracy"] == pytest.approx(accuracy)
+
+    # datasets without identifiable contents are only cached with an explicit key
+    class Generated(torch.utils.data.Dataset):
+        def __len__(self):
+            return 50
+        def __getitem__(self, idx):
+            return data[idx]
+    loader = torch.utils.data.DataLoader(Generated(), batch_size=8)
+    entries = len(os.listdir(path))
+    Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy"]]).run(prediction_cache=path)
+    assert len(os.listdir(path)) == entries
+    Benchmark(model, loader, [], [argmax], [[], ["classification_accuracy"]]).run(prediction_cache=path, dataset_key="v1")
+    assert len(os.listdir(path)) == entries + 1
+
+
+def test_metric_registry(monkeypatch):
+    from neurobench.benchmarks import registry
+    from neurobench.benchmarks.registry import get_metric, register_intermediate, register_metric
+
+    calls = []
+
+    @register_intermediate("test_errors")
+    def errors(model, preds, data):
+        calls.append(len(preds))
+        return preds != data[1]
+
+    @register_metric(requires=["test_errors"])
+    def test_error_rate(model, preds, data, test_errors):
+        return test_errors.float().mean()
+
+    @register_metric(name="test_error_count", requires=["test_errors"])
+    def error_count(model, preds, data, test_errors):
+        return int(test_errors.sum())
+
+    torch.manual_seed(0)
+    data = TensorDataset(torch.rand((50, 4)), torch.randint(0, 3, (50,)))
+    loader = torch.utils.data.DataLoader(data, batch_size=10)
+    model = TorchModel(nn.Linear(4, 3))
+    benchmark = Benchmark(model, loader, [], [lambda preds: preds.argmax(-1)],
+                          [[], ["classification_accuracy", "test_error_rate", "test_error_count"]])
+    results = benchmark.run()
+
+    # the intermediate is shared by both metrics
+    assert calls == [10] * 5
+    assert abs(results["test_error_rate"] + results["classification_accuracy"] - 1) < 1e-6
+
+    with pytest.raises(ValueError):
+        get_metric("not_a_metric")
+    with pytest.raises(ValueError):
+        register_metric(requires=["not_an_intermediate"])(error_count)
+
+    # third-party metrics are loaded from entry points
+    class EntryPoint():
+        def load(self):
+            return error_count
+    monkeypatch.setattr(registry, "entry_points",
+                        lambda group, name: [EntryPoint()] if name == "plugin_metric" else [])
+    assert get_metric("plugin_metric") is error_count
+
+
+def test_fscil_runner(tmp_path):
+    from neurobench.benchmarks import FSCILRunner, split_sessions
+
+    torch.manual_seed(0)
+    num_classes = 8
+    prototypes = torch.randn((num_classes, 16)) * 3
+    def dataset(samples_per_class):
+        labels = torch.arange(num_classes).repeat_interleave(samples_per_class)
+        return TensorDataset(prototypes[labels] + torch.randn((len(labels), 16)), labels)
+    train_set, test_set = dataset(20), dataset(10)
+
+    class Preprocessor():
+        def __init__(self):
+            self.samples = 0
+        def __call__(self, batch):
+            self.samples += len(batch[0])
+            return batch
+
+    class PrototypeModel():
+        def __init__(self):
+            self.prototypes = torch.full((num_classes, 16), float("inf"))
+            self.samples = 0
+        def __call__(self, x):
+            self.samples += len(x)
+            return torch.cdist(x, self.prototypes.nan_to_num(posinf=1e6)).argmin(-1)
+        def __net__(self):
+            return nn.Identity()
+
+    def train(model, batches, session):
+        data = torch.cat([x for x, _ in batches])
+        labels = torch.cat([y for _, y in batches])
+        for label in labels.unique():
+            model.prototypes[label] = data[labels == label].mean(0)
+
+    sessions = split_sessions(range(num_classes), 4, 2)
+    assert sessions == [[0, 1, 2, 3], [4, 5], [6, 7]]
+
+    tables = {}
+    for incremental in (False, True):
+        model, preprocessor = PrototypeModel(), Preprocessor()
+        runner = FSCILRunner(train_set, test_set, sessions, model, train, metric_list=[[], ["classification_accuracy"]],
+                             preprocessors=[preprocessor], shots=5, batch_size=16, incremental=incremental)
+        table = tables[incremental] = runner.run()
+
+        assert [row["num_classes"] for row in table] == [4, 6, 8]
+        assert all(row["accuracy"] > 0.9 for row in table)
+        assert table[0]["accuracy"] == table[0]["base_accuracy"] == table[0]["session_accuracy"]
+        # test features are preprocessed once, training data once per session
+        assert preprocessor.samples == 80 + 4 * 20 + 4 * 5
+        # evaluation covers all seen classes, or only the new ones
+        assert model.samples == (40 + 60 + 80 if not incremental else 80)
+
+    # both modes produce the same table, with the same base session
+    assert [list(row) for row in tables[False]] == [list(row) for row in tables[True]]
+    assert tables[True][0]["accuracy"] == pytest.approx(tables[False][0]["accuracy"])
+
+    runner.to_csv(str(tmp_path / "fscil.csv"))
+    with open(tmp_path / "fscil.csv") as f:
+        assert f.readline().startswith("session,num_classes,accuracy")
+
+
+def test_fscil_incremental_approximation():
+    from neurobench.benchmarks import FSCILRunner
+
+    # the test samples of class 0 lie closer to the prototype of class 1, learned later
+    train_set = TensorDataset(torch.tensor([[0.], [0.], [0.5], [0.5]]), torch.tensor([0, 0, 1, 1]))
+    test_set = TensorDataset(torch.tensor([[0.2], [0.4], [0.5]]), torch.tensor([0, 0, 1]))
+
+    class PrototypeModel():
+        def __init__(self):
+            self.prototypes = {}
+        def __call__(self, x):
+            labels = torch.tensor(list(self.prototypes))
+            centers = torch.stack(list(self.prototypes.values()))
+            return labels[torch.cdist(x, centers).argmin(-1)]
+        def __net__(self):
+            return nn.Identity()
+
+    def train(model, batches, session):
+        data = torch.cat([x for x, _ in batches])
+        labels = torch.cat([y for _, y in batches])
+        for label in labels.unique().tolist():
+            model.prototypes[label] = data[labels == label].mean(0)
+
+    tables = {}
+    for incremental in (False, True):
+        runner = FSCILRunner(train_set, test_set, [[0], [1]], PrototypeModel(), train,
+                             metric_list=[[], []], shots=2, incremental=incremental)
+        tables[incremental] = runner.run()
+
+    # the new prototype takes one of the two old-class samples, which only full evaluation sees
+    assert tables[False][1]["base_accuracy"] == 0.5
+    assert tables[False][1]["accuracy"] == pytest.approx(2 / 3)
+    # incremental evaluation reuses the base session results, overstating the accuracy
+    assert tables[True][1]["base_accuracy"] == 1.0
+    assert tables[True][1]["accuracy"] == 1.0
+
+
+def test_forecast_benchmark():
+    import math
+    from neurobench.benchmarks import ForecastBenchmark
+
+    omega = 0.1
+    series = torch.sin(omega * torch.arange(500, dtype=torch.float64)).unsqueeze(-1)
+
+    class Oscillator(nn.Module):
+        """ Next value of a sinusoid from the last two, x[t + 1] = 2 cos(omega) x[t] - x[t - 1]. """
+        def __init__(self, omega):
+            super().__init__()
+            self.factor = 2 * math.cos(omega)
+            self.steps = 0
+        def reset_state(self, batch_size):
+            self.prior = torch.zeros((batch_size, 1), dtype=torch.float64)
+        def step(self, x):
+            self.steps += 1
+            prediction = self.factor * x - self.prior
+            self.prior = x
+            return prediction
+
+    net = Oscillator(omega)
+    model = TorchModel(net)
+    starts = list(range(10, 400, 30))
+    results = ForecastBenchmark(model, series, horizon=50, starts=starts, warmup=1, lyap_exp=0.01).run()
+
+    assert results["NRMSE"] < 1e-8
+    assert len(results["NRMSE_horizon"]) == 50
+    assert results["valid_time"] == 50
+    assert results["lyapunov_time"] == pytest.approx(100)
+    assert results["horizon_lyapunov_times"] == pytest.approx(0.5)
+    # all rollouts advance together, one step per timestep
+    assert net.steps == 1 + 50
+
+    # a wrong frequency diverges with the horizon, the same in parallel and alone
+    model = TorchModel(Oscillator(omega * 1.05))
+    benchmark = ForecastBenchmark(model, series, horizon=50, starts=starts, warmup=1, threshold=0.1)
+    results = benchmark.run()
+    curve = results["NRMSE_horizon"]
+    assert curve[-1] > curve[0]
+    assert 0 < results["valid_time"] < 50
+    single = ForecastBenchmark(model, series, horizon=50, starts=[starts[3]], warmup=1)
+    single.run()
+    assert torch.allclose(single.predictions[0], benchmark.predictions[3])
+
+    with pytest.raises(ValueError):
+        ForecastBenchmark(model, series, horizon=200, starts=[400])
@@ -1,6 +1,11 @@
 import os
+import wave
+
+import numpy as np
+import pytest
 
 from neurobench.datasets import SpeechCommands
+from neurobench.datasets import PackedSpeechCommands
 from neurobench.datasets import MegapixelAutomotive
 from neurobench.datasets import PrimateReaching
 from neurobench.datasets import DVSGesture
@@ -23,6 +28,147 @@ def test_speech_commands():
     assert list(ds[0][0].shape) == [16000, 1] # timesteps, channels
     assert int(ds[0][1]) == 0
 
+def _write_speech_commands_tree(root):
+    base = os.path.join(root, "SpeechCommands", "speech_commands_v0.02")
+    rng = np.random.default_rng(0)
+    files = []
+    for label in ["_background_noise_", "no", "yes"]:
+        os.makedirs(os.path.join(base, label))
+        for utterance, length in enumerate([16000, 12000, 17000]):
+            name = f"{label}/speaker_nohash_{utterance}.wav"
+            with wave.open(os.path.join(base, name), "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(16000)
+                wav.writeframes(rng.integers(-2**15, 2**15, length, dtype=np.int16).tobytes())
+            if label != "_background_noise_":
+                files.append(name)
+    with open(os.path.join(base, "testing_list.txt"), "w") as f:
+        f.write("\n".join(files[::2]) + "\n")
+    with open(os.path.join(base, "validation_list.txt"), "w") as f:
+        f.write("\n".join(files[1::3]) + "\n")
+
+def test_packed_speech_commands(tmp_path):
+    _write_speech_commands_tree(str(tmp_path))
+    for subset in [None, "testing", "training"]:
+        ds = SpeechCommands(str(tmp_path), subset=subset)
+        packed = PackedSpeechCommands(str(tmp_path), subset=subset)
+
+        assert len(packed) == len(ds)
+        assert packed.labels == ds.labels
+        for idx in range(len(ds)):
+            assert torch.equal(packed[idx][0], ds[idx][0])
+            assert torch.equal(packed[idx][1], ds[idx][1])
+
+        data, labels = packed.get_batch(list(range(len(packed))))
+        assert data.shape == (len(packed), 16000, 1)
+        assert torch.equal(data[-1], ds[len(ds) - 1][0])
+
+    packed = PackedSpeechCommands(str(tmp_path), truncate_or_pad_to_1s=False)
+    assert packed[1][0].shape == (12000, 1)
+    batches = list(packed.create_dataloader(batch_size=4))
+    assert [len(labels) for _, labels in batches] == [4, 2]
+    assert batches[0][0].shape == (4, 17000, 1)
+
+def test_synthetic_datasets(tmp_path):
+    from neurobench.datasets.synthetic import (
+        make_speech_commands, make_primate_reaching, make_gen4_histograms
+    )
+    import h5py
+
+    path = make_speech_commands(str(tmp_path / "gsc"), labels=["no", "yes"], samples_per_label=10)
+    ds = SpeechCommands(path, subset="testing")
+    assert len(ds) == 2
+    assert list(ds[0][0].shape) == [16000, 1]
+    assert len(SpeechCommands(path, subset="training")) == 16
+
+    path = make_dvs_gesture_tree(tmp_path)
+    ds = DVSGesture(path)
+    assert len(ds) == 110
+    assert list(ds[0][0].shape) == [340, 3, 128, 128]
+
+    make_primate_reaching(str(tmp_path / "primate"), "indy_synthetic.mat", duration=60, num_units=2)
+    ds = PrimateReaching(str(tmp_path / "primate"), "indy_synthetic.mat", num_steps=7)
+    assert ds.samples.shape[0] == 96
+    assert len(ds.ind_test) > 0
+    assert ds[ds.ind_test[0]][0].shape == (96, 7)
+
+    path = make_gen4_histograms(str(tmp_path / "gen4"), num_files=1, duration=0.5, height=36, width=64)
+    with h5py.File(os.path.join(path, "test", "synthetic_0000.h5")) as f:
+        assert f["data"].shape == (10, 2, 36, 64)
+    boxes = np.load(os.path.join(path, "test", "synthetic_0000_bbox.npy"))
+    assert len(boxes) == 50
+
+def test_dvs_gesture_events(tmp_path):
+    from neurobench.datasets.DVSGesture_loader import EVENT_DTYPE, stack_preprocessing, collate_events
+
+    path = make_dvs_gesture_tree(tmp_path)
+    ds = DVSGesture(path, data_type="events")
+    events, label = ds[0]
+    assert events.dtype == EVENT_DTYPE
+    assert events["t"][0] == 0
+    assert events["t"][-1] <= 1700000
+
+    # compare with the frame path on all events, boundary events included
+    xypt = torch.stack([torch.from_numpy(events[field].astype(np.int64)) for field in "xypt"], dim=1)
+    reference = torch.from_numpy(stack_preprocessing(xypt, tbins=340)).float()
+
+    frames, labels = collate_events([(events, label)], channels=3)
+    assert frames.shape == (1, 340, 3, 128, 128)
+    assert torch.equal(labels, label.unsqueeze(0))
+
+    # stack_preprocessing also counts an event at t = k * delta_t in frame k - 1,
+    # collate_events only in frame k
+    boundary = events[(events["t"] % 5000 == 0) & (events["t"] > 0)]
+    assert len(boundary) > 0
+    assert not torch.equal(frames[0], reference)
+    shifted = boundary.copy()
+    shifted["t"] -= 1
+    previous, _ = collate_events([(shifted, label)], channels=3)
+    assert torch.equal(torch.maximum(frames[0], previous[0]), reference)
+
+    # away from the boundaries, both are the same
+    events = events[events["t"] % 5000 != 0]
+    xypt = torch.stack([torch.from_numpy(events[field].astype(np.int64)) for field in "xypt"], dim=1)
+    reference = torch.from_numpy(stack_preprocessing(xypt, tbins=340)).float()
+    frames, _ = collate_events([(events, label)], channels=3)
+    assert torch.equal(frames[0], reference)
+
+    packed, _ = collate_events([(events, label)], output="packed")
+    assert torch.equal(packed.unpack()[0], reference[:, :2])
+
+    reduced, _ = collate_events([(events, label)], downsample=4)
+    pooled = torch.nn.functional.avg_pool3d(reference[:, :2], (1, 4, 4))
+    assert torch.allclose(reduced[0], pooled)
+
+    sparse, _ = collate_events([(events, label)] * 2, output="sparse", mode="histogram", downsample=4)
+    assert sparse.is_sparse
+    assert sparse.shape == (2, 340, 2, 32, 32)
+    assert sparse.to_dense().sum() == len(events) / 16 * 2
+
+    loader = torch.utils.data.DataLoader(ds, batch_size=4, collate_fn=ds.collate_fn(downsample=4))
+    frames, labels = next(iter(loader))
+    assert frames.shape == (4, 340, 2, 32, 32)
+    assert frames.dtype == torch.float32
+
+    # random windows are contiguous, start at 0 and span at most the window length
+    ds.set_sample_params(random_window=True)
+    raw = DVSGesture(path, data_type="raw")
+    raw.set_sample_params(random_window=True)
+    np.random.seed(0)
+    events, _ = ds[1]
+    np.random.seed(0)
+    sample, _ = raw[1]
+    assert events["t"][0] == 0 and events["t"][-1] <= 1700000
+    assert np.all(np.diff(events["t"]) >= 0)
+    assert sample.dtype == torch.int64
+    assert np.array_equal(sample.numpy(), np.stack([events[field].astype(np.int64) for field in "xypt"], axis=1))
+
+def make_dvs_gesture_tree(tmp_path):
+    from neurobench.datasets.synthetic import make_dvs_gesture
+
+    return make_dvs_gesture(str(tmp_path / "dvs"), num_recordings=10, events_per_sample=5000, duration=2000)
+
 def test_dvs_gesture():
     path = dataset_path + "dvs_gesture/"
     try:
@@ -58,3 +204,53 @@ def test_mackey_glass():
     assert(torch.eq(testset[0][0], mg[mg.traintime_pts][0]))
     assert(torch.eq(testset[0][1], mg[mg.traintime_pts][1]))
 
+
+def test_gen4_histograms(tmp_path, monkeypatch):
+    from neurobench.datasets import Gen4Histograms
+    from neurobench.datasets.synthetic import make_gen4_histograms
+
+    # files of 20, 10 and 10 time bins
+    path = str(tmp_path / "gen4")
+    make_gen4_histograms(path, num_files=1, duration=1.0, height=36, width=64, boxes_per_frame=2)
+    make_gen4_histograms(os.path.join(path, "short"), num_files=2, duration=0.5, height=36, width=64, boxes_per_frame=2, seed=1)
+    for name in os.listdir(os.path.join(path, "short", "test")):
+        os.rename(os.path.join(path, "short", "test", name), os.path.join(path, "test", "short_" + name))
+
+    ds = Gen4Histograms(path, batch_size=2, num_tbins=4, height=36, width=64, min_box_diag=0)
+    assert ds.num_batches() == 6
+    # 5 + 3 + 3 chunks, without the padding row of the last batch
+    assert len(ds) == 11
+
+    batches = list(ds)
+    frames, targets, info = batches[0]
+    assert frames.shape == (2, 4, 2, 36, 64)
+    assert frames.max() <= 1
+    assert len(targets) == 2 and len(targets[0]) == 4
+    assert targets[0][0].shape[1] == 5
+    assert torch.equal(info["keep_memory"], torch.zeros(2))
+    # the long file fills the first row, the second row reads both short files
+    assert [b[2]["keep_memory"][1].item() for b in batches] == [0, 1, 1, 0, 1, 1]
+    assert [b[2]["valid"][0].item() for b in batches] == [True] * 5 + [False]
+    assert info["labeled"].all()
+
+    loader = ds.create_dataloader(num_workers=2)
+    assert len(loader) == 6
+    for (frames, targets, info), reference in zip(loader, batches):
+        assert torch.equal(frames, reference[0])
+        assert all(torch.equal(a, b) for row, ref in zip(targets, reference[1]) for a, b in zip(row, ref))
+        assert torch.equal(info["keep_memory"], reference[2]["keep_memory"])
+
+    from neurobench.benchmarks import Benchmark
+    seen = []
+    results = Benchmark(seen.append, ds.create_dataloader(), [], [], [[], []]).run()
+    assert results == {} and len(seen) == 6
+
+    # padding rows are run through the model but not scored
+    from neurobench.benchmarks import registry
+    def test_valid_fraction(model, preds, data):
+        assert len(preds) == len(data[1]) == len(data[0])
+        return data[2]["valid"].float().mean()
+    monkeypatch.setitem(registry._metrics, "test_valid_fraction", test_valid_fraction)
+    model = lambda frames: list(range(len(frames)))
+    results = Benchmark(model, ds.create_dataloader(), [], [], [[], ["test_valid_fraction"]]).run()
+    assert results["test_valid_fraction"] == pytest.approx(1.0)
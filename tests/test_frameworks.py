@@ -39,4 +39,179 @@ def test_snntorch_framework():
     data = torch.rand((256, 1000, 10, 5))
     with pytest.raises(RuntimeError, match='mat1 and mat2 shapes cannot be multiplied'):
         spikes = model(data)
-    
\ No newline at end of file
+    
+def test_snntorch_early_exit():
+    from neurobench.accumulators import EarlyExit
+    from neurobench.benchmarks.metrics import average_timesteps
+
+    torch.manual_seed(0)
+    spike_grad = surrogate.fast_sigmoid()
+    net = nn.Sequential(
+        nn.Flatten(),
+        nn.Linear(20, 64),
+        snn.Leaky(beta=0.9, spike_grad=spike_grad, init_hidden=True),
+        nn.Linear(64, 5),
+        snn.Leaky(beta=0.9, spike_grad=spike_grad, init_hidden=True, output=True),
+    )
+    data = torch.rand((32, 50, 20)) * 2
+    with torch.no_grad():
+        reference = SNNTorchModel(net)(data)
+
+        # finished samples are removed from the batch without changing the others
+        model = SNNTorchModel(net, early_exit=EarlyExit(margin=1))
+        spikes = model(data)
+        assert model.timesteps.min() < 50
+        for sample, steps in enumerate(model.timesteps.tolist()):
+            assert torch.equal(spikes[sample, :steps], reference[sample, :steps])
+            assert spikes[sample, steps:].sum() == 0
+            counts = spikes[sample].sum(0).topk(2).values
+            assert steps == 50 or counts[0] - counts[1] >= 1
+        assert average_timesteps(model, None, (data,)).item() == model.timesteps.float().mean().item()
+        with pytest.raises(ValueError):
+            average_timesteps(lambda x: x, None, (data,))
+
+        # only the hidden states are reduced to the active samples, not other tensors of the batch size
+        scale = torch.ones(32)
+        net[4].scale = scale
+        model(data)
+        assert net[4].scale is scale
+
+        # batch mode stops once every sample is confident
+        model = SNNTorchModel(net, early_exit=EarlyExit(margin=1, per_sample=False))
+        spikes = model(data)
+        assert torch.equal(spikes, reference[:, :spikes.shape[1]])
+        assert (model.timesteps == spikes.shape[1]).all()
+
+        model = SNNTorchModel(net, early_exit=EarlyExit(margin=float("inf")))
+        assert torch.equal(model(data), reference)
+
+
+def test_fused_snn():
+    from neurobench.models import FusedSNNModel
+
+    torch.manual_seed(0)
+    for reset_mechanism in ["subtract", "zero", "none"]:
+        net = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(20, 64),
+            snn.Leaky(beta=0.9, init_hidden=True, reset_mechanism=reset_mechanism),
+            nn.Sequential(
+                nn.Linear(64, 32),
+                snn.Synaptic(alpha=0.8, beta=0.9, init_hidden=True, reset_mechanism=reset_mechanism),
+            ),
+            nn.Linear(32, 5),
+            snn.Leaky(beta=torch.rand(5), init_hidden=True, output=True, reset_mechanism=reset_mechanism),
+        )
+        data = torch.rand((8, 100, 20)) * 10
+        with torch.no_grad():
+            reference = SNNTorchModel(net)(data)
+        spikes = FusedSNNModel(net)(data)
+        assert spikes.shape == (8, 100, 5)
+        assert torch.equal(spikes, reference)
+
+    net = nn.Sequential(
+        nn.Conv2d(2, 4, 3),
+        snn.Leaky(beta=0.9, init_hidden=True),
+        nn.Flatten(),
+        nn.Linear(4 * 6 * 6, 5),
+        snn.Leaky(beta=0.9, init_hidden=True, output=True),
+    )
+    data = (torch.rand((4, 30, 2, 8, 8)) > 0.3).float() * 3
+    with torch.no_grad():
+        reference = SNNTorchModel(net)(data)
+    assert torch.equal(FusedSNNModel(net)(data), reference)
+
+    with pytest.raises(TypeError):
+        FusedSNNModel(nn.Linear(2, 2))
+    with pytest.raises(ValueError):
+        FusedSNNModel(nn.Sequential(nn.Linear(2, 2), snn.Leaky(beta=0.9)))
+
+
+def test_snntorch_event_driven():
+    torch.manual_seed(0)
+    net = nn.Sequential(
+        nn.Flatten(),
+        nn.Linear(100, 64),
+        snn.Leaky(beta=0.9, init_hidden=True),
+        nn.Linear(64, 5),
+        snn.Leaky(beta=0.9, init_hidden=True, output=True),
+    )
+    data = (torch.rand((1, 50, 100)) < 0.05).float() * 4
+    with torch.no_grad():
+        reference = SNNTorchModel(net)(data)
+
+        model = SNNTorchModel(net, event_driven=0.2)
+        spikes = model(data)
+    assert reference.sum() > 0
+    assert torch.equal(spikes, reference)
+    assert set(model.layer_density) == {"1", "3"}
+    assert model.layer_density["1"]["density"] < 0.2
+    assert model.layer_density["1"]["event_driven"] == 1.0
+
+    # dense inputs use the dense layer
+    with torch.no_grad():
+        model = SNNTorchModel(net, event_driven=0.)
+        spikes = model(data)
+    assert torch.equal(spikes, reference)
+    assert model.layer_density["1"]["event_driven"] == 0.0
+    assert "forward" not in vars(net[1])
+
+    # convolutions run dense and report the mean fraction of non-zero inputs, as a float
+    net = nn.Sequential(
+        nn.Conv1d(1, 2, 3, padding=1),
+        nn.Flatten(),
+        snn.Leaky(beta=0.9, init_hidden=True, output=True),
+    )
+    data = (torch.rand((2, 10, 1, 20)) < 0.3).float()
+    with torch.no_grad():
+        model = SNNTorchModel(net, event_driven=0.2)
+        model(data)
+    density = model.layer_density["0"]["density"]
+    assert type(density) is float
+    assert density == pytest.approx(((data != 0).float().mean((0, 2, 3))).mean().item())
+    assert model.layer_density["0"]["event_driven"] == 0.0
+
+
+def test_layer_profiler(tmp_path):
+    from torch.utils.data import DataLoader, TensorDataset
+    from neurobench.benchmarks import Benchmark
+    from neurobench.accumulators import choose_max_count
+
+    torch.manual_seed(0)
+    net = nn.Sequential(
+        nn.Conv1d(2, 4, 3, padding=1),
+        nn.Flatten(),
+        nn.Linear(32, 16),
+        snn.Leaky(beta=0.9, init_hidden=True),
+        nn.Linear(16, 5),
+        snn.Leaky(beta=0.9, init_hidden=True, output=True),
+    )
+    model = SNNTorchModel(net)
+    loader = DataLoader(TensorDataset(torch.rand((12, 10, 2, 8)), torch.randint(0, 5, (12,))), batch_size=4)
+    benchmark = Benchmark(model, loader, [], [choose_max_count], [["model_size"], ["classification_accuracy"]])
+
+    with model.profile(pj_per_op=1., pj_per_byte=0.) as profiler:
+        benchmark.run()
+    report = profiler.report()
+
+    # a call per layer, timestep and batch
+    rows = {row["layer"]: row for row in report}
+    assert set(rows) == {"0", "1", "2", "3", "4", "5"}
+    assert all(row["calls"] == 3 * 10 for row in report)
+    # multiply-accumulates of every sample and timestep
+    assert rows["0"]["ops"] == 12 * 10 * 4 * 8 * 2 * 3
+    assert rows["2"]["ops"] == 12 * 10 * 16 * 32
+    assert rows["3"]["ops"] == 12 * 10 * 16
+    assert rows["2"]["bytes_read"] == 12 * 10 * 32 * 4 + 30 * (16 * 32 + 16) * 4
+    assert rows["2"]["bytes_written"] == 12 * 10 * 16 * 4
+    # ranked by the energy proxy, here the op count
+    assert [row["energy"] for row in report] == sorted((row["ops"] for row in report), reverse=True)
+    assert report[0]["layer"] == "2"
+    assert sum(row["time_fraction"] for row in report) == pytest.approx(1)
+
+    # hooks are removed after profiling
+    benchmark.run()
+    assert profiler.report()[0]["calls"] == 30
+
+    profiler.to_csv(str(tmp_path / "layers.csv"), sort_by="time")
+    assert open(tmp_path / "layers.csv").readline().startswith("layer,type,calls,time")
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+
+def test_lazy_package_imports():
+    # importing the packages alone must not pull in heavy or optional dependencies
+    code = (
+        "import sys\n"
+        "import neurobench.benchmarks, neurobench.datasets, neurobench.models\n"
+        "import neurobench.preprocessing, neurobench.accumulators\n"
+        "heavy = ['torch', 'tqdm', 'matplotlib', 'torchaudio', 'tonic', 'jitcdde', 'h5py', 'scipy', 'snntorch']\n"
+        "print(','.join(m for m in heavy if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+def test_dvs_gesture_import_without_figure():
+    code = (
+        "import sys\n"
+        "import neurobench.datasets.DVSGesture_loader\n"
+        "print('matplotlib' in sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+def test_dataset_base_classes():
+    # names of neurobench.datasets.dataset stay available from the package
+    import torch
+    import neurobench.datasets
+    from neurobench.datasets import Dataset, NeuroBenchDataset
+    from neurobench.datasets.dataset import NeuroBenchDataset as Base
+
+    assert Dataset is torch.utils.data.Dataset
+    assert NeuroBenchDataset is Base
+    assert issubclass(NeuroBenchDataset, Dataset)
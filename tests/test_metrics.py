@@ -1,3 +1,5 @@
+import pytest
+
 import torch
 import torch.nn as nn
 import snntorch as snn
@@ -80,4 +82,126 @@ def test_connection_sparsity():
         param.data[param.data.shape[0]//2:] = torch.ones_like(param.data[param.data.shape[0]//2:])
     model = SNNTorchModel(net)
     # Assert the connection sparsity is within 0.001 of 0.5
-    assert abs(connection_sparsity(model) - 0.5) < 0.001
\ No newline at end of file
+    assert abs(connection_sparsity(model) - 0.5) < 0.001
+
+
+def test_mAP():
+    from neurobench.benchmarks.metrics import mAP
+    from neurobench.benchmarks.utils.metric_utils import box_iou
+
+    assert torch.allclose(box_iou(torch.tensor([[0., 0., 2., 2.]]), torch.tensor([[1., 0., 3., 2.], [5., 5., 6., 6.]])),
+                          torch.tensor([[1 / 3, 0.]]))
+
+    targets = torch.tensor([[0., 0., 10., 10., 0], [20., 20., 30., 30., 0]])
+    detections = torch.tensor([[0., 0., 10., 10., 0.9, 0], [40., 40., 50., 50., 0.8, 0], [20., 20., 30., 30., 0.7, 0]])
+
+    metric = mAP()
+    metric(None, [detections], (None, [targets]))
+    # precision 1 up to recall 0.5, then 2/3 up to recall 1
+    assert abs(metric.compute() - (51 + 50 * 2 / 3) / 101) < 1e-9
+
+    # detections of another class and unlabeled frames do not count
+    wrong_class = detections.clone()
+    wrong_class[:, 5] = 1
+    metric = mAP()
+    metric(None, [[detections, wrong_class]], (None, [[targets, targets[:0]]], {"labeled": torch.tensor([[True, False]])}))
+    assert abs(metric.compute() - (51 + 50 * 2 / 3) / 101) < 1e-9
+
+    # merging shards gives the same result as a single pass
+    full, first, second = mAP(), mAP(), mAP()
+    frames = [(detections, targets), (detections[:1], targets[1:]), (wrong_class, targets)]
+    for det, tgt in frames:
+        full.update(det, tgt)
+    first.update(*frames[0])
+    for det, tgt in frames[1:]:
+        second.update(det, tgt)
+    assert first.merge(second).compute() == full.compute()
+
+    # detections of a frame without ground truth boxes are false positives
+    metric = mAP()
+    metric(None, [detections, detections[:1]], (None, [targets, torch.zeros((0, 5))]))
+    # the extra detection ties with the first true positive, so precision is 1/2 at every recall
+    assert abs(metric.compute() - 0.5) < 1e-9
+    assert metric.false_positives.sum() == 2 * len(metric.iou_thresholds)
+
+    # max_detections caps the detections of a frame over all classes, by score
+    mixed = torch.tensor([[0., 0., 10., 10., 0.9, 1], [0., 0., 10., 10., 0.8, 0]])
+    capped, uncapped = mAP(max_detections=1), mAP(max_detections=2)
+    capped.update(mixed, targets[:1])
+    uncapped.update(mixed, targets[:1])
+    assert capped.compute() == 0.0
+    assert abs(uncapped.compute() - 1.0) < 1e-9
+    assert mAP().compute() == 0.0
+
+def test_r2():
+    from neurobench.benchmarks.metrics import r2, r2_variance_weighted, r2_per_dimension
+
+    torch.manual_seed(0)
+    labels = torch.randn((1000, 3)) * torch.tensor([1., 5., 0.1]) + 100
+    preds = labels + torch.randn((1000, 3)) * 0.5
+
+    ss_res = ((labels.double() - preds.double())**2).sum(0)
+    ss_tot = ((labels.double() - labels.double().mean(0))**2).sum(0)
+    expected = 1 - ss_res / ss_tot
+
+    # batched accumulation gives the exact full-set score
+    metrics = [r2(), r2_variance_weighted(), r2_per_dimension()]
+    for batch in range(0, 1000, 64):
+        for metric in metrics:
+            metric(None, preds[batch:batch + 64], (None, labels[batch:batch + 64]))
+    assert abs(metrics[0].compute() - expected.mean().item()) < 1e-9
+    assert abs(metrics[1].compute() - (1 - ss_res.sum() / ss_tot.sum()).item()) < 1e-9
+    assert torch.allclose(torch.tensor(metrics[2].compute(), dtype=torch.float64), expected)
+
+    first, second = r2(), r2()
+    first(None, preds[:300], (None, labels[:300]))
+    second(None, preds[300:], (None, labels[300:]))
+    assert abs(first.merge(second).compute() - expected.mean().item()) < 1e-9
+
+    # single output dimension
+    metric = r2()
+    metric(None, preds[:, 0], (None, labels[:, 0]))
+    assert abs(metric.compute() - expected[0].item()) < 1e-9
+
+def test_confusion_matrix_metrics():
+    from neurobench.benchmarks.metrics import (confusion_matrix, accuracy, per_class_recall, balanced_accuracy,
+                                               macro_f1, top_k_accuracy)
+
+    labels = torch.tensor([0, 0, 0, 0, 1, 1, 2, 2])
+    preds = torch.tensor([0, 0, 0, 1, 1, 2, 2, 2])
+
+    matrix = confusion_matrix()
+    matrix(None, preds[:5], (None, labels[:5]))
+    matrix(None, preds[5:], (None, labels[5:]))
+    assert matrix.compute() == [[3, 1, 0], [0, 1, 1], [0, 0, 2]]
+
+    def evaluate(metric):
+        metric(None, preds, (None, labels))
+        return metric.compute()
+
+    assert evaluate(accuracy()) == 6 / 8
+    assert evaluate(per_class_recall()) == [0.75, 0.5, 1.0]
+    assert abs(evaluate(balanced_accuracy()) - (0.75 + 0.5 + 1.0) / 3) < 1e-12
+    f1 = [2 * 3 / (3 + 4), 2 * 1 / (2 + 2), 2 * 2 / (3 + 2)]
+    assert abs(evaluate(macro_f1()) - sum(f1) / 3) < 1e-12
+
+    # class scores are reduced to their argmax, shards are merged
+    scores = torch.nn.functional.one_hot(preds, 4).float()
+    first, second = accuracy(num_classes=4), accuracy()
+    first(None, scores[:3], (None, labels[:3]))
+    second(None, scores[3:], (None, labels[3:]))
+    assert first.merge(second).compute() == 6 / 8
+    assert first.matrix.shape == (4, 4)
+
+    # classes outside of [0, num_classes) are rejected instead of spilling into the next row
+    with pytest.raises(ValueError):
+        confusion_matrix(num_classes=3)(None, torch.tensor([4]), (None, torch.tensor([0])))
+    with pytest.raises(ValueError):
+        confusion_matrix(num_classes=3)(None, torch.tensor([0]), (None, torch.tensor([3])))
+    with pytest.raises(ValueError):
+        confusion_matrix()(None, torch.tensor([-1]), (None, torch.tensor([0])))
+
+    scores = torch.tensor([[0.5, 0.3, 0.2], [0.1, 0.2, 0.7], [0.6, 0.3, 0.1]])
+    top2 = top_k_accuracy(k=2)
+    top2(None, scores, (None, torch.tensor([1, 0, 0])))
+    assert top2.compute() == 2 / 3
@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perf"))
+
+import perf_suite
+
+
+def test_compare():
+    baseline = {
+        "fast": {"time": 1.0, "peak_memory": 100 * 2**20, "scale": 1.0},
+        "rescaled": {"time": 1.0, "peak_memory": 0, "scale": 0.5},
+    }
+    MB = 2**20
+
+    # within the thresholds
+    results = {"fast": {"time": 1.19, "peak_memory": 119 * MB, "scale": 1.0}}
+    assert perf_suite.compare(results, baseline, 0.2, 0.2) == []
+
+    # time and memory over the thresholds
+    results = {"fast": {"time": 1.21, "peak_memory": 121 * MB, "scale": 1.0}}
+    regressions = perf_suite.compare(results, baseline, 0.2, 0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("fast: time") and regressions[1].startswith("fast: peak_memory")
+
+    # memory growth below 4 MB is noise, even far over the relative threshold
+    baseline["small"] = {"time": 1.0, "peak_memory": 1 * MB, "scale": 1.0}
+    results = {"small": {"time": 1.0, "peak_memory": 4 * MB, "scale": 1.0}}
+    assert perf_suite.compare(results, baseline, 0.2, 0.2) == []
+
+    # cases without a baseline, or with a baseline of another scale, are not compared
+    results = {
+        "new": {"time": 100.0, "peak_memory": 0, "scale": 1.0},
+        "rescaled": {"time": 100.0, "peak_memory": 0, "scale": 1.0},
+    }
+    assert perf_suite.compare(results, baseline, 0.2, 0.2) == []
+
+
+def test_measure_failure():
+    # the child process raises on an unknown case, it is reported instead of hanging
+    result = perf_suite.measure("no_such_case", timeout=60)
+    assert "error" in result
+    assert "exited with code 1" in result["error"]
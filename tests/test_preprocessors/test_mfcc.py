@@ -41,3 +41,40 @@ class TestMFCCProcessor(unittest.TestCase):
         mfcc = MFCCProcessor(**self.init_args)
         audio = (self.sample_audio, 2)
         mfcc(audio)
+
+    def test_mfcc_matches_torchaudio(self):
+        mfcc = MFCCProcessor(**self.init_args)
+        reference = torchaudio.transforms.MFCC(**self.init_args)
+        results, targets = mfcc((self.sample_audio, 2))
+        self.assertEqual(targets, 2)
+        self.assertTrue(torch.allclose(results, reference(self.sample_audio), atol=1e-3))
+
+    def test_mfcc_bucketed_list(self):
+        mfcc = MFCCProcessor(**self.init_args, bucket_width=800)
+        reference = torchaudio.transforms.MFCC(**self.init_args)
+        clip = self.sample_audio[0]
+        clips = [clip, clip[:len(clip) // 2], clip[:len(clip) // 3]]
+        results, _ = mfcc((clips, torch.tensor([0, 1, 2])))
+        self.assertEqual(results.shape[0], 3)
+        self.assertEqual(results.shape[1], 20)
+
+        full = reference(clip.unsqueeze(0))[0]
+        self.assertTrue(torch.allclose(results[0, :, :full.shape[-1]], full, atol=1e-3))
+        # frames past the end of a short clip are zero
+        self.assertTrue(torch.all(results[2, :, -1] == 0))
+        self.assertFalse(hasattr(mfcc, "results"))
+
+    def test_mfcc_follows_data_device(self):
+        mfcc = MFCCProcessor(**self.init_args)
+        audio = torch.zeros((2, 16000), device="meta")
+        results, _ = mfcc((audio, torch.tensor([0, 1])))
+        self.assertEqual(results.device.type, "meta")
+        self.assertEqual(results.shape[:2], (2, 20))
+
+        # the copies of the window and matrices are made once per device
+        spectrogram, mel_fb, dct_mat = mfcc._transforms(torch.device("meta"))
+        self.assertEqual(mel_fb.device.type, "meta")
+        self.assertEqual(spectrogram.window.device.type, "meta")
+        mfcc((audio, torch.tensor([0, 1])))
+        self.assertIs(mfcc._transforms(torch.device("meta"))[1], mel_fb)
+        self.assertEqual(mfcc._mel_fb.device.type, "cpu")
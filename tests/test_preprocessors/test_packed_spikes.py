@@ -0,0 +1,24 @@
+import pytest
+import torch
+
+from neurobench.preprocessing import PackedSpikes
+
+def test_packed_spikes():
+    spikes = (torch.rand((4, 21, 3, 5)) < 0.3).float()
+    packed = PackedSpikes.pack(spikes)
+    assert packed.shape == spikes.shape
+    assert packed.nbytes == 4 * 3 * 3 * 5
+    assert torch.equal(packed.unpack(), spikes)
+    assert torch.equal(packed.timestep(17), spikes[:, 17])
+    assert torch.equal(packed.sum(1), spikes.sum(1).long())
+
+    with pytest.raises(ValueError):
+        PackedSpikes.pack(spikes - 1)
+
+def test_packed_spikes_signed():
+    spikes = torch.randint(-1, 2, (2, 13, 7)).float()
+    packed = PackedSpikes.pack(spikes, signed=True)
+    assert packed.nbytes == 2 * 2 * 2 * 7
+    assert torch.equal(packed.unpack(), spikes)
+    assert torch.equal(packed.timestep(9), spikes[:, 9])
+    assert torch.equal(packed.counts(), spikes.sum(1).long())
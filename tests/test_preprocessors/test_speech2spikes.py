@@ -16,4 +16,22 @@ def test_s2s():
     s2s = S2SProcessor()
     tensors, targets = s2s((sample_audio, torch.Tensor([1]*100)))
     assert tensors.shape == (100, 60, 20)
-    assert targets.shape == (100,)
\ No newline at end of file
+    assert targets.shape == (100,)
+
+    packed, _ = S2SProcessor(packed=True)((sample_audio, torch.Tensor([1]*100)))
+    assert packed.shape == (100, 60, 20)
+    assert torch.equal(packed.unpack(), tensors)
+
+def test_s2s_follows_data_device():
+    s2s = S2SProcessor()
+    audio = torch.zeros((2, 16000, 1), device="meta")
+    tensors, _ = s2s((audio, torch.tensor([0, 1])))
+    assert tensors.device.type == "meta"
+    assert tensors.shape[0] == 2
+
+    # the transform is copied once per device, the original stays on the cpu
+    transform = s2s._transform(torch.device("meta"))
+    assert transform.spectrogram.window.device.type == "meta"
+    s2s((audio, torch.tensor([0, 1])))
+    assert s2s._transform(torch.device("meta")) is transform
+    assert s2s.transform.spectrogram.window.device.type == "cpu"